@@ -0,0 +1,49 @@
+"""
+    Barbell detection throughput against the local fake roboflow server
+    for different in-flight window sizes. The server echoes each frame's
+    id so every run also checks results come back in frame order.
+
+    usage: python bench_barbell.py --frames 300 --latency 0.08 --fail-rate 0.02
+"""
+
+import argparse
+import os
+import sys
+import time
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from barbell_detection import HostedModel, detect_frames
+from fake_roboflow import start_server, id_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.08)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, fail_rate=args.fail_rate, echo=True)
+    host, port = server.server_address
+    #small frames so we measure request handling, not jpeg encoding
+    frames = [id_frame(i) for i in range(args.frames)]
+
+    print(f"{'in_flight':>10}{'seconds':>10}{'fps':>10}{'speedup':>10}")
+    baseline = None
+    for in_flight in args.in_flight:
+        model = HostedModel("test", "barbell", 1, api_url=f"http://{host}:{port}", pool_size=in_flight, backoff=0.05)
+        start = time.perf_counter()
+        results = list(detect_frames(model, frames, in_flight=in_flight))
+        elapsed = time.perf_counter() - start
+        assert len(results) == len(frames)
+        assert [round(x) for x, _, _ in results] == list(range(len(frames))), "results came back out of frame order"
+        baseline = baseline or elapsed
+        print(f"{in_flight:>10}{elapsed:>10.2f}{len(frames) / elapsed:>10.1f}{baseline / elapsed:>10.2f}")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+    Per frame cost of getting a frame ready for the barbell model.
+    Compares the old temp file path (imwrite then read the file back)
+    against encoding in memory at a few quality / size settings.
+    No network calls are made.
+
+    usage: python bench_encode.py [path/to/video.mp4] --frames 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from barbell_detection import encode_frame
+from video_io import read_frames
+
+
+def load_frames(video, count):
+    if video:
+        frames = []
+        for frame in read_frames(video):
+            frames.append(frame)
+            if len(frames) == count:
+                break
+        return frames
+    #synthetic 1080p frames with some texture so jpeg has work to do
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, size=(1080, 1920, 3), dtype=np.uint8)
+    base = cv2.GaussianBlur(base, (9, 9), 0)
+    return [np.roll(base, i * 4, axis=1) for i in range(count)]
+
+def bench_temp_file(frames):
+    fd, path = tempfile.mkstemp(suffix=".jpg")
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        size = 0
+        for frame in frames:
+            cv2.imwrite(path, frame)
+            with open(path, "rb") as f:
+                size += len(f.read())
+        return time.perf_counter() - start, size
+    finally:
+        os.remove(path)
+
+def bench_in_memory(frames, quality, max_side):
+    start = time.perf_counter()
+    size = 0
+    for frame in frames:
+        jpeg, _ = encode_frame(frame, quality=quality, max_side=max_side)
+        size += len(jpeg)
+    return time.perf_counter() - start, size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video", nargs="?")
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.frames)
+    n = len(frames)
+    h, w = frames[0].shape[:2]
+    print(f"{n} frames at {w}x{h}\n")
+
+    baseline, size = bench_temp_file(frames)
+    print(f"{'mode':<28}{'ms/frame':>10}{'KB/frame':>10}{'speedup':>10}")
+    print(f"{'temp file (q95, full)':<28}{baseline / n * 1000:>10.2f}{size / n / 1024:>10.1f}{1.0:>10.2f}")
+
+    for quality, max_side in [(95, 0), (85, 0), (85, 1280), (75, 960), (75, 640)]:
+        elapsed, size = bench_in_memory(frames, quality, max_side)
+        label = f"memory (q{quality}, {max_side or 'full'})"
+        print(f"{label:<28}{elapsed / n * 1000:>10.2f}{size / n / 1024:>10.1f}{baseline / elapsed:>10.2f}")
+
+if __name__ == "__main__":
+    main()
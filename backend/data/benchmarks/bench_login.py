@@ -0,0 +1,138 @@
+"""
+    Login throughput under load. Registers a few users, then keeps
+    --concurrency logins in flight for --seconds while a reader fetches
+    session history in the background, so it shows both how many
+    logins/s the password pool sustains and whether a burst of logins
+    slows down everything else. 429s from the pool being full are
+    counted separately from errors.
+
+    Without --url a server is started on a throwaway sqlite database
+    (it still loads the models, so the usual env vars need to be set).
+    Needs httpx.
+
+    usage: python bench_login.py --concurrency 32 --seconds 20
+           python bench_login.py --url http://127.0.0.1:8000
+           PASSWORD_WORKERS=4 BCRYPT_ROUNDS=10 python bench_login.py
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+
+import httpx
+import numpy as np
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+PASSWORD = "bench-password"
+
+
+def start_server(port, workdir):
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    env.setdefault("JWT_SECRET_KEY", uuid.uuid4().hex)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SRC, env=env, stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        if server.poll() is not None:
+            raise SystemExit("Server exited during startup")
+        try:
+            httpx.get(f"{url}/", timeout=1)
+            return server, url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise SystemExit("Server didn't start")
+
+async def register_users(client, count):
+    users = []
+    for _ in range(count):
+        email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+        r = await client.post("/register", json={"email": email, "password": PASSWORD, "name": "bench"})
+        r.raise_for_status()
+        users.append((email, r.json()))
+    return users
+
+async def login_loop(client, users, deadline, latencies, statuses, worker):
+    i = worker
+    while time.perf_counter() < deadline:
+        email = users[i % len(users)][0]
+        start = time.perf_counter()
+        r = await client.post("/login", json={"email": email, "password": PASSWORD})
+        statuses[r.status_code] += 1
+        if r.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        elif r.status_code == 429:
+            await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+        i += 1
+
+async def read_loop(client, user, deadline, latencies, interval):
+    headers = {"Authorization": f"Bearer {user['access_token']}"}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        r = await client.get(f"/users/{user['user_id']}/sessions?summary=true", headers=headers)
+        if r.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+def describe(name, latencies, seconds):
+    if not latencies:
+        print(f"{name:>14}: no successful requests")
+        return
+    ms = np.array(latencies) * 1000
+    print(f"{name:>14}: {len(ms) / seconds:8.1f}/s  p50 {np.percentile(ms, 50):7.1f}ms  "
+          f"p95 {np.percentile(ms, 95):7.1f}ms  p99 {np.percentile(ms, 99):7.1f}ms")
+
+async def run(url, users_count, concurrency, seconds, read_interval):
+    limits = httpx.Limits(max_connections=concurrency + 4)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        users = await register_users(client, users_count)
+
+        #reads with nothing else going on, to compare against
+        idle_reads = []
+        await read_loop(client, users[0][1], time.perf_counter() + 2, idle_reads, read_interval)
+
+        logins, reads, statuses = [], [], Counter()
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(
+            read_loop(client, users[0][1], deadline, reads, read_interval),
+            *[login_loop(client, users, deadline, logins, statuses, worker) for worker in range(concurrency)],
+        )
+
+    print(f"{concurrency} concurrent logins for {seconds}s, statuses {dict(statuses)}")
+    describe("login", logins, seconds)
+    describe("reads idle", idle_reads, 2)
+    describe("reads loaded", reads, seconds)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="server to test, default starts one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--read-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = None
+    with tempfile.TemporaryDirectory() as workdir:
+        url = args.url
+        if url is None:
+            server, url = start_server(args.port, workdir)
+        try:
+            asyncio.run(run(url, args.users, args.concurrency, args.seconds, args.read_interval))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+    Insert throughput of session_store.save_session (one bulk insert
+    for all reps) against the old one ORM object per rep save, for
+    sessions with more and more reps. Also checks both write the same
+    rep rows. Runs on a throwaway sqlite file unless --database-url
+    points somewhere else (e.g. a scratch Postgres built from db/*.sql).
+
+    usage: python bench_persist.py --reps 10 100 1000 5000
+           python bench_persist.py --database-url postgresql://localhost/squat_bench
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+FRAMES_PER_REP = 75     #2.5s reps at 30fps
+
+
+def make_metrics(reps, rng):
+    """
+    An analyze_squat style metrics dict with the given number of reps
+    """
+    frames = reps * FRAMES_PER_REP
+    bottoms = np.arange(reps) * FRAMES_PER_REP + FRAMES_PER_REP // 2
+    angles = rng.uniform(75, 115, size=reps)
+    bar_devs = rng.uniform(2, 40, size=reps)
+    bar_devs[rng.random(reps) < 0.1] = np.nan
+    return {
+        "total_reps": reps,
+        "reps": [{
+            "rep_count": i + 1,
+            "bottom_frame": int(bottom),
+            "start": int(max(0, bottom - 15)),
+            "end": int(min(frames, bottom + 15)),
+            "depth": "below" if angle < 90 else "parallel" if angle < 100 else "partial",
+            "bottom_angle": float(angle),
+        } for i, (bottom, angle) in enumerate(zip(bottoms, angles))],
+        "tempo_per_rep": np.diff(bottoms) / 30,
+        "hip_heel_alignment": rng.random(frames) < 0.7,
+        "bar_path_dev": bar_devs.tolist(),
+        "ai_feedback": None,
+    }
+
+def orm_save(user_id, video_path, fps, metrics):
+    """
+    The previous save, one RepMetric object added per rep
+    """
+    from database import SessionLocal
+    from models import Session, RepMetric
+    db = SessionLocal()
+    try:
+        avg_depth = np.mean([rep.get('bottom_angle', 0) for rep in metrics['reps']])
+        min_knee_angle = min([rep.get('bottom_angle', 180) for rep in metrics['reps']])
+        avg_tempo = np.mean(metrics['tempo_per_rep']) if len(metrics['tempo_per_rep']) > 0 else None
+        avg_alignment = np.mean(metrics['hip_heel_alignment'])
+        avg_bar_dev = np.nanmean(metrics['bar_path_dev']) if metrics['bar_path_dev'] else None
+        session = Session(
+            user_id=user_id, video_path=video_path, fps=round(fps), total_reps=metrics['total_reps'],
+            avg_depth=float(avg_depth), min_knee_angle=float(min_knee_angle),
+            tempo=float(avg_tempo) if avg_tempo else None, alignment=float(avg_alignment),
+            bar_dev=float(avg_bar_dev) if avg_bar_dev and not np.isnan(avg_bar_dev) else None,
+            ai_feedback=metrics.get('ai_feedback'),
+        )
+        db.add(session)
+        db.flush()
+        for i, rep in enumerate(metrics['reps']):
+            tempo = metrics['tempo_per_rep'][i] if i < len(metrics['tempo_per_rep']) else None
+            bar_dev = metrics['bar_path_dev'][i] if i < len(metrics['bar_path_dev']) else None
+            hip_aligned = bool(np.mean(metrics['hip_heel_alignment'][rep['start']:rep['end']]) > 0.5)
+            db.add(RepMetric(
+                session_id=session.id, rep_number=rep['rep_count'], bottom_frame=int(rep['bottom_frame']),
+                start_frame=int(rep['start']), end_frame=int(rep['end']), knee_angle=float(rep['bottom_angle']),
+                depth_value=None, depth_quality=rep['depth'],
+                bar_path_deviation=float(bar_dev) if bar_dev and not np.isnan(bar_dev) else None,
+                tempo=float(tempo) if tempo and not np.isnan(tempo) else None,
+                hip_heel_aligned=hip_aligned,
+            ))
+        db.commit()
+        return session.id
+    finally:
+        db.close()
+
+def stored_reps(session_id):
+    from database import SessionLocal
+    from models import RepMetric
+    db = SessionLocal()
+    try:
+        return [(r.rep_number, r.start_frame, r.end_frame, r.depth_quality, r.knee_angle, r.bar_path_deviation, r.tempo, r.hip_heel_aligned)
+                for r in db.query(RepMetric).filter(RepMetric.session_id == session_id).order_by(RepMetric.rep_number)]
+    finally:
+        db.close()
+
+def best_of(fn, repeats, *args):
+    best, out = None, None
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            out = fn(*args)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reps", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway sqlite file")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+    from database import init_db
+    from session_store import save_session
+    init_db()
+
+    rng = np.random.default_rng(0)
+    print(f"{'reps':>8}{'orm ms':>10}{'bulk ms':>10}{'speedup':>10}{'bulk reps/s':>14}{'same rows':>11}")
+    for reps in args.reps:
+        metrics = make_metrics(reps, rng)
+        orm_t, orm_id = best_of(orm_save, args.repeats, 1, "bench.mp4", 30, metrics)
+        bulk_t, bulk_id = best_of(save_session, args.repeats, 1, "bench.mp4", 30, metrics)
+        same = stored_reps(orm_id) == stored_reps(bulk_id)
+        print(f"{reps:>8}{orm_t * 1000:>10.1f}{bulk_t * 1000:>10.1f}{orm_t / bulk_t:>10.2f}{reps / bulk_t:>14.0f}{str(same):>11}")
+
+if __name__ == "__main__":
+    main()
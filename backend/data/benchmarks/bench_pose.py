@@ -0,0 +1,52 @@
+"""
+    Compares frames per second of the streaming run_pose path against
+    the batched mode on CPU.
+
+    usage: python bench_pose.py path/to/video.mp4 --batch-sizes 1 4 8 16
+"""
+
+import argparse
+import os
+import sys
+import time
+
+#force cpu before torch gets imported
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from detect_pose import load_model, warm_model, run_pose, DEFAULT_WEIGHTS
+
+
+def time_run(model, video, batch_size, repeats):
+    best = None
+    frames = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        xy, _ = run_pose(video, model=model, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        frames = len(xy)
+        best = elapsed if best is None else min(best, elapsed)
+    return frames, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    model = load_model(args.weights)
+    warm_model(model)
+
+    frames, baseline = time_run(model, args.video, None, args.repeats)
+    print(f"{'mode':<12}{'frames':>8}{'seconds':>10}{'fps':>10}{'speedup':>10}")
+    print(f"{'streaming':<12}{frames:>8}{baseline:>10.2f}{frames / baseline:>10.1f}{1.0:>10.2f}")
+
+    for batch_size in args.batch_sizes:
+        frames, elapsed = time_run(model, args.video, batch_size, args.repeats)
+        label = f"batch={batch_size}"
+        print(f"{label:<12}{frames:>8}{elapsed:>10.2f}{frames / elapsed:>10.1f}{baseline / elapsed:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+    Per joint smooth() loop against the batched smooth_joints() on
+    synthetic keypoints with dropouts, also checks they agree.
+
+    usage: python bench_smooth.py --seconds 10 60 600 --fps 30
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from smooth import smooth, smooth_joints
+
+REQUIRED_KEYPOINTS = [11, 12, 13, 14, 15, 16]   #same joints the pipeline smooths
+
+
+def make_keypoints(frames, rng, dropout=0.1):
+    xy = np.cumsum(rng.normal(size=(frames, 17, 2)), axis=0).astype(np.float32) + 300
+    conf = rng.uniform(0.6, 1.0, size=(frames, 17)).astype(np.float32)
+    conf[rng.random((frames, 17)) < dropout] = 0.1
+    return xy, conf
+
+def per_joint(raw_xy, conf, fps):
+    xy = raw_xy.copy()
+    for joints in REQUIRED_KEYPOINTS:
+        xy[:, joints, :] = smooth(raw_xy[:, joints, :], conf[:, joints] > 0.5, fps)
+    return xy
+
+def batched(raw_xy, conf, fps):
+    xy = raw_xy.copy()
+    xy[:, REQUIRED_KEYPOINTS, :] = smooth_joints(raw_xy[:, REQUIRED_KEYPOINTS, :], conf[:, REQUIRED_KEYPOINTS] > 0.5, fps)
+    return xy
+
+def best_of(fn, repeats, *args):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, nargs="+", default=[10, 60, 600])
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'frames':>8}{'loop ms':>10}{'batch ms':>10}{'speedup':>10}{'max diff':>12}")
+    for seconds in args.seconds:
+        frames = int(seconds * args.fps)
+        raw_xy, conf = make_keypoints(frames, rng)
+        loop_t, loop_out = best_of(per_joint, args.repeats, raw_xy, conf, args.fps)
+        batch_t, batch_out = best_of(batched, args.repeats, raw_xy, conf, args.fps)
+        diff = np.nanmax(np.abs(loop_out - batch_out))
+        print(f"{frames:>8}{loop_t * 1000:>10.2f}{batch_t * 1000:>10.2f}{loop_t / batch_t:>10.2f}{diff:>12.2e}")
+
+if __name__ == "__main__":
+    main()
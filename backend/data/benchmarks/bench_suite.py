@@ -0,0 +1,184 @@
+"""
+    Latency and throughput of the post-model stages on synthetic
+    sessions from 10 seconds up to 30 minutes: smoothing, analyze_squat,
+    convert_numpy and saving the session to the database.
+    Results are written as json and can be compared against a stored
+    baseline, the run fails if any case got slower than the tolerance.
+    Baselines are only meaningful on the machine that recorded them.
+
+    usage: python bench_suite.py --save-baseline
+           python bench_suite.py --compare baseline.json --tolerance 0.25
+           python bench_suite.py --cases smooth analyze --seconds 10 60
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+from synthetic import make_session
+
+DEFAULT_SECONDS = [10, 60, 300, 1800]
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+REQUIRED_KEYPOINTS = [11, 12, 13, 14, 15, 16]   #same joints the pipeline smooths
+
+
+def smooth_case(raw, fps):
+    from smooth import smooth_joints
+    raw_xy = raw["raw_xy"]
+    xy = raw_xy.copy()
+    xy[:, REQUIRED_KEYPOINTS, :] = smooth_joints(raw_xy[:, REQUIRED_KEYPOINTS, :], raw["conf"][:, REQUIRED_KEYPOINTS] > 0.5, fps)
+    barbell_xy = smooth_joints(raw["raw_barbell_xy"][:, None, :], raw["barbell_conf"][:, None] > 0.5, fps)[:, 0, :]
+    return xy, barbell_xy
+
+def prepare(raw, fps):
+    """
+    Inputs for every case, each stage gets the previous stage's real output
+    """
+    from squat_metrics import analyze_squat
+    xy, barbell_xy = smooth_case(raw, fps)
+    with contextlib.redirect_stdout(io.StringIO()):
+        metrics = analyze_squat(xy, raw["conf"], barbell_xy, fps)
+    metrics["ai_feedback"] = "Synthetic session, no feedback"
+    return {"raw": raw, "xy": xy, "barbell_xy": barbell_xy, "metrics": metrics}
+
+def make_cases():
+    from squat_metrics import analyze_squat
+    from pipeline import convert_numpy
+    from session_store import save_session
+
+    return {
+        "smooth": lambda data, fps: smooth_case(data["raw"], fps),
+        "analyze": lambda data, fps: analyze_squat(data["xy"], data["raw"]["conf"], data["barbell_xy"], fps),
+        "convert": lambda data, fps: convert_numpy(data["metrics"]),
+        "persist": lambda data, fps: save_session(1, "synthetic.mp4", fps, data["metrics"]),
+    }
+
+def time_case(fn, data, fps, repeats):
+    times = []
+    for _ in range(repeats):
+        #the pipeline prints as it goes, keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn(data, fps)
+            times.append(time.perf_counter() - start)
+    return np.array(times)
+
+def run(cases, seconds_list, fps, repeats, seed):
+    results = []
+    for seconds in seconds_list:
+        raw, _ = make_session(seconds=seconds, fps=fps, seed=seed)
+        data = prepare(raw, fps)
+        frames = len(raw["raw_xy"])
+        for name, fn in cases.items():
+            #one untimed call so imports and first allocations don't count
+            time_case(fn, data, fps, 1)
+            times = time_case(fn, data, fps, repeats)
+            result = {
+                "case": name,
+                "seconds": seconds,
+                "frames": frames,
+                "reps": data["metrics"]["total_reps"],
+                "best_ms": round(float(times.min()) * 1000, 3),
+                "median_ms": round(float(np.median(times)) * 1000, 3),
+                "p95_ms": round(float(np.percentile(times, 95)) * 1000, 3),
+                "frames_per_s": round(frames / float(np.median(times))),
+            }
+            results.append(result)
+            print(f"{name:>10}{seconds:>8}{frames:>9}{result['median_ms']:>12.2f}{result['p95_ms']:>12.2f}{result['frames_per_s']:>14}")
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the cases whose median got slower than baseline * (1 + tolerance)
+    """
+    previous = {(r["case"], r["seconds"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["case"], result["seconds"]))
+        if old is None:
+            continue
+        ratio = result["median_ms"] / max(old["median_ms"], 1e-6)
+        marker = ""
+        if ratio > 1 + tolerance:
+            regressions.append(result)
+            marker = "  REGRESSION"
+        print(f"{result['case']:>10}{result['seconds']:>8}{old['median_ms']:>12.2f}{result['median_ms']:>12.2f}{ratio:>10.2f}x{marker}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", default=None, help="smooth analyze convert persist, default all")
+    parser.add_argument("--seconds", type=float, nargs="+", default=DEFAULT_SECONDS)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(HERE, "bench_results.json"))
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, default=None)
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, default=None, help="baseline json to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown as a fraction")
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway sqlite file")
+    args = parser.parse_args()
+
+    #never write benchmark sessions into a real database by accident
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp.name, 'bench.db')}"
+    from database import init_db
+    init_db()
+
+    cases = make_cases()
+    if args.cases:
+        unknown = set(args.cases) - set(cases)
+        if unknown:
+            parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+        cases = {name: cases[name] for name in args.cases}
+
+    print(f"{'case':>10}{'seconds':>8}{'frames':>9}{'median ms':>12}{'p95 ms':>12}{'frames/s':>14}")
+    results = run(cases, args.seconds, args.fps, args.repeats, args.seed)
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "machine": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+        },
+        "fps": args.fps,
+        "repeats": args.repeats,
+        "seed": args.seed,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\n{'case':>10}{'seconds':>8}{'base ms':>12}{'now ms':>12}{'ratio':>11}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} case(s) slower than {args.tolerance:.0%} over baseline")
+            return 1
+        print("No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+    Local stand-in for the OpenAI chat completions endpoint.
+    Answers every POST with a completion shaped like the real one after
+    a configurable delay, and can fail a fraction of requests with 500
+    to exercise the error handling.
+
+    usage: python fake_openai.py --port 9002 --latency 2 --fail-rate 0.1
+    then point the app at it with OPENAI_BASE_URL=http://127.0.0.1:9002/v1
+    (OPENAI_API_KEY still needs to be set to something)
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(latency, fail_rate):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(latency)
+
+            if random.random() < fail_rate:
+                self._send(500, {"error": {"message": "fake failure", "type": "server_error"}})
+                return
+            prompt = request.get("messages", [{}])[-1].get("content", "")
+            self._send(200, {
+                "id": f"chatcmpl-fake{random.randrange(1 << 30)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"Fake feedback for a {len(prompt)} character prompt."},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 8, "total_tokens": len(prompt) // 4 + 8},
+            })
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def start_server(port=0, latency=0.5, fail_rate=0.0):
+    """
+    Starts the server on a background thread and returns it,
+    server.server_address has the port when port=0
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, fail_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9002)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.latency, args.fail_rate))
+    print(f"fake openai listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+    Local stand-in for the Roboflow hosted detect endpoint.
+    Answers every POST with prediction json shaped like the real one
+    (predictions with x, y, confidence) after a configurable delay,
+    and can fail a fraction of requests (or just the first few) with
+    503 to exercise retries.
+    With echo on, frames made by id_frame() come back with their frame
+    id as x and y so callers can check results stay in order.
+
+    usage: python fake_roboflow.py --port 9001 --latency 0.08 --fail-rate 0.05
+    then point the app at it with ROBOFLOW_API_URL=http://127.0.0.1:9001
+"""
+
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+ID_STEP = 16    #each channel holds one base 16 digit, wide enough to survive jpeg
+
+
+def id_frame(frame_id, shape=(120, 160, 3)):
+    """
+    Solid colour BGR frame with frame_id (up to 4095) spelled out in its channels
+    """
+    digits = [(frame_id // ID_STEP ** c) % ID_STEP for c in range(3)]
+    return np.full(shape, [d * ID_STEP + ID_STEP // 2 for d in digits], dtype=np.uint8)
+
+def frame_id(image):
+    """
+    Reads back the id written by id_frame()
+    """
+    digits = np.clip(image.reshape(-1, 3).mean(axis=0) // ID_STEP, 0, ID_STEP - 1).astype(int)
+    return int(sum(d * ID_STEP ** c for c, d in enumerate(digits)))
+
+def _decode(body):
+    jpeg = base64.b64decode(body)
+    return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def make_handler(latency, fail_rate, echo=False, fail_first=0):
+    failures = {"left": fail_first}
+    lock = threading.Lock()
+
+    def should_fail():
+        with lock:
+            if failures["left"] > 0:
+                failures["left"] -= 1
+                return True
+        return random.random() < fail_rate
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   #keep-alive so connection pooling is exercised
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            #random latency so requests finish out of order
+            time.sleep(latency * random.uniform(0.5, 1.5))
+
+            if should_fail():
+                self._send(503, {"message": "overloaded"})
+                return
+            if echo:
+                x = y = frame_id(_decode(body))
+            else:
+                x, y = random.uniform(300, 340), random.uniform(200, 400)
+            self._send(200, {
+                "predictions": [{
+                    "x": x,
+                    "y": y,
+                    "width": 40,
+                    "height": 40,
+                    "confidence": random.uniform(0.6, 0.95),
+                    "class": "barbell",
+                }],
+            })
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def start_server(port=0, latency=0.05, fail_rate=0.0, echo=False, fail_first=0):
+    """
+    Starts the server on a background thread and returns it,
+    server.server_address has the port when port=0.
+    The first fail_first requests always get a 503.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, fail_rate, echo, fail_first))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.latency, args.fail_rate))
+    print(f"fake roboflow listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+    Synthetic side-on squat sessions in the same shape the models
+    produce: COCO keypoints (frames, 17, 2) with confidences and a
+    barbell track (frames, 2) with confidences. Rep count, fps, pixel
+    noise and dropout are configurable, and the known bottom frames
+    are returned so results can be checked.
+
+    usage: from synthetic import make_session
+           raw, bottoms = make_session(seconds=60, fps=30, reps=20)
+"""
+
+import numpy as np
+
+REP_SECONDS = 2.5       #one full descent and ascent
+NEAR_SIDE_CONF = 0.9
+FAR_SIDE_CONF = 0.7     #far leg is partly hidden, the pipeline should pick the near side
+
+#standing and bottom positions of the near side joints, camera on the lifter's left
+ANKLE = (400.0, 600.0)
+KNEE_TOP, KNEE_BOTTOM = (410.0, 470.0), (470.0, 480.0)
+HIP_TOP, HIP_BOTTOM = (395.0, 330.0), (300.0, 490.0)
+FAR_SIDE_OFFSET = 12.0  #far side joints sit a little behind in x
+
+
+def squat_phase(frames, fps, reps, rep_seconds=REP_SECONDS):
+    """
+    0 standing to 1 at the bottom for every frame, reps are spread
+    evenly over the session with standing rest in between
+    """
+    t = np.arange(frames) / fps
+    period = frames / fps / reps
+    rep_seconds = min(rep_seconds, period)
+    #each rep sits in the middle of its period
+    into_rep = (t % period) - (period - rep_seconds) / 2
+    inside = (into_rep >= 0) & (into_rep <= rep_seconds)
+    phase = 0.5 - 0.5 * np.cos(2 * np.pi * np.clip(into_rep, 0, rep_seconds) / rep_seconds)
+    bottoms = np.round(((np.arange(reps) * period) + period / 2) * fps).astype(np.int64)
+    return np.where(inside, phase, 0.0), bottoms[bottoms < frames]
+
+def _lerp(top, bottom, phase):
+    top = np.asarray(top, dtype=np.float64)
+    bottom = np.asarray(bottom, dtype=np.float64)
+    return top + (bottom - top) * phase[:, None]
+
+def make_session(seconds=60, fps=30, reps=None, noise=2.0, dropout=0.05, barbell_dropout=0.1,
+                 depth_spread=40.0, seed=0):
+    """
+    Returns (raw, bottom frames) where raw has the same keys the
+    pipeline stores: raw_xy, conf, raw_barbell_xy, barbell_conf.
+    reps defaults to one every 3 seconds, depth_spread is how far the
+    bottom hip height varies between reps in pixels so depth quality
+    comes out mixed.
+    """
+    rng = np.random.default_rng(seed)
+    frames = int(round(seconds * fps))
+    if reps is None:
+        reps = max(1, int(seconds // 3))
+    phase, bottoms = squat_phase(frames, fps, reps)
+
+    #per rep depth, hip bottom height varies so some reps are partial
+    rep_index = np.minimum(np.arange(frames) * reps // frames, reps - 1)
+    hip_depth = rng.uniform(-depth_spread, depth_spread / 2, size=reps)[rep_index]
+
+    ankle = np.broadcast_to(np.asarray(ANKLE), (frames, 2))
+    knee = _lerp(KNEE_TOP, KNEE_BOTTOM, phase)
+    hip = _lerp(HIP_TOP, HIP_BOTTOM, phase)
+    hip[:, 1] -= hip_depth * phase
+    shoulder = hip + [40.0, -170.0] + _lerp((0, 0), (60, 20), phase)
+    head = shoulder + [10.0, -60.0]
+
+    xy = np.zeros((frames, 17, 2), dtype=np.float64)
+    xy[:, 0:5] = head[:, None, :]                           #nose, eyes, ears
+    xy[:, 5:7] = shoulder[:, None, :]
+    xy[:, 7:9] = shoulder[:, None, :] + [60.0, 60.0]        #elbows
+    xy[:, 9:11] = shoulder[:, None, :] + [20.0, 10.0]       #wrists on the bar
+    near = [5, 7, 9, 11, 13, 15]
+    far = [6, 8, 10, 12, 14, 16]
+    for index, joint in [(11, hip), (13, knee), (15, ankle)]:
+        xy[:, index] = joint
+        xy[:, index + 1] = joint - [FAR_SIDE_OFFSET, 0.0]
+    xy += rng.normal(scale=noise, size=xy.shape)
+
+    conf = np.empty((frames, 17), dtype=np.float64)
+    conf[:, :5] = NEAR_SIDE_CONF
+    conf[:, near] = NEAR_SIDE_CONF
+    conf[:, far] = FAR_SIDE_CONF
+    conf += rng.normal(scale=0.05, size=conf.shape)
+    #dropped keypoints come back from the model as (0, 0) with low confidence
+    dropped = rng.random((frames, 17)) < dropout
+    conf[dropped] = rng.uniform(0.0, 0.3, size=dropped.sum())
+    xy[dropped] = 0.0
+
+    barbell = shoulder + [0.0, -15.0] + rng.normal(scale=noise, size=(frames, 2))
+    #slow drift so the bar path deviation isn't all noise
+    barbell[:, 0] += 8.0 * np.sin(2 * np.pi * np.arange(frames) / (fps * REP_SECONDS)) * phase
+    barbell_conf = np.full(frames, 0.85) + rng.normal(scale=0.05, size=frames)
+    lost = rng.random(frames) < barbell_dropout
+    barbell[lost] = np.nan
+    barbell_conf[lost] = 0.0
+
+    raw = {
+        "raw_xy": xy.astype(np.float32),
+        "conf": np.clip(conf, 0, 1).astype(np.float32),
+        "raw_barbell_xy": barbell.astype(np.float32),
+        "barbell_conf": np.clip(barbell_conf, 0, 1).astype(np.float32),
+    }
+    return raw, bottoms
@@ -1,8 +1,6 @@
 """
-    Authentication utilities for password hashing and JWT token management.
-    This file contains all the security-related functions:
-    Password hashing (one-way encryption)
-    Password verification (checking if password matches hash)
+    Authentication utilities for JWT token management, password
+    hashing and verification live in passwords.py.
     JWT token creation (giving users a "digital ID badge")
     JWT token decoding (reading the "ID badge" to see who they are)
 """
@@ -10,7 +8,6 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 import os
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
@@ -26,16 +23,6 @@ ALGORITHM = "HS256"
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 30  # 30 days
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
 #jwt token created with user info also expires
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
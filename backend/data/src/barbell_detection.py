@@ -1,65 +1,159 @@
-import roboflow
+import base64
 import cv2
 import numpy as np
-import tempfile
 import os
-    
-def run_detection(path, api_key, project_name, version, workspace=None):
+import random
+import time
+import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+ROBOFLOW_API_URL = os.getenv("ROBOFLOW_API_URL", "https://detect.roboflow.com")
+JPEG_QUALITY = int(os.getenv("BARBELL_JPEG_QUALITY", "85"))    #quality frames are encoded at before upload
+MAX_SIDE = int(os.getenv("BARBELL_MAX_SIDE", "1280"))          #longest side sent to the model, 0 keeps full size
+MIN_CONFIDENCE = 50     #percent, predictions below this are dropped by roboflow
+REQUEST_TIMEOUT = 30    #seconds
+MAX_IN_FLIGHT = int(os.getenv("BARBELL_MAX_IN_FLIGHT", "8"))   #frames being predicted at once
+MAX_RETRIES = int(os.getenv("BARBELL_MAX_RETRIES", "3"))
+BACKOFF_SECONDS = 0.5   #first retry delay, doubles every attempt
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class TransientError(Exception):
     """
-    Takes care of loading the model and returns the results as
-    a tuple per frame of x,y coordinates and the confidence rating
-    in an np.array
+    Raised for responses worth retrying (rate limits, 5xx)
     """
-    print("loading model")
-    rf = roboflow.Roboflow(api_key= api_key)
-    if workspace:
-        project = rf.workspace(workspace).project(project_name)
-    else:
-        project = rf.workspace().project(project_name)
-    model = project.version(version).model
 
-    cap = cv2.VideoCapture(path)
-    if not cap.isOpened():
-        raise ValueError("Video could not be opened")
-    xy = []
-    conf = []
+class HostedModel:
+    """
+    Roboflow hosted object detection model. Frames are sent as JPEG
+    bytes straight from memory instead of going through a file.
+    Connections are pooled so concurrent frames reuse open sockets.
+    """
+    def __init__(self, api_key, project_name, version, api_url=ROBOFLOW_API_URL,
+                 pool_size=MAX_IN_FLIGHT, max_retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+        self.api_key = api_key
+        self.url = f"{api_url.rstrip('/')}/{project_name}/{version}"
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+    def _post(self, jpeg, confidence):
+        try:
+            response = self.http.post(
+                self.url,
+                params={"api_key": self.api_key, "confidence": confidence},
+                data=base64.b64encode(jpeg),
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                timeout=REQUEST_TIMEOUT,
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise TransientError(str(e)) from e
+        if response.status_code in RETRY_STATUS:
+            raise TransientError(f"Roboflow returned {response.status_code}")
+        response.raise_for_status()
+        return response.json()
+
+    def predict(self, jpeg, confidence=MIN_CONFIDENCE):
+        """
+        Returns the prediction json for one JPEG encoded frame,
+        retrying transient failures with exponential backoff
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._post(jpeg, confidence)
+            except TransientError:
+                if attempt == self.max_retries:
+                    raise
+                #jitter so retries from parallel frames don't line up
+                time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+def load_model(api_key, project_name, version):
+    if not api_key or not project_name or not version:
+        raise ValueError("Roboflow api key, project and version are required")
+    return HostedModel(api_key, project_name, version)
+
+def warm_model(model):
+    """
+    Sends one small blank frame so credentials are checked and the
+    connection is open before the first real request
+    """
+    blank = np.zeros((64, 64, 3), dtype=np.uint8)
+    detect_frame(model, blank)
 
-    #create temp file
-    temp_fd, temp_path = tempfile.mkstemp(suffix='.jpg')
-    try:
-        os.close(temp_fd)  #close file descriptor
+def encode_frame(frame, quality=JPEG_QUALITY, max_side=MAX_SIDE):
+    """
+    Encodes a BGR frame to JPEG bytes in memory, shrinking it so the
+    longest side is at most max_side. Returns the bytes and the scale
+    to map predicted coordinates back to the original frame.
+    """
+    scale = 1.0
+    height, width = frame.shape[:2]
+    if max_side and max(height, width) > max_side:
+        scale = max(height, width) / max_side
+        size = (round(width / scale), round(height / scale))
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
 
-        print("detecting barbell")
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            x, y, c = detect_frame(model, frame, temp_path)
+    ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Frame could not be encoded")
+    return buffer.tobytes(), scale
 
-            xy.append([x,y])
-            conf.append(c)
-        cap.release()
-        print("Done capturing barbell")
-        return np.array(xy, dtype=np.float32), np.array(conf,dtype= np.float32)
-    finally:
-        #cleaning up temp file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+def detect_frames(model, frames, in_flight=MAX_IN_FLIGHT, offsets=False):
+    """
+    Runs detection over already decoded frames yielding
+    (x, y, confidence) per frame in order. Up to in_flight frames
+    are encoded and predicted at once, frames further ahead aren't
+    pulled from the iterator until the oldest one finishes.
+    With offsets each item is (crop, (x_offset, y_offset)) and results
+    are mapped back to full frame pixels.
+    """
+    in_flight = max(int(in_flight), 1)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix="barbell") as pool:
+        try:
+            for frame in frames:
+                if len(pending) == in_flight:
+                    yield pending.popleft().result()
+                if offsets:
+                    crop, offset = frame
+                    pending.append(pool.submit(_detect_crop, model, crop, offset))
+                else:
+                    pending.append(pool.submit(detect_frame, model, frame))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            #stop queued frames if we bail out early
+            for future in pending:
+                future.cancel()
+
+def _detect_crop(model, crop, offset):
+    """
+    detect_frame on a crop, mapped back to full frame pixels
+    """
+    x, y, c = detect_frame(model, crop)
+    return (x + offset[0], y + offset[1], c)
 
-def detect_frame(model, frame, temp_path):
+def detect_frame(model, frame, scale=1.0):
     """
     Analyzes individual frame and returns tuple consisting
-    of that frames x,y coordinates and their confidence rating
+    of that frames x,y coordinates and their confidence rating.
+    frame is either a BGR array or JPEG bytes that were already
+    encoded, in which case scale maps back to original pixels.
     """
-    cv2.imwrite(temp_path, frame)
+    if isinstance(frame, np.ndarray):
+        frame, scale = encode_frame(frame)
 
-    prediction = model.predict(temp_path, confidence=50).json()
+    prediction = model.predict(frame)
 
     if prediction['predictions']:
         best = max(prediction["predictions"], key=lambda x: x["confidence"])
-        x_cords = best["x"]
-        y_cords = best["y"]
+        x_cords = best["x"] * scale
+        y_cords = best["y"] * scale
         con = best["confidence"]
         return (x_cords, y_cords, con)
     else:
-        return (np.nan, np.nan, 0.0)
\ No newline at end of file
+        return (np.nan, np.nan, 0.0)
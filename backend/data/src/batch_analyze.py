@@ -0,0 +1,193 @@
+"""
+    Re-scores a folder of archived lifts offline.
+    Videos are spread over a process pool, each worker loads the pose
+    model once and runs the same frame pipeline as the API (frame rate
+    sampling and lifter cropping) -> smooth -> analyze_squat. One row
+    per video is appended to the output as soon as it finishes so a
+    crashed run can be resumed without redoing finished files.
+
+    usage: python batch_analyze.py videos/ --output results.csv --workers 4
+           python batch_analyze.py videos/ --output results.parquet --with-barbell
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from dotenv import load_dotenv
+
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv'}
+FIELDS = [
+    "file", "size_bytes", "status", "error", "fps", "frames", "total_reps",
+    "below", "parallel", "partial", "min_knee_angle", "avg_bottom_angle",
+    "avg_tempo", "avg_bar_dev", "seconds",
+]
+
+#set in each worker process by _init_worker
+_pose_model = None
+_barbell_model = None
+
+
+def _init_worker(weights, with_barbell):
+    global _pose_model, _barbell_model
+    load_dotenv()
+    from detect_pose import load_model, warm_model
+    _pose_model = load_model(weights)
+    warm_model(_pose_model)
+    if with_barbell:
+        from barbell_detection import load_model as load_barbell_model
+        _barbell_model = load_barbell_model(
+            os.getenv("ROBOFLOW_API_KEY"), os.getenv("ROBOFLOW_PROJECT"), os.getenv("ROBOFLOW_VERSION"))
+
+def _summary_row(path, metrics, frames, fps):
+    reps = metrics["reps"]
+    angles = [float(rep["bottom_angle"]) for rep in reps]
+    depths = [rep["depth"] for rep in reps]
+    bar_devs = np.array(metrics["bar_path_dev"], dtype=np.float64)
+    tempos = metrics["tempo_per_rep"]
+    return {
+        "file": path,
+        "fps": round(float(fps), 3),
+        "frames": frames,
+        "total_reps": metrics["total_reps"],
+        "below": depths.count("below"),
+        "parallel": depths.count("parallel"),
+        "partial": depths.count("partial"),
+        "min_knee_angle": min(angles) if angles else None,
+        "avg_bottom_angle": float(np.mean(angles)) if angles else None,
+        "avg_tempo": float(np.mean(tempos)) if len(tempos) else None,
+        "avg_bar_dev": float(np.nanmean(bar_devs)) if np.isfinite(bar_devs).any() else None,
+    }
+
+def analyze_file(path, fps):
+    """
+    Runs in a worker, returns the output row for one video
+    """
+    from frame_pipeline import run_pipeline
+    from pipeline import compute_metrics
+
+    start = time.perf_counter()
+    row = {"file": path, "size_bytes": os.path.getsize(path)}
+    try:
+        #without --with-barbell _barbell_model is None and only pose runs,
+        #either way frames are sampled and cropped the same as uploads
+        raw_xy, conf, raw_barbell_xy, barbell_conf, fps = run_pipeline(path, _pose_model, _barbell_model, fps=fps)
+
+        raw = {"raw_xy": raw_xy, "conf": conf, "raw_barbell_xy": raw_barbell_xy, "barbell_conf": barbell_conf}
+        metrics = compute_metrics(raw, fps)
+        row.update(_summary_row(path, metrics, len(raw_xy), fps))
+        row["status"] = "ok"
+    except Exception as e:
+        row["status"] = "failed"
+        row["error"] = str(e)
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+
+def find_videos(folder, recursive=False):
+    videos = []
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS:
+                videos.append(os.path.abspath(os.path.join(root, name)))
+        if not recursive:
+            break
+    return sorted(videos)
+
+def finished_files(journal):
+    """
+    Videos already scored ok in a previous run, keyed on path and size
+    so a replaced file gets redone
+    """
+    done = set()
+    if not os.path.exists(journal):
+        return done
+    with open(journal, newline="") as f:
+        for row in csv.DictReader(f):
+            #a half written last line from a crash won't reach the last column
+            if row.get("status") == "ok" and row.get("seconds"):
+                done.add((row["file"], row["size_bytes"]))
+    return done
+
+def open_journal(journal):
+    """
+    Opens the csv for appending, writing the header if it's new and
+    fixing a missing trailing newline left by a crash
+    """
+    exists = os.path.exists(journal) and os.path.getsize(journal) > 0
+    if exists:
+        with open(journal, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+        if needs_newline:
+            with open(journal, "a") as f:
+                f.write("\n")
+    f = open(journal, "a", newline="")
+    writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+    if not exists:
+        writer.writeheader()
+        f.flush()
+    return f, writer
+
+def write_parquet(journal, output):
+    """
+    Rebuilds the parquet file from the csv journal, latest row per video
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        raise SystemExit("Parquet output needs pandas and pyarrow installed")
+    results = pd.read_csv(journal).drop_duplicates(subset="file", keep="last")
+    results.to_parquet(output, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder")
+    parser.add_argument("--output", default="results.csv", help=".csv or .parquet")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--weights", default=None, help="pose weights, defaults to POSE_WEIGHTS or yolov8s-pose.pt")
+    parser.add_argument("--fps", type=int, default=30, help="used when a video doesn't report its frame rate")
+    parser.add_argument("--with-barbell", action="store_true", help="also run hosted barbell detection")
+    parser.add_argument("--recursive", action="store_true")
+    args = parser.parse_args()
+
+    load_dotenv()
+    weights = args.weights or os.getenv("POSE_WEIGHTS", "yolov8s-pose.pt")
+    parquet = args.output.endswith(".parquet")
+    journal = args.output + ".partial.csv" if parquet else args.output
+
+    videos = find_videos(args.folder, args.recursive)
+    done = finished_files(journal)
+    todo = [v for v in videos if (v, str(os.path.getsize(v))) not in done]
+    print(f"{len(videos)} videos, {len(videos) - len(todo)} already done, {len(todo)} to analyze")
+
+    f, writer = open_journal(journal)
+    failed = 0
+    try:
+        #spawn so every worker gets a clean torch instead of a forked one
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(weights, args.with_barbell)) as pool:
+            futures = [pool.submit(analyze_file, video, args.fps) for video in todo]
+            for i, future in enumerate(as_completed(futures), 1):
+                row = future.result()
+                writer.writerow(row)
+                f.flush()
+                os.fsync(f.fileno())
+                failed += row["status"] != "ok"
+                print(f"[{i}/{len(todo)}] {row['status']} {os.path.basename(row['file'])} ({row['seconds']}s)")
+    finally:
+        f.close()
+
+    if parquet:
+        write_parquet(journal, args.output)
+    print(f"Done, {failed} failed, results in {args.output}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,159 @@
-#Extracts keypoints and confidence using yolov8 pose estimation models 
+#Extracts keypoints and confidence using yolov8 pose estimation models
 #returns an array of coordinates their confidences
 from ultralytics import YOLO
 import numpy as np
+import os
+from video_io import read_frames, frame_count
+
+DEFAULT_WEIGHTS = 'yolov8s-pose.pt'
+WARMUP_SIZE = 640       #blank frame size used to warm the model
+POSE_BATCH_SIZE = int(os.getenv("POSE_BATCH_SIZE", "8"))     #frames per model call in batched mode
+NUM_KEYPOINTS = 17      #COCO keypoints
+
+def load_model(weights=DEFAULT_WEIGHTS):
+    return YOLO(weights)
+
+def warm_model(model):
+    """
+    Runs a single blank frame through the model so the first real
+    request doesn't pay for lazy predictor setup
+    """
+    blank = np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8)
+    model(blank, verbose=False)
+
+def extract_keypoints(result):
+    """
+    Pulls the most confident person's keypoints out of a single
+    frame's result, frames with nobody detected come back as nan
+    """
+    #Dealing with frames where keypoints cant be detected.
+    if result.keypoints is None or len(result.keypoints) == 0:
+        return np.full((17,2), np.nan, dtype=np.float32), np.zeros((17,), dtype= np.float32)
+
+    #Normal case
+    person_idx = int(result.boxes.conf.argmax().item())
+    xy = result.keypoints.xy[person_idx].cpu().numpy().astype(np.float32)
+
+    if result.keypoints.conf is not None:
+        con = result.keypoints.conf[person_idx].cpu().numpy().astype(np.float32)
+    else:
+        con = np.zeros((17,), dtype=np.float32)
+    return xy, con
+
+class KeypointBuffer:
+    """
+    Preallocated (frames, 17, 2) / (frames, 17) arrays that results
+    are written straight into. Frames with nobody detected keep the
+    nan / zero fill. Grows if the frame count estimate was too small.
+    """
+    def __init__(self, capacity):
+        capacity = max(int(capacity), 1)
+        self.xy = np.full((capacity, NUM_KEYPOINTS, 2), np.nan, dtype=np.float32)
+        self.con = np.zeros((capacity, NUM_KEYPOINTS), dtype=np.float32)
+        self.count = 0
+
+    def _grow(self):
+        capacity = len(self.xy)
+        xy = np.full((capacity * 2, NUM_KEYPOINTS, 2), np.nan, dtype=np.float32)
+        con = np.zeros((capacity * 2, NUM_KEYPOINTS), dtype=np.float32)
+        xy[:capacity] = self.xy
+        con[:capacity] = self.con
+        self.xy, self.con = xy, con
+
+    def write(self, result, offset=(0, 0)):
+        """
+        Writes the next frame's result. offset is where the crop the
+        model saw starts in the full frame, keypoints are shifted back
+        by it. Returns the person's full frame box or None.
+        """
+        if self.count == len(self.xy):
+            self._grow()
+        i = self.count
+        self.count += 1
+
+        if result.keypoints is None or len(result.keypoints) == 0:
+            return None
+        person_idx = int(result.boxes.conf.argmax().item())
+        #undetected keypoints come back as 0,0 so leave those alone
+        xy = result.keypoints.xy[person_idx].cpu().numpy()
+        found = (xy[:, 0] > 0) | (xy[:, 1] > 0)
+        self.xy[i] = xy
+        self.xy[i, found] += offset
+        if result.keypoints.conf is not None:
+            self.con[i] = result.keypoints.conf[person_idx].cpu().numpy()
+
+        x1, y1, x2, y2 = result.boxes.xyxy[person_idx].cpu().numpy()
+        return (x1 + offset[0], y1 + offset[1], x2 + offset[0], y2 + offset[1])
+
+    def arrays(self):
+        return self.xy[:self.count], self.con[:self.count]
+
+def batched(frames, batch_size):
+    """
+    Groups an iterable of frames into lists of batch_size
+    """
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def pose_into(model, frames, buffer, batch_size=POSE_BATCH_SIZE, tracker=None, roi_imgsz=None, on_frame=None):
+    """
+    Runs the model over decoded frames (BGR arrays) batch_size frames
+    per call, writing keypoints into buffer in frame order.
+    With a tracker, once the lifter is locked on each batch runs on a
+    crop around them (at roi_imgsz if given) and the tracker is fed the
+    boxes found.
+    on_frame(frame) is called for each frame in order once its result
+    has been written and the tracker updated.
+    """
+    for batch in batched(frames, max(int(batch_size), 1)):
+        if tracker is None:
+            for frame, result in zip(batch, model(batch, verbose=False)):
+                buffer.write(result)
+                if on_frame is not None:
+                    on_frame(frame)
+            continue
+
+        #whole batch shares one crop so it can go through the model together
+        shape = batch[0].shape
+        region = tracker.region(shape)
+        crops = [tracker.crop(frame, region=region)[0] for frame in batch]
+        offset = (region[0], region[1]) if region else (0, 0)
+        kwargs = {"imgsz": roi_imgsz} if region and roi_imgsz else {}
+
+        for frame, result in zip(batch, model(crops, verbose=False, **kwargs)):
+            box = buffer.write(result, offset)
+            tracker.update(box, region, shape)
+            if on_frame is not None:
+                on_frame(frame)
+    return buffer
+
+def run_pose(video_path, weights=DEFAULT_WEIGHTS, model=None, batch_size=None):
+    """
+    Returns (xy, con) for every frame. With batch_size set frames are
+    decoded here and sent to the model batch_size at a time, otherwise
+    ultralytics streams the video one frame at a time.
+    """
+    if model is None:
+        model = load_model(weights)
+
+    if batch_size:
+        buffer = KeypointBuffer(frame_count(video_path))
+        pose_into(model, read_frames(video_path), buffer, batch_size)
+        return buffer.arrays()
 
-def run_pose(video_path, weights='yolov8s-pose.pt'):
-    model = YOLO(weights)
     results = model(video_path, stream = True)
 
     xy = []
     con = []
     for frame in results:
-        #Dealing with frames where keypoints cant be detected. 
-        if frame.keypoints is None or len(frame.keypoints) == 0:
-            xy.append(np.full((17,2), np.nan, dtype=np.float32))
-            con.append(np.zeros((17,), dtype= np.float32))
-            continue
-
-        #Normal case
-        person_idx = int(frame.boxes.conf.argmax().item())
-        xy.append(frame.keypoints.xy[person_idx].cpu().numpy().astype(np.float32))
-
-        if frame.keypoints.conf is not None:
-            con.append(frame.keypoints.conf[person_idx].cpu().numpy().astype(np.float32))
-        else:
-            con.append(np.zeros((17,), dtype=np.float32))
+        frame_xy, frame_con = extract_keypoints(frame)
+        xy.append(frame_xy)
+        con.append(frame_con)
 
     return np.stack(xy), np.stack(con)
-
-            
@@ -1,15 +1,38 @@
+"""
+    AI feedback for finished sessions. Feedback is generated in the
+    background after the session is saved so analysis results don't
+    wait on OpenAI, and written into Session.ai_feedback when ready.
+    One shared async client runs on its own event loop thread with a
+    timeout and a cap on concurrent requests.
+    OPENAI_BASE_URL points it at a local stand-in for testing.
+"""
+
+import asyncio
 import os
-from openai import OpenAI, APIError, APIConnectionError, RateLimitError
+import threading
+import time
+from datetime import datetime, timedelta
+from openai import AsyncOpenAI, APIError, APIConnectionError, APITimeoutError, RateLimitError
 from dotenv import load_dotenv
 import numpy as np
 
+from database import SessionLocal
+from models import Session
+from telemetry import STAGE_SECONDS, FEEDBACK_FAILURES, DB_ERRORS
+from feedback_cache import feedback_cache, summary_stats, fingerprint
+
 load_dotenv()
-def generate_feedback(metrics):
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return "AI feedback unavailable: OpenAI API key not configured."
+FEEDBACK_MODEL = os.getenv("FEEDBACK_MODEL", "gpt-4o-mini")
+FEEDBACK_TIMEOUT = float(os.getenv("FEEDBACK_TIMEOUT", "20"))            #seconds per OpenAI request
+FEEDBACK_CONCURRENCY = int(os.getenv("FEEDBACK_CONCURRENCY", "4"))       #requests in flight at once
+FEEDBACK_MAX_RETRIES = int(os.getenv("FEEDBACK_MAX_RETRIES", "1"))
+FEEDBACK_RECOVER_HOURS = float(os.getenv("FEEDBACK_RECOVER_HOURS", "24"))  #sessions this recent get feedback retried on start
+WAIT_POLL_SECONDS = 1.0     #how often waiters recheck the db, another process may have written it
+NOT_CONFIGURED = "AI feedback unavailable: OpenAI API key not configured."
+TIMED_OUT = "Feedback unavailable: OpenAI took too long to respond."
 
-    client = OpenAI(api_key=api_key)
+
+def build_prompt(metrics):
     #overall rep data
     rep_count = metrics["total_reps"]
     reps = metrics["reps"]
@@ -20,23 +43,6 @@ def generate_feedback(metrics):
     avg_bar_dev = np.nanmean(bar_devs)
     avg_tempo = np.mean(tempos)
 
-    rep_metrics = []
-    for i, rep in enumerate(reps):
-        dev = bar_devs[i]
-        tempo = tempos[i] if i < len(tempos) else np.nan
-        
-        bar_dev_str = f"{dev}px" if not np.isnan(dev) else "N/A"
-        tempo_str = f"{tempo}s" if not np.isnan(tempo) else "N/A"
-
-        rep_metrics.append(
-            f"Rep {rep['rep_count']}: "
-            f"Depth={rep['depth']}, "
-            f"Bottom Angle={rep['bottom_angle']} degrees, "
-            f"Bar Path Deviation={bar_dev_str}, "
-            f"Tempo={tempo_str}"
-        )
-    breakdown = "\n".join(rep_metrics)
-    
     #hotencode depth
     depth_encode = {"below" : 0, "parallel" : 0 , "partial" : 0}
     for rep in reps:
@@ -53,19 +59,225 @@ def generate_feedback(metrics):
     Average tempo: {avg_tempo} seconds per rep.
     Make sure the feedback is specific and focus on cues that could help the person squatting.
     """
+    return prompt
+
+async def generate_feedback(client, metrics):
+    """
+    Returns (feedback text, ok). Failures come back as a message the
+    user can see instead of raising, with ok False so they aren't cached.
+    """
+    prompt = build_prompt(metrics)
     try:
-        response = client.chat.completions.create(
-            model = "gpt-4o-mini", messages = [{"role": "user", "content" : prompt}], max_tokens=300, temperature=0.7)
-        return response.choices[0].message.content
+        response = await client.chat.completions.create(
+            model = FEEDBACK_MODEL, messages = [{"role": "user", "content" : prompt}], max_tokens=300, temperature=0.7)
+        return response.choices[0].message.content, True
     except RateLimitError:
-        return "Feedback unavailable: Rate limit exceeded. Please try again later."
+        FEEDBACK_FAILURES.inc(reason="rate_limit")
+        return "Feedback unavailable: Rate limit exceeded. Please try again later.", False
+    except APITimeoutError:
+        FEEDBACK_FAILURES.inc(reason="timeout")
+        return TIMED_OUT, False
     except APIConnectionError:
-        return "Feedback unavailable: Could not connect to OpenAI API."
+        FEEDBACK_FAILURES.inc(reason="connection")
+        return "Feedback unavailable: Could not connect to OpenAI API.", False
     except APIError as e:
-        return f"Feedback unavailable: API error occurred ({e.status_code})."
+        FEEDBACK_FAILURES.inc(reason="api_error")
+        return f"Feedback unavailable: API error occurred ({getattr(e, 'status_code', None)}).", False
+    except Exception as e:
+        FEEDBACK_FAILURES.inc(reason="other")
+        return f"Feedback unavailable: Unexpected error - {str(e)}", False
+
+def _store(session_id, text):
+    db = SessionLocal()
+    try:
+        db.query(Session).filter(Session.id == session_id).update({"ai_feedback": text})
+        db.commit()
     except Exception as e:
-        return f"Feedback unavailable: Unexpected error - {str(e)}"
+        db.rollback()
+        DB_ERRORS.inc(operation="save_feedback")
+        print(f"Could not save feedback for session {session_id}: {e}")
+    finally:
+        db.close()
+
+def get_feedback(session_id):
+    """
+    The session's feedback, None while it's still being generated
+    """
+    db = SessionLocal()
+    try:
+        row = db.query(Session.ai_feedback).filter(Session.id == session_id).first()
+        return row[0] if row else None
+    finally:
+        db.close()
+
+
+class FeedbackService:
+    """
+    Background feedback generation. Jobs hand off a saved session's
+    metrics with submit() and move on, waiters on the api's event
+    loop get woken when the text is stored.
+    """
+    def __init__(self, concurrency=FEEDBACK_CONCURRENCY, timeout=FEEDBACK_TIMEOUT, max_retries=FEEDBACK_MAX_RETRIES):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._semaphore = None
+        self._waiters = {}      #session id -> [(loop, future)]
+        self._inflight = {}     #fingerprint -> future, only touched on the feedback loop
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="feedback", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    async def _setup(self):
+        api_key = os.getenv("OPENAI_API_KEY")
+        if api_key:
+            #base_url comes from OPENAI_BASE_URL when set
+            self._client = AsyncOpenAI(api_key=api_key, timeout=self.timeout, max_retries=self.max_retries)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    def shutdown(self):
+        if self._thread is None:
+            return
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._thread = None
+        self._loop = None
+        self._client = None
+
+    def submit(self, session_id, metrics):
+        """
+        Queues feedback for a saved session, returns a concurrent future
+        for the text. Safe to call from any thread.
+        """
+        if self._loop is None:
+            raise RuntimeError("Feedback service is not running")
+        return asyncio.run_coroutine_threadsafe(self._generate(session_id, metrics), self._loop)
+
+    async def _generate(self, session_id, metrics):
+        if self._client is None:
+            text = NOT_CONFIGURED
+        else:
+            text = await self._feedback_for(metrics)
+
+        await asyncio.get_running_loop().run_in_executor(None, _store, session_id, text)
+        self._notify(session_id, text)
+        return text
+
+    async def _feedback_for(self, metrics):
+        """
+        Cached feedback for sets with the same quantized stats, otherwise
+        asks OpenAI. Sets with the same fingerprint already in flight
+        share that request instead of making their own.
+        """
+        loop = asyncio.get_running_loop()
+        summary = summary_stats(metrics)
+        key = fingerprint(summary, FEEDBACK_MODEL)
+        if key in self._inflight:
+            feedback_cache.count(True)
+            return await asyncio.shield(self._inflight[key])
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            text = await loop.run_in_executor(None, feedback_cache.lookup, key)
+            if text is None:
+                text, ok = await self._request(metrics)
+                if ok:
+                    await loop.run_in_executor(None, feedback_cache.store, key, summary, text)
+            future.set_result(text)
+            return text
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  #retrieved here so an unshared failure isn't logged as unhandled
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _request(self, metrics):
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                #covers retries too, the client's timeout is per attempt
+                return await asyncio.wait_for(
+                    generate_feedback(self._client, metrics),
+                    self.timeout * (self.max_retries + 1),
+                )
+            except asyncio.TimeoutError:
+                FEEDBACK_FAILURES.inc(reason="timeout")
+                return TIMED_OUT, False
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage="feedback")
+
+    def _notify(self, session_id, text):
+        with self._lock:
+            waiters = self._waiters.pop(session_id, [])
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(text))
 
+    async def wait(self, session_id, timeout):
+        """
+        Waits up to timeout seconds for a session's feedback, returns
+        the text or None if it still isn't ready
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            future = loop.create_future()
+            with self._lock:
+                self._waiters.setdefault(session_id, []).append((loop, future))
+            try:
+                text = await loop.run_in_executor(None, get_feedback, session_id)
+                if text is not None:
+                    return text
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return None
+                try:
+                    return await asyncio.wait_for(future, min(remaining, WAIT_POLL_SECONDS))
+                except asyncio.TimeoutError:
+                    continue
+            finally:
+                with self._lock:
+                    waiters = self._waiters.get(session_id, [])
+                    if (loop, future) in waiters:
+                        waiters.remove((loop, future))
+                    if not waiters:
+                        self._waiters.pop(session_id, None)
 
+    def recover(self, load_metrics):
+        """
+        Requeues recent sessions left without feedback when the process
+        last stopped. load_metrics(session) rebuilds the metrics dict or
+        returns None if it can't.
+        """
+        db = SessionLocal()
+        try:
+            pending = db.query(Session)\
+                .filter(Session.ai_feedback.is_(None))\
+                .filter(Session.created_at >= datetime.utcnow() - timedelta(hours=FEEDBACK_RECOVER_HOURS))\
+                .all()
+            queued = 0
+            for session in pending:
+                metrics = load_metrics(session)
+                if metrics is not None:
+                    self.submit(session.id, metrics)
+                    queued += 1
+        finally:
+            db.close()
+        if queued:
+            print(f"Requeued feedback for {queued} sessions")
 
 
+#shared by the whole app
+feedback_service = FeedbackService()
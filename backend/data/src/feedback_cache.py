@@ -0,0 +1,169 @@
+"""
+    Cache of AI feedback keyed on a fingerprint of the summary stats
+    the prompt is built from. Stats are rounded into buckets first so
+    sets that would produce nearly the same prompt share one stored
+    answer instead of each paying for an OpenAI round trip.
+    Entries expire after the ttl and the least recently used ones are
+    dropped once there are more than max entries.
+"""
+
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import CachedFeedback
+from telemetry import Counter
+
+FEEDBACK_CACHE_ENABLED = os.getenv("FEEDBACK_CACHE_ENABLED", "1") == "1"
+FEEDBACK_CACHE_MAX_ENTRIES = int(os.getenv("FEEDBACK_CACHE_MAX_ENTRIES", "5000"))
+FEEDBACK_CACHE_TTL_HOURS = float(os.getenv("FEEDBACK_CACHE_TTL_HOURS", str(7 * 24)))
+#bucket widths, 0 means use the exact value
+BUCKET_REPS = float(os.getenv("FEEDBACK_BUCKET_REPS", "1"))
+BUCKET_DEPTH = float(os.getenv("FEEDBACK_BUCKET_DEPTH", "1"))          #reps per depth quality
+BUCKET_BAR_DEV = float(os.getenv("FEEDBACK_BUCKET_BAR_DEV", "5"))      #pixels
+BUCKET_TEMPO = float(os.getenv("FEEDBACK_BUCKET_TEMPO", "0.25"))       #seconds
+
+FEEDBACK_CACHE_LOOKUPS = Counter("squat_feedback_cache_lookups_total", "Feedback cache lookups", ["result"])
+
+
+def quantize(value, width):
+    """
+    Snaps a value to the bottom of its bucket, nan and None become 'na'
+    """
+    if value is None or not np.isfinite(value):
+        return "na"
+    if width <= 0:
+        return f"{float(value):g}"
+    return f"{np.floor(value / width) * width:g}"
+
+def summary_stats(metrics, buckets=None):
+    """
+    The quantized stats the feedback prompt is built from, as a
+    readable string
+    """
+    buckets = buckets or {}
+    depths = [rep["depth"] for rep in metrics["reps"]]
+    bar_devs = np.asarray(metrics["bar_path_dev"], dtype=np.float64)
+    tempos = np.asarray(metrics["tempo_per_rep"], dtype=np.float64)
+    avg_bar_dev = np.nanmean(bar_devs) if np.isfinite(bar_devs).any() else None
+    avg_tempo = tempos.mean() if len(tempos) else None
+
+    depth_width = buckets.get("depth", BUCKET_DEPTH)
+    parts = [
+        ("reps", quantize(metrics["total_reps"], buckets.get("reps", BUCKET_REPS))),
+        ("below", quantize(depths.count("below"), depth_width)),
+        ("parallel", quantize(depths.count("parallel"), depth_width)),
+        ("partial", quantize(depths.count("partial"), depth_width)),
+        ("bar_dev", quantize(avg_bar_dev, buckets.get("bar_dev", BUCKET_BAR_DEV))),
+        ("tempo", quantize(avg_tempo, buckets.get("tempo", BUCKET_TEMPO))),
+    ]
+    return "|".join(f"{name}={value}" for name, value in parts)
+
+def fingerprint(summary, model):
+    #model is part of the key so switching models doesn't serve old answers
+    return hashlib.sha256(f"{model}|{summary}".encode()).hexdigest()
+
+
+class FeedbackCache:
+    def __init__(self, max_entries=FEEDBACK_CACHE_MAX_ENTRIES, ttl_hours=FEEDBACK_CACHE_TTL_HOURS, enabled=FEEDBACK_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl = timedelta(hours=ttl_hours)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def count(self, hit):
+        """
+        Records a lookup, also used for sets served by a request already in flight
+        """
+        FEEDBACK_CACHE_LOOKUPS.inc(result="hit" if hit else "miss")
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def lookup(self, key):
+        """
+        Stored feedback for a fingerprint or None
+        """
+        if not self.enabled:
+            return None
+        db = SessionLocal()
+        try:
+            entry = db.query(CachedFeedback).filter(
+                CachedFeedback.fingerprint == key,
+                CachedFeedback.created_at >= datetime.utcnow() - self.ttl,
+            ).first()
+            if entry is None:
+                self.count(False)
+                return None
+
+            entry.hits = (entry.hits or 0) + 1
+            entry.last_used_at = datetime.utcnow()
+            db.commit()
+            self.count(True)
+            return entry.feedback
+        finally:
+            db.close()
+
+    def store(self, key, summary, feedback):
+        if not self.enabled:
+            return
+        db = SessionLocal()
+        try:
+            entry = db.query(CachedFeedback).filter(CachedFeedback.fingerprint == key).first()
+            if entry is None:
+                entry = CachedFeedback(fingerprint=key)
+                db.add(entry)
+            entry.summary = summary
+            entry.feedback = feedback
+            entry.created_at = entry.last_used_at = datetime.utcnow()
+            try:
+                db.commit()
+            except IntegrityError:
+                #stored by another process at the same time
+                db.rollback()
+                return
+            self._evict(db)
+        finally:
+            db.close()
+
+    def _evict(self, db):
+        """
+        Drops expired entries then least recently used ones past max_entries
+        """
+        db.query(CachedFeedback)\
+            .filter(CachedFeedback.created_at < datetime.utcnow() - self.ttl)\
+            .delete(synchronize_session=False)
+
+        total = db.query(func.count(CachedFeedback.id)).scalar()
+        if total > self.max_entries:
+            oldest = db.query(CachedFeedback.id)\
+                .order_by(CachedFeedback.last_used_at)\
+                .limit(total - self.max_entries)\
+                .all()
+            db.query(CachedFeedback)\
+                .filter(CachedFeedback.id.in_([entry_id for entry_id, in oldest]))\
+                .delete(synchronize_session=False)
+        db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+#shared by the whole app
+feedback_cache = FeedbackCache()
@@ -0,0 +1,180 @@
+"""
+    Decodes the uploaded video once and fans every frame out to the
+    pose and barbell detectors at the same time.
+    Each detector reads from its own bounded queue so decoding never
+    runs too far ahead and memory stays flat on long videos.
+    With lifter cropping on, frames reach the barbell detector through
+    the pose stage instead, each with the crop worked out from its own
+    pose result, so barbell coordinates don't depend on thread timing.
+"""
+
+import queue
+import threading
+import time
+import numpy as np
+import os
+
+from barbell_detection import detect_frames
+from detect_pose import KeypointBuffer, pose_into, POSE_BATCH_SIZE
+from video_io import read_frames, frame_count, video_fps, sample_step
+from roi import RoiTracker, ROI_ENABLED, ROI_IMGSZ, BARBELL_ROI_PADDING
+from telemetry import STAGE_SECONDS, Stopwatch
+
+FRAME_QUEUE_SIZE = int(os.getenv("FRAME_QUEUE_SIZE", "16"))     #frames buffered per detector
+ANALYSIS_FPS = float(os.getenv("ANALYSIS_FPS", "30"))           #higher frame rate videos are decimated to this, 0 keeps every frame
+POLL_SECONDS = 0.1      #how often blocked threads check if another stage failed
+
+_DONE = object()    #end of video marker
+
+
+def _put(q, item, stop):
+    """
+    Blocking put that gives up once another stage has failed
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _drain(q, stop):
+    """
+    Yields frames off a queue until the end marker or a failure
+    """
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def sampling(path, fps=30, analysis_fps=ANALYSIS_FPS):
+    """
+    (source_fps, step) the video will be analysed with, fps is only
+    used if the container doesn't report a frame rate
+    """
+    source_fps = video_fps(path) or fps
+    return source_fps, sample_step(source_fps, analysis_fps)
+
+def analysed_fps(path, fps=30, analysis_fps=ANALYSIS_FPS):
+    """
+    Frame rate of the frames run_pipeline() will return for this video
+    """
+    source_fps, step = sampling(path, fps, analysis_fps)
+    return source_fps / step
+
+
+def run_pipeline(path, pose_model, barbell_model, fps=30, analysis_fps=ANALYSIS_FPS,
+                 queue_size=FRAME_QUEUE_SIZE, batch_size=POSE_BATCH_SIZE, roi=ROI_ENABLED):
+    """
+    Returns (raw_xy, conf, raw_barbell_xy, barbell_conf, fps) with one
+    row per analysed frame so pose and barbell stay aligned.
+    Videos above analysis_fps are decimated before inference, the frame
+    rate comes from the container and fps is only used if it has none.
+    The returned fps is the rate of the analysed frames.
+    With roi on, once pose has locked onto the lifter both detectors
+    run on a crop around them, results are still full frame pixels.
+    The barbell crop for a frame comes from the tracker right after
+    that frame's pose result, the pose stage hands it on with the frame.
+    Without a barbell_model only pose runs and the barbell track comes
+    back as nan with zero confidence.
+    """
+    source_fps, step = sampling(path, fps, analysis_fps)
+    if step > 1:
+        print(f"Sampling {source_fps:.1f}fps video down to {source_fps / step:.1f}fps")
+
+    pose_q = queue.Queue(maxsize=queue_size)
+    barbell_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    results = {}
+    errors = []
+    keypoints = KeypointBuffer(frame_count(path) / step)
+    tracker = RoiTracker() if roi else None
+    #with cropping the pose stage feeds the barbell queue, otherwise the decoder does
+    pose_feeds_barbell = barbell_model is not None and tracker is not None
+    decoder_feeds_barbell = barbell_model is not None and tracker is None
+
+    def hand_on(frame):
+        """
+        Passes a frame pose has finished with to the barbell queue,
+        cropped by where the tracker puts the lifter after that frame
+        """
+        if not _put(barbell_q, tracker.crop(frame, BARBELL_ROI_PADDING), stop):
+            raise RuntimeError("Barbell detection stopped")
+
+    #each stage's time excludes waiting on the decoder
+    def pose_worker():
+        try:
+            waiting = Stopwatch()
+            start = time.perf_counter()
+            on_frame = hand_on if pose_feeds_barbell else None
+            pose_into(pose_model, waiting.wrap(_drain(pose_q, stop)), keypoints, batch_size, tracker, ROI_IMGSZ, on_frame)
+            results["pose"] = keypoints.arrays()
+            STAGE_SECONDS.observe(time.perf_counter() - start - waiting.total, stage="pose")
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            if pose_feeds_barbell:
+                _put(barbell_q, _DONE, stop)
+
+    def barbell_worker():
+        try:
+            waiting = Stopwatch()
+            start = time.perf_counter()
+            frames = waiting.wrap(_drain(barbell_q, stop))
+            results["barbell"] = list(detect_frames(barbell_model, frames, offsets=tracker is not None))
+            STAGE_SECONDS.observe(time.perf_counter() - start - waiting.total, stage="barbell")
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    workers = [threading.Thread(target=pose_worker, name="pose-worker", daemon=True)]
+    if barbell_model is not None:
+        workers.append(threading.Thread(target=barbell_worker, name="barbell-worker", daemon=True))
+    for worker in workers:
+        worker.start()
+
+    decoding = Stopwatch()
+    try:
+        #without cropping frames are shared between both queues, neither detector modifies them
+        queues = [pose_q, barbell_q] if decoder_feeds_barbell else [pose_q]
+        for frame in decoding.wrap(read_frames(path, step)):
+            if not all(_put(q, frame, stop) for q in queues):
+                break
+        STAGE_SECONDS.observe(decoding.total, stage="decode")
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(pose_q, _DONE, stop)
+        if decoder_feeds_barbell:
+            _put(barbell_q, _DONE, stop)
+        for worker in workers:
+            worker.join()
+
+    if errors:
+        raise errors[0]
+
+    raw_xy, conf = results["pose"]
+    if barbell_model is None:
+        #no bar tracking, bar path metrics come out empty
+        if len(raw_xy) == 0:
+            raise ValueError("Video contains no frames")
+        raw_barbell_xy = np.full((len(raw_xy), 2), np.nan, dtype=np.float32)
+        return raw_xy, conf, raw_barbell_xy, np.zeros(len(raw_xy), dtype=np.float32), source_fps / step
+
+    barbell = results["barbell"]
+    if len(raw_xy) != len(barbell):
+        raise RuntimeError(f"Pose and barbell frame counts differ ({len(raw_xy)} vs {len(barbell)})")
+    if len(barbell) == 0:
+        raise ValueError("Video contains no frames")
+
+    raw_barbell_xy = np.array([[x, y] for x, y, _ in barbell], dtype=np.float32)
+    barbell_conf = np.array([c for _, _, c in barbell], dtype=np.float32)
+    return raw_xy, conf, raw_barbell_xy, barbell_conf, source_fps / step
@@ -0,0 +1,172 @@
+"""
+    Background analysis jobs. Uploads saved by uploads.py are queued,
+    a fixed pool of worker threads runs the pipeline and job state is
+    kept in the database so queued work survives a restart.
+"""
+
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from database import SessionLocal
+from models import AnalysisJob
+from pipeline import analyze_video, convert_numpy, smooth_barbell
+from frame_pipeline import analysed_fps
+from session_store import save_session, SaveError
+from result_cache import result_cache
+from keypoint_store import save_keypoints
+from series_store import save_series
+from feedback import feedback_service
+from telemetry import stage, profiled, DB_ERRORS
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _update(job_id, **fields):
+    db = SessionLocal()
+    try:
+        db.query(AnalysisJob).filter(AnalysisJob.id == job_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+
+def get_job(job_id):
+    db = SessionLocal()
+    try:
+        return db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+    finally:
+        db.close()
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self._pool = None
+
+    def start(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="analysis")
+        self.recover()
+
+    def shutdown(self):
+        if self._pool is not None:
+            #queued jobs stay queued in the db and are picked up on next start
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def submit(self, user_id, video_path, fps, video_hash=None, profile=False):
+        """
+        Records a job and hands it to the workers, returns (job id, status).
+        If this user already analyzed the same video at the same fps the
+        job is finished straight away from the cached result. The fps
+        compared is the one the analysis runs at, fps only counts when
+        the video doesn't report its own frame rate.
+        With profile the worker runs the job under cProfile.
+        """
+        job_id = uuid.uuid4().hex
+        cached = None
+        if video_hash:
+            cached = result_cache.lookup(user_id, video_hash, analysed_fps(video_path, fps))
+        job = AnalysisJob(id=job_id, user_id=user_id, status=QUEUED, video_path=video_path, fps=fps, video_hash=video_hash)
+        if cached is not None:
+            job.status = DONE
+            job.session_id, job.result = cached
+
+        db = SessionLocal()
+        try:
+            db.add(job)
+            db.commit()
+        finally:
+            db.close()
+
+        if cached is not None:
+            print(f"Job {job_id} served from cache")
+            if os.path.exists(video_path):
+                os.remove(video_path)
+            return job_id, DONE
+
+        self._pool.submit(self._run, job_id, profile)
+        return job_id, QUEUED
+
+    def recover(self):
+        """
+        Requeues jobs left queued or running when the process last stopped
+        """
+        db = SessionLocal()
+        try:
+            pending = db.query(AnalysisJob)\
+                .filter(AnalysisJob.status.in_([QUEUED, RUNNING]))\
+                .order_by(AnalysisJob.created_at)\
+                .all()
+            job_ids = []
+            for job in pending:
+                if os.path.exists(job.video_path):
+                    job.status = QUEUED
+                    job_ids.append(job.id)
+                else:
+                    job.status = FAILED
+                    job.error = "Upload was lost before analysis finished"
+            db.commit()
+        finally:
+            db.close()
+
+        for job_id in job_ids:
+            self._pool.submit(self._run, job_id)
+        if job_ids:
+            print(f"Requeued {len(job_ids)} analysis jobs")
+
+    def _run(self, job_id, profile=False):
+        job = get_job(job_id)
+        if job is None or job.status not in (QUEUED, RUNNING):
+            return
+
+        _update(job_id, status=RUNNING)
+        try:
+            with profiled(f"job-{job_id}", profile), stage("total"):
+                metrics, raw = analyze_video(job.video_path, job.fps)
+                save_error = None
+                try:
+                    session_id = save_session(job.user_id, job.video_path, metrics["fps"], metrics)
+                except SaveError as e:
+                    #the analysis still goes back to the user, the job's error says it wasn't saved
+                    print(f"Job {job_id}: {e}")
+                    session_id, save_error = None, str(e)
+            if session_id is not None:
+                try:
+                    #feedback is written to the session when it's ready, the job doesn't wait
+                    feedback_service.submit(session_id, metrics)
+                except Exception as e:
+                    print(f"Could not queue feedback for session {session_id}: {e}")
+                try:
+                    with stage("keypoints"):
+                        save_keypoints(session_id, raw)
+                except Exception as e:
+                    #only needed for re-analysis, don't fail the job over it
+                    DB_ERRORS.inc(operation="save_keypoints")
+                    print(f"Could not store keypoints for session {session_id}: {e}")
+                try:
+                    with stage("series"):
+                        save_series(session_id, metrics, smooth_barbell(raw, metrics["fps"]))
+                except Exception as e:
+                    #charts for this session just won't replay
+                    DB_ERRORS.inc(operation="save_series")
+                    print(f"Could not store series for session {session_id}: {e}")
+            result = json.dumps(convert_numpy(metrics))
+            _update(job_id, status=DONE, session_id=session_id, result=result, error=save_error)
+            if session_id is not None:
+                result_cache.store(job.user_id, job.video_hash, metrics["fps"], session_id, result)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            _update(job_id, status=FAILED, error=f"Error during analysis: {str(e)}")
+        finally:
+            if os.path.exists(job.video_path):
+                os.remove(job.video_path)
+
+
+#shared by the whole app
+job_queue = JobQueue()
@@ -0,0 +1,47 @@
+"""
+    Keeps the raw model outputs for each session on disk so metrics
+    can be recomputed after threshold or smoothing changes without
+    running the models again. Arrays are stored as compressed .npz.
+"""
+
+import os
+import numpy as np
+
+from database import SessionLocal
+from models import SessionKeypoints
+
+KEYPOINT_DIR = os.getenv("KEYPOINT_DIR", "./keypoints")
+ARRAYS = ("raw_xy", "conf", "raw_barbell_xy", "barbell_conf")
+
+
+def save_keypoints(session_id, raw):
+    """
+    Writes the raw arrays for a session and links them from the db
+    """
+    os.makedirs(KEYPOINT_DIR, exist_ok=True)
+    path = os.path.join(KEYPOINT_DIR, f"session_{session_id}.npz")
+    np.savez_compressed(path, **{name: np.asarray(raw[name], dtype=np.float32) for name in ARRAYS})
+
+    db = SessionLocal()
+    try:
+        db.merge(SessionKeypoints(
+            session_id=session_id,
+            path=path,
+            frames=len(raw["raw_xy"]),
+            size_bytes=os.path.getsize(path),
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        os.remove(path)
+        raise
+    finally:
+        db.close()
+    return path
+
+def load_keypoints(path):
+    """
+    Returns the raw arrays dict saved by save_keypoints
+    """
+    with np.load(path) as data:
+        return {name: data[name] for name in ARRAYS}
@@ -1,53 +1,102 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect, Request
+from starlette.requests import ClientDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from typing import List, Optional
-import numpy as np
 import os
+import time
+import base64
+from datetime import datetime
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload, noload
 from fastapi.middleware.cors import CORSMiddleware
-import tempfile
-import shutil
+from brotli_asgi import BrotliMiddleware
+from fastapi.concurrency import run_in_threadpool
+import json
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-def convert_numpy(obj):
-    """Convert numpy types to Python native types for JSON serialization"""
-    if isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, (np.integer,)):
-        return int(obj)
-    elif isinstance(obj, (np.floating,)):
-        return float(obj)
-    elif isinstance(obj, (np.bool_,)):
-        return bool(obj)
-    elif isinstance(obj, dict):
-        return {k: convert_numpy(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy(i) for i in obj]
-    return obj
-from squat_metrics import analyze_squat
-from barbell_detection import run_detection
-from detect_pose import run_pose
-from smooth import smooth
-from feedback import generate_feedback
+#loaded before our modules since they read their settings on import
+load_dotenv()
+from barbell_detection import load_model as load_barbell_model, warm_model as warm_barbell_model
+from detect_pose import load_model as load_pose_model, warm_model as warm_pose_model
+from model_registry import registry
+from jobs import job_queue, get_job
+from uploads import upload_store, UploadError, MAX_UPLOAD_BYTES, PART_SIZE, new_upload_path, save_upload, check_filename, check_decodes
+from result_cache import result_cache
+from feedback_cache import feedback_cache
+from keypoint_store import load_keypoints
+from series_store import SERIES, save_series, load_series, downsample
+from response_format import VIEWS, shape_result, encode, splice_json, wants_msgpack
+from pipeline import compute_metrics, convert_numpy, stored_metrics, smooth_barbell
+from feedback import feedback_service
+from progress import PERIODS, get_progress
+from streaming import StreamingAnalyzer, keypoints_from_frame, parse_keypoints
 from database import SessionLocal, init_db
-from models import Session, RepMetric, User
-from auth import hash_password, verify_password, create_access_token, get_current_user_id
+from models import Session, User, SessionSeries
+from telemetry import REQUEST_SECONDS, render as render_metrics, profiled, request_profile, profile_requested
+from auth import create_access_token, get_current_user_id, verify_token
+from passwords import password_pool, PasswordPoolBusy
 from fastapi import Depends
 
-load_dotenv()
 ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY")
 ROBOFLOW_PROJECT = os.getenv("ROBOFLOW_PROJECT")
 ROBOFLOW_VERSION = os.getenv("ROBOFLOW_VERSION")
-ROBOFLOW_WORKSPACE = os.getenv("ROBOFLOW_WORKSPACE")
+POSE_WEIGHTS = os.getenv("POSE_WEIGHTS", "yolov8s-pose.pt")
+if os.getenv("ROBOFLOW_WORKSPACE"):
+    #the hosted endpoint is addressed by project and version alone
+    print("ROBOFLOW_WORKSPACE is deprecated and ignored, it can be removed from the environment")
+MAX_PAGE_SIZE = 200     #sessions per page of history
+MAX_SERIES_POINTS = 10000   #per series when downsampling replay charts
+MAX_PROGRESS_PERIODS = 366  #days or weeks per progress request
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + 1024 * 1024  #room for the multipart headers around a video
+SIZED_BODY_PATHS = {"/analyze-video"}     #multipart routes, their size has to be known up front
 app = FastAPI(
     title = "Squat Form Analysis",
     version = "0.1.0"
 )
+#brotli for clients that accept it, gzip for the rest, small bodies go as is
+app.add_middleware(BrotliMiddleware, minimum_size=1000, gzip_fallback=True)
+
+#too big is turned away from the headers, before any of the body is read.
+#multipart bodies are spooled whole before their handler runs so those
+#routes need a Content-Length, chunked videos should go through /uploads
+@app.middleware("http")
+async def limit_request_size(request: Request, call_next):
+    length = request.headers.get("content-length")
+    if length is None and request.method == "POST" and request.url.path in SIZED_BODY_PATHS:
+        return JSONResponse(status_code=411, content={"detail": "Content-Length is required, use /uploads to stream a video"})
+    if length and length.isdigit() and int(length) > MAX_REQUEST_BYTES:
+        return JSONResponse(status_code=413, content={"detail": f"Request is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)}MB"})
+    return await call_next(request)
+
+#latency per endpoint, registered after the size check so its 411/413s are
+#counted too. ?profile=1 or an X-Profile: 1 header also runs
+#the request (and its analysis job) under cProfile when PROFILING_ENABLED=1
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    request_profile(request.query_params.get("profile") == "1" or request.headers.get("x-profile") == "1")
+    start = time.perf_counter()
+    status = 500
+    try:
+        with profiled(f"{request.method}-{request.url.path}", profile_requested()):
+            response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        #route template not the raw path so ids don't each get their own series
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, endpoint=endpoint, status=str(status))
+
+#added last so it's the outermost layer and early 411/413s still get cors headers
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://squat-optimizer-frontend.vercel.app"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Upload-Offset"],    #so the dashboard can read them
 )
 
 #initalize dbs on startup
@@ -56,6 +105,49 @@ def startup_db():
     init_db()
     print("Database initialized!")
 
+@app.on_event("startup")
+def startup_uploads():
+    upload_store.remove_expired()
+
+@app.on_event("startup")
+def startup_passwords():
+    password_pool.start()
+
+#load models once so requests only pay for inference
+@app.on_event("startup")
+def startup_models():
+    registry.register("pose", lambda: load_pose_model(POSE_WEIGHTS), warmup=warm_pose_model)
+    registry.register(
+        "barbell",
+        lambda: load_barbell_model(ROBOFLOW_API_KEY, ROBOFLOW_PROJECT, ROBOFLOW_VERSION),
+        warmup=warm_barbell_model,
+        thread_safe=True,   #hosted model, each predict is its own http request
+    )
+    registry.load_all()
+
+#feedback runs before the job workers since they hand sessions to it
+@app.on_event("startup")
+def startup_feedback():
+    feedback_service.start()
+    feedback_service.recover(stored_metrics)
+
+#workers start after the db so unfinished jobs can be requeued
+@app.on_event("startup")
+def startup_jobs():
+    job_queue.start()
+
+@app.on_event("shutdown")
+def shutdown_jobs():
+    job_queue.shutdown()
+
+@app.on_event("shutdown")
+def shutdown_feedback():
+    feedback_service.shutdown()
+
+@app.on_event("shutdown")
+def shutdown_passwords():
+    password_pool.shutdown()
+
 #response models
 class RepMetricResponse(BaseModel):
     """
@@ -84,7 +176,7 @@ class SessionResponse(BaseModel):
     id: int
     user_id: Optional[int]
     video_path: str
-    fps: int
+    fps: float
     total_reps: int
     avg_depth: Optional[float]
     min_knee_angle: Optional[float]
@@ -122,126 +214,268 @@ class AuthResponse(BaseModel):
     email: str
     name: str
 
+class ProgressPeriod(BaseModel):
+    """
+    One day or week of a user's sessions, averages are None when
+    nothing in the period had a value for them
+    """
+    period_start: str
+    sessions: int
+    reps: int
+    below: int
+    parallel: int
+    partial: int
+    avg_min_knee_angle: Optional[float] = None
+    avg_tempo: Optional[float] = None
+    avg_bar_dev: Optional[float] = None
+
+class ProgressResponse(BaseModel):
+    user_id: int
+    period: str     # 'day' or 'week'
+    periods: List[ProgressPeriod]
+
+class FeedbackResponse(BaseModel):
+    session_id: int
+    status: str     # 'pending' or 'ready'
+    ai_feedback: Optional[str] = None
+
+class UploadRequest(BaseModel):
+    filename: str
+    size: int   # total bytes of the video
+
+class UploadResponse(BaseModel):
+    """
+    State of a resumable upload, offset is where the next part goes
+    """
+    upload_id: str
+    offset: int
+    size: int
+    part_size: int  # suggested bytes per PUT
+    job_id: Optional[str] = None
+    status: str     # 'receiving' until completed, then the job's status
+
+class JobResponse(BaseModel):
+    """
+    Status of an analysis job, result holds the analysis once done
+    """
+    job_id: str
+    status: str
+    session_id: Optional[int] = None
+    error: Optional[str] = None
+    result: Optional[dict] = None
+    created_at: str
+    updated_at: str
+
 #endpoints!!!
 @app.get("/")
 def root():
     return {"message": "API is running"}
 
-@app.post("/register", response_model=AuthResponse)
-def register(request: RegisterRequest):
-    #register new account
+@app.get("/health")
+def health():
+    #503 until every model is loaded so load balancers hold traffic
+    status = registry.status()
+    status["result_cache"] = result_cache.stats()
+    status["feedback_cache"] = feedback_cache.stats()
+    status["password_pool"] = password_pool.stats()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/metrics")
+def get_metrics():
+    #prometheus text format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+async def password_work(call):
+    #bcrypt runs in the password pool, 429 when too many are already waiting on it
+    try:
+        return await call
+    except PasswordPoolBusy:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many sign in attempts right now, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+def find_user(email):
     db = SessionLocal()
     try:
-        # checks to see if email is already used
-        existing_user = db.query(User).filter(User.email == request.email).first()
-        if existing_user:
-            raise HTTPException(
-                status_code=400,
-                detail="Email already registered"
-            )
-        hashed_password = hash_password(request.password)
+        return db.query(User).filter(User.email == email).first()
+    finally:
+        db.close()
 
+def add_user(email, hashed_password, name):
+    db = SessionLocal()
+    try:
         new_user = User(
-            email=request.email,
+            email=email,
             password=hashed_password,
-            name=request.name
+            name=name
         )
         db.add(new_user)
         db.commit()
         db.refresh(new_user)
-
-        # creates JWT token
-        access_token = create_access_token(data={"sub": str(new_user.id)})
-
-        return AuthResponse(
-            access_token=access_token,
-            user_id=new_user.id,
-            email=new_user.email,
-            name=new_user.name
-        )
+        return new_user
+    except IntegrityError:
+        #registered by another request while this one was hashing
+        db.rollback()
+        return None
     finally:
         db.close()
 
-@app.post("/login", response_model=AuthResponse)
-def login(request: LoginRequest):
-    #handles logging in needs email and password
+def update_password(user_id, hashed_password):
     db = SessionLocal()
     try:
-        #identifies user using email
-        user = db.query(User).filter(User.email == request.email).first()
+        db.query(User).filter(User.id == user_id).update({User.password: hashed_password})
+        db.commit()
+    finally:
+        db.close()
 
-        if not user:
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid email or password"
-            )
+#async so the db lookups go to the threadpool and the hashing to the
+#password pool, neither holds a threadpool thread while bcrypt runs
+@app.post("/register", response_model=AuthResponse)
+async def register(request: RegisterRequest):
+    #register new account
+    # checks to see if email is already used
+    existing_user = await run_in_threadpool(find_user, request.email)
+    if existing_user:
+        raise HTTPException(
+            status_code=400,
+            detail="Email already registered"
+        )
+    hashed_password = await password_work(password_pool.hash(request.password))
 
-        # checks passowrd
-        if not verify_password(request.password, user.password):
-            raise HTTPException(
-                status_code=401,
-                detail="Invalid email or password"
-            )
+    new_user = await run_in_threadpool(add_user, request.email, hashed_password, request.name)
+    if new_user is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Email already registered"
+        )
 
-        # create JWT token
-        access_token = create_access_token(data={"sub": str(user.id)})
+    # creates JWT token
+    access_token = create_access_token(data={"sub": str(new_user.id)})
 
-        return AuthResponse(
-            access_token=access_token,
-            user_id=user.id,
-            email=user.email,
-            name=user.name
+    return AuthResponse(
+        access_token=access_token,
+        user_id=new_user.id,
+        email=new_user.email,
+        name=new_user.name
+    )
+
+@app.post("/login", response_model=AuthResponse)
+async def login(request: LoginRequest):
+    #handles logging in needs email and password
+    #identifies user using email
+    user = await run_in_threadpool(find_user, request.email)
+
+    if not user:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid email or password"
         )
-    finally:
-        db.close()
+
+    # checks passowrd
+    matches, new_hash = await password_work(password_pool.verify(request.password, user.password))
+    if not matches:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid email or password"
+        )
+    if new_hash:
+        #stored hash was made with different BCRYPT_ROUNDS, swap in the new one
+        await run_in_threadpool(update_password, user.id, new_hash)
+
+    # create JWT token
+    access_token = create_access_token(data={"sub": str(user.id)})
+
+    return AuthResponse(
+        access_token=access_token,
+        user_id=user.id,
+        email=user.email,
+        name=user.name
+    )
+
+def encode_cursor(session):
+    raw = f"{session.created_at.isoformat()}|{session.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, session_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(session_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def check_view(view, points):
+    if view not in VIEWS:
+        raise HTTPException(status_code=400, detail=f"view must be one of: {', '.join(VIEWS)}")
+    if points is not None and (points < 2 or points > MAX_SERIES_POINTS):
+        raise HTTPException(status_code=400, detail=f"points must be between 2 and {MAX_SERIES_POINTS}")
+
+def session_response(session, include_reps=True):
+    return SessionResponse(
+        id=session.id,
+        user_id=session.user_id,
+        video_path=session.video_path,
+        fps=session.fps,
+        total_reps=session.total_reps,
+        avg_depth=session.avg_depth,
+        min_knee_angle=session.min_knee_angle,
+        tempo=session.tempo,
+        alignment=session.alignment,
+        bar_dev=session.bar_dev,
+        ai_feedback=session.ai_feedback,
+        created_at=str(session.created_at),
+        reps=[RepMetricResponse(
+            id=rep.id,
+            rep_number=rep.rep_number,
+            bottom_frame=rep.bottom_frame,
+            start_frame=rep.start_frame,
+            end_frame=rep.end_frame,
+            knee_angle=rep.knee_angle,
+            depth_quality=rep.depth_quality,
+            bar_path_deviation=rep.bar_path_deviation,
+            tempo=rep.tempo,
+            hip_heel_aligned=rep.hip_heel_aligned
+        ) for rep in session.reps] if include_reps else []
+    )
 
 @app.get("/users/{user_id}/sessions", response_model=List[SessionResponse])
-def get_user_sessions(user_id: int, limit: int = 50, offset: int = 0, current_user_id: int = Depends(get_current_user_id)):
+def get_user_sessions(response: Response, user_id: int, limit: int = 50, offset: int = 0, cursor: Optional[str] = None,
+                      summary: bool = False, current_user_id: int = Depends(get_current_user_id)):
     #ensures only the user can check their own sessions
     if user_id != current_user_id:
         raise HTTPException(status_code=403, detail="Access denied")
-    # use user_id to get all workouts can be limited as well
-    # returns sessionResponse and sorted by newest
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    # returns sessionResponse sorted by newest, pass the X-Next-Cursor header
+    # back as cursor for the next page. offset still works but gets slower
+    # the deeper it goes. summary skips the reps (sent back as [])
     db = SessionLocal()
     try:
-        sessions = db.query(Session)\
+        query = db.query(Session)\
             .filter(Session.user_id == user_id)\
-            .order_by(Session.created_at.desc())\
-            .offset(offset)\
-            .limit(limit)\
-            .all()
-
-        #convert from db to api format
-        result = []
-        for session in sessions:
-            result.append(SessionResponse(
-                id=session.id,
-                user_id=session.user_id,
-                video_path=session.video_path,
-                fps=session.fps,
-                total_reps=session.total_reps,
-                avg_depth=session.avg_depth,
-                min_knee_angle=session.min_knee_angle,
-                tempo=session.tempo,
-                alignment=session.alignment,
-                bar_dev=session.bar_dev,
-                ai_feedback=session.ai_feedback,
-                created_at=str(session.created_at),
-                reps=[RepMetricResponse(
-                    id=rep.id,
-                    rep_number=rep.rep_number,
-                    bottom_frame=rep.bottom_frame,
-                    start_frame=rep.start_frame,
-                    end_frame=rep.end_frame,
-                    knee_angle=rep.knee_angle,
-                    depth_quality=rep.depth_quality,
-                    bar_path_deviation=rep.bar_path_deviation,
-                    tempo=rep.tempo,
-                    hip_heel_aligned=rep.hip_heel_aligned
-                ) for rep in session.reps]
+            .order_by(Session.created_at.desc(), Session.id.desc())
+        if cursor:
+            created_at, session_id = decode_cursor(cursor)
+            query = query.filter(or_(
+                Session.created_at < created_at,
+                and_(Session.created_at == created_at, Session.id < session_id),
             ))
+        elif offset:
+            query = query.offset(offset)
 
-        return result
+        #reps for the whole page come back in one extra query instead of one per session
+        query = query.options(noload(Session.reps) if summary else selectinload(Session.reps))
+        #one extra row tells us if there's another page
+        sessions = query.limit(limit + 1).all()
+
+        if len(sessions) > limit:
+            sessions = sessions[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(sessions[-1])
+
+        #convert from db to api format
+        return [session_response(session, include_reps=not summary) for session in sessions]
     finally:
         db.close()
 
@@ -265,35 +499,153 @@ def get_session(session_id: int, current_user_id: int = Depends(get_current_user
             raise HTTPException(status_code=403, detail="Access denied")
 
         # Convert to response format
-        return SessionResponse(
-            id=session.id,
-            user_id=session.user_id,
-            video_path=session.video_path,
-            fps=session.fps,
-            total_reps=session.total_reps,
-            avg_depth=session.avg_depth,
-            min_knee_angle=session.min_knee_angle,
-            tempo=session.tempo,
-            alignment=session.alignment,
-            bar_dev=session.bar_dev,
-            ai_feedback=session.ai_feedback,
-            created_at=str(session.created_at),
-            reps=[RepMetricResponse(
-                id=rep.id,
-                rep_number=rep.rep_number,
-                bottom_frame=rep.bottom_frame,
-                start_frame=rep.start_frame,
-                end_frame=rep.end_frame,
-                knee_angle=rep.knee_angle,
-                depth_quality=rep.depth_quality,
-                bar_path_deviation=rep.bar_path_deviation,
-                tempo=rep.tempo,
-                hip_heel_aligned=rep.hip_heel_aligned
-            ) for rep in session.reps]
-        )
+        return session_response(session)
     finally:
         db.close()
 
+#rerun smoothing and metrics from the stored keypoints
+@app.post("/sessions/{session_id}/reanalyze")
+def reanalyze_session(request: Request, session_id: int, view: str = "full", points: Optional[int] = None,
+                      current_user_id: int = Depends(get_current_user_id)):
+    check_view(view, points)
+    db = SessionLocal()
+    try:
+        session = db.query(Session).filter(Session.id == session_id).first()
+
+        if not session:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Session with ID {session_id} not found"
+            )
+
+        if session.user_id != current_user_id:
+            raise HTTPException(status_code=403, detail="Access denied")
+
+        if not session.keypoints or not os.path.exists(session.keypoints.path):
+            raise HTTPException(
+                status_code=404,
+                detail=f"No stored keypoints for session {session_id}"
+            )
+        path, fps = session.keypoints.path, session.fps
+    finally:
+        db.close()
+
+    raw = load_keypoints(path)
+    metrics = compute_metrics(raw, fps)
+    try:
+        #also fills in series for sessions saved before they were stored
+        save_series(session_id, metrics, smooth_barbell(raw, fps))
+    except Exception as e:
+        print(f"Could not store series for session {session_id}: {e}")
+    metrics["session_id"] = session_id
+    return encode(shape_result(metrics, view, points), request.headers.get("accept"))
+
+#per frame series of a saved session for replaying its charts. start/end
+#slice a frame range, points downsamples each series to at most that many
+#(min and max per bucket so rep bottoms aren't smoothed away)
+@app.get("/sessions/{session_id}/series")
+def get_session_series(session_id: int, start: int = 0, end: Optional[int] = None, points: Optional[int] = None,
+                       series: Optional[str] = None, current_user_id: int = Depends(get_current_user_id)):
+    names = SERIES if not series else tuple(series.split(","))
+    unknown = set(names) - set(SERIES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown series: {', '.join(sorted(unknown))}")
+    if points is not None and (points < 2 or points > MAX_SERIES_POINTS):
+        raise HTTPException(status_code=400, detail=f"points must be between 2 and {MAX_SERIES_POINTS}")
+
+    db = SessionLocal()
+    try:
+        session = db.query(Session).filter(Session.id == session_id).first()
+
+        if not session:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Session with ID {session_id} not found"
+            )
+
+        if session.user_id != current_user_id:
+            raise HTTPException(status_code=403, detail="Access denied")
+
+        fps = session.fps
+        row = db.query(SessionSeries).filter(SessionSeries.session_id == session_id).first()
+        if row is None:
+            #sessions from before series were stored get them from re-analysis or series_store.py backfill
+            raise HTTPException(
+                status_code=404,
+                detail=f"No stored series for session {session_id}"
+            )
+        frames = row.frames
+        data = load_series(row, names)
+    finally:
+        db.close()
+
+    end = frames if end is None else end
+    if start < 0 or end > frames or start >= end:
+        raise HTTPException(status_code=400, detail=f"Frame range must be within 0-{frames} with start < end")
+
+    response = {"session_id": session_id, "fps": fps, "frames": frames, "start": start, "end": end, "series": {}}
+    for name in names:
+        index, values = downsample(data[name][start:end], points)
+        response["series"][name] = {"frames": index + start, "values": values}
+    return convert_numpy(response)
+
+#feedback is generated after the session is saved, poll this or pass
+#wait=seconds to hold the request open until it's ready
+@app.get("/sessions/{session_id}/feedback", response_model=FeedbackResponse)
+async def get_session_feedback(session_id: int, wait: float = 0, current_user_id: int = Depends(get_current_user_id)):
+    if wait < 0 or wait > 60:
+        raise HTTPException(status_code=400, detail="wait must be between 0 and 60 seconds")
+
+    def lookup():
+        db = SessionLocal()
+        try:
+            return db.query(Session.user_id, Session.ai_feedback).filter(Session.id == session_id).first()
+        finally:
+            db.close()
+
+    session = await run_in_threadpool(lookup)
+    if not session:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Session with ID {session_id} not found"
+        )
+    if session.user_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    text = session.ai_feedback
+    if text is None and wait > 0:
+        text = await feedback_service.wait(session_id, wait)
+    return FeedbackResponse(session_id=session_id, status="pending" if text is None else "ready", ai_feedback=text)
+
+#trends from the per day / week rollups, oldest first, only periods with sessions
+@app.get("/users/{user_id}/progress", response_model=ProgressResponse)
+def get_user_progress(user_id: int, period: str = "week", limit: int = 12, current_user_id: int = Depends(get_current_user_id)):
+    if user_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of: {', '.join(PERIODS)}")
+    if limit < 1 or limit > MAX_PROGRESS_PERIODS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PROGRESS_PERIODS}")
+
+    def average(total, count):
+        return total / count if count else None
+
+    return ProgressResponse(
+        user_id=user_id,
+        period=period,
+        periods=[ProgressPeriod(
+            period_start=str(row.period_start),
+            sessions=row.sessions,
+            reps=row.reps,
+            below=row.below,
+            parallel=row.parallel,
+            partial=row.partial,
+            avg_min_knee_angle=average(row.knee_angle_sum, row.knee_angle_count),
+            avg_tempo=average(row.tempo_sum, row.tempo_count),
+            avg_bar_dev=average(row.bar_dev_sum, row.bar_dev_count),
+        ) for row in get_progress(user_id, period, limit)]
+    )
+
 @app.get("/users/{user_id}", response_model=UserResponse)
 def get_user(user_id: int, current_user_id: int = Depends(get_current_user_id)):
     if user_id != current_user_id:
@@ -319,117 +671,158 @@ def get_user(user_id: int, current_user_id: int = Depends(get_current_user_id)):
     finally:
         db.close()
 
+def upload_error(e):
+    headers = {"Upload-Offset": str(e.offset)} if e.offset is not None else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+def check_fps(fps):
+    if fps < 1 or fps > 240:
+        raise HTTPException(status_code=400, detail="FPS must be between 1 and 240")
+
+#single request upload, large videos on shaky connections should use /uploads
 @app.post("/analyze-video")
 async def analyze_squat_endpoint(file: UploadFile = File(...), fps: int = 30, current_user_id: int = Depends(get_current_user_id)):
     # Input validation
-    if fps < 1 or fps > 240:
-        raise HTTPException(status_code=400, detail="FPS must be between 1 and 240")
+    check_fps(fps)
 
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
 
-    allowed_extensions = {'.mp4', '.avi', '.mov', '.mkv'}
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext not in allowed_extensions:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file format. Allowed formats: {', '.join(allowed_extensions)}"
-        )
+    try:
+        file_ext = check_filename(file.filename)
+        video_path = new_upload_path(file_ext)
+        try:
+            video_hash = await run_in_threadpool(save_upload, file.file, video_path, file.filename)
+        finally:
+            file.file.close()
+        await run_in_threadpool(check_decodes, video_path)
+    except UploadError as e:
+        raise upload_error(e)
+
+    #analysis runs in the job workers, poll /jobs/{job_id} for the result
+    #repeat uploads come back already done from the result cache
+    job_id, status = await run_in_threadpool(job_queue.submit, current_user_id, video_path, fps, video_hash, profile_requested())
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": status})
+
+#resumable upload: create it with the total size, PUT the bytes in parts at
+#?offset= (the body is the raw bytes), then complete it to queue the analysis.
+#after a dropped connection GET the upload for the offset to resume from
+@app.post("/uploads", response_model=UploadResponse, status_code=201)
+def create_upload(request: UploadRequest, current_user_id: int = Depends(get_current_user_id)):
+    try:
+        upload = upload_store.create(current_user_id, request.filename, request.size)
+    except UploadError as e:
+        raise upload_error(e)
+    return UploadResponse(upload_id=upload.id, offset=0, size=upload.size, part_size=PART_SIZE, status="receiving")
 
+@app.get("/uploads/{upload_id}", response_model=UploadResponse)
+def get_upload(upload_id: str, current_user_id: int = Depends(get_current_user_id)):
     try:
-        with tempfile.NamedTemporaryFile(delete = False, suffix = ".mp4",) as tmp:
-            tmp_path = tmp.name
-            shutil.copyfileobj(file.file, tmp)
-    finally:
-        file.file.close()
+        return UploadResponse(**upload_store.status(upload_id, current_user_id))
+    except UploadError as e:
+        raise upload_error(e)
 
+@app.put("/uploads/{upload_id}", response_model=UploadResponse)
+async def upload_part(request: Request, upload_id: str, offset: int, current_user_id: int = Depends(get_current_user_id)):
     try:
-        #getting keypoints
-        print("Running barbell detection")
-        raw_barbell_xy, barbell_conf = run_detection(tmp_path, ROBOFLOW_API_KEY, ROBOFLOW_PROJECT, ROBOFLOW_VERSION, ROBOFLOW_WORKSPACE)
-
-        # Takes only the keypoints we need which are the left and right
-        # hips, knees, and ankles.
-        REQUIRED_KEYPOINTS = [11, 12, 13 ,14 ,15 ,16] 
-        print("Running pose estimation model")
-        raw_xy, conf = run_pose(tmp_path)
-        xy = raw_xy.copy()
-        
-        #Running savgol filter
-        for joints in REQUIRED_KEYPOINTS:
-            conf_valid = conf[:, joints] > 0.5      #smooth() expects boloean array
-            xy[: , joints, : ] = smooth(raw_xy[:, joints, :], conf_valid)
-        
-        barbell_conf_valid = barbell_conf > 0.5     #smooth() expects boloean array
-        barbell_xy = smooth(raw_barbell_xy, barbell_conf_valid)
-
-        metrics = analyze_squat(xy, conf, barbell_xy, fps)
-
-        #feedback
-        print("Creating feedback")
-        feedback = generate_feedback(metrics)
-        metrics["ai_feedback"] = feedback
-
-        #saving to database
-        db = SessionLocal()
-        try:
-            # Calculate summary statistics
-            avg_depth = np.mean([rep.get('bottom_angle', 0) for rep in metrics['reps']])
-            min_knee_angle = min([rep.get('bottom_angle', 180) for rep in metrics['reps']])
-            avg_tempo = np.mean(metrics['tempo_per_rep']) if len(metrics['tempo_per_rep']) > 0 else None
-            avg_alignment = np.mean(metrics['hip_heel_alignment'])
-            avg_bar_dev = np.nanmean(metrics['bar_path_dev']) if metrics['bar_path_dev'] else None
-
-            #creates session record
-            session = Session(
-                user_id=current_user_id,
-                video_path=tmp_path,
-                fps=fps,
-                total_reps=metrics['total_reps'],
-                avg_depth=float(avg_depth) if not np.isnan(avg_depth) else None,
-                min_knee_angle=float(min_knee_angle) if not np.isnan(min_knee_angle) else None,
-                tempo=float(avg_tempo) if avg_tempo and not np.isnan(avg_tempo) else None,
-                alignment=float(avg_alignment) if not np.isnan(avg_alignment) else None,
-                bar_dev=float(avg_bar_dev) if avg_bar_dev and not np.isnan(avg_bar_dev) else None,
-                ai_feedback=feedback
-            )
-            db.add(session)
-            db.flush()  #get session.id
-
-            #make metric records
-            for i, rep in enumerate(metrics['reps']):
-                tempo = metrics['tempo_per_rep'][i] if i < len(metrics['tempo_per_rep']) else None
-                bar_dev = metrics['bar_path_dev'][i] if i < len(metrics['bar_path_dev']) else None
-                hip_aligned = bool(np.mean(metrics['hip_heel_alignment'][rep['start']:rep['end']]) > 0.5)
-
-                rep_metric = RepMetric(
-                    session_id=session.id,
-                    rep_number=rep['rep_count'],
-                    bottom_frame=int(rep['bottom_frame']),
-                    start_frame=int(rep['start']),
-                    end_frame=int(rep['end']),
-                    knee_angle=float(rep['bottom_angle']),
-                    depth_value=None,  #can be calculated if needed
-                    depth_quality=rep['depth'],
-                    bar_path_deviation=float(bar_dev) if bar_dev and not np.isnan(bar_dev) else None,
-                    tempo=float(tempo) if tempo and not np.isnan(tempo) else None,
-                    hip_heel_aligned=hip_aligned
-                )
-                db.add(rep_metric)
-
-            db.commit()
-            print(f"Session {session.id} saved to database")
-        except Exception as db_error:
-            db.rollback()
-            print(f"Database error: {db_error}")
-            #continues anyways even if there is a save fail
-        finally:
-            db.close()
+        received, size = await upload_store.write(upload_id, current_user_id, offset, request.stream())
+    except UploadError as e:
+        raise upload_error(e)
+    except ClientDisconnect:
+        #what arrived is kept, nobody is left to answer
+        return Response(status_code=400)
+    return UploadResponse(upload_id=upload_id, offset=received, size=size, part_size=PART_SIZE, status="receiving")
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, fps: int = 30, current_user_id: int = Depends(get_current_user_id)):
+    check_fps(fps)
+    try:
+        job_id, status = await upload_store.complete(upload_id, current_user_id, fps, profile_requested())
+    except UploadError as e:
+        raise upload_error(e)
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": status})
 
-        return convert_numpy(metrics)  # Convert numpy types for JSON serialization
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error during analysis: {str(e)}")
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
\ No newline at end of file
+@app.delete("/uploads/{upload_id}", status_code=204)
+def cancel_upload(upload_id: str, current_user_id: int = Depends(get_current_user_id)):
+    try:
+        upload_store.cancel(upload_id, current_user_id)
+    except UploadError as e:
+        raise upload_error(e)
+
+#view=summary leaves out the per frame series, view=downsampled&points=N
+#cuts them to N points, Accept: application/msgpack for the binary form
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job_status(request: Request, job_id: str, view: str = "full", points: Optional[int] = None,
+                   current_user_id: int = Depends(get_current_user_id)):
+    check_view(view, points)
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job with ID {job_id} not found"
+        )
+
+    if job.user_id != current_user_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    payload = JobResponse(
+        job_id=job.id,
+        status=job.status,
+        session_id=job.session_id,
+        error=job.error,
+        created_at=str(job.created_at),
+        updated_at=str(job.updated_at)
+    ).model_dump()
+    accept = request.headers.get("accept")
+    if not job.result:
+        return encode(payload, accept)
+    if view == "full" and not wants_msgpack(accept):
+        #the stored json goes out as is, no parsing it just to serialize it again
+        return splice_json(payload, "result", job.result)
+    payload["result"] = shape_result(json.loads(job.result), view, points)
+    return encode(payload, accept)
+
+@app.websocket("/ws/analyze")
+async def analyze_stream(websocket: WebSocket, token: str, fps: int = 30):
+    """
+    Live analysis, send keypoints as json text messages
+    {"xy": [[x, y] * 17], "conf": [17 values], "barbell": [x, y, conf]}
+    or JPEG frames as binary messages, then {"type": "end"}.
+    A rep event is sent back as each rep completes and a summary at the end.
+    """
+    #browsers can't set headers on websockets so the token comes in the query
+    if verify_token(token) is None:
+        await websocket.close(code=1008)
+        return
+    if fps < 1 or fps > 240:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    analyzer = StreamingAnalyzer(fps)
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+            if message.get("bytes") is not None:
+                xy, conf, barbell = await run_in_threadpool(keypoints_from_frame, message["bytes"])
+                events = analyzer.push(xy, conf, barbell)
+            else:
+                data = json.loads(message.get("text") or "{}")
+                if isinstance(data, dict) and data.get("type") == "end":
+                    for event in analyzer.finish():
+                        await websocket.send_json(convert_numpy(event))
+                    await websocket.close()
+                    return
+                events = analyzer.push(*parse_keypoints(data))
+
+            for event in events:
+                await websocket.send_json(convert_numpy(event))
+    except WebSocketDisconnect:
+        pass
+    except ValueError as e:
+        #bad json, wrongly shaped keypoints or a frame that doesn't decode
+        await websocket.send_json({"type": "error", "detail": f"Invalid message: {str(e)}"})
+        await websocket.close(code=1003)
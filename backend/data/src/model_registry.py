@@ -0,0 +1,132 @@
+"""
+    Process wide registry for the pose and barbell models.
+    Models are loaded (and warmed) once at startup and every request
+    borrows the same handle instead of building its own.
+    Models that aren't thread safe are guarded by a per model lock that
+    is held for one inference call at a time, so concurrent jobs and
+    live frames take turns per batch instead of per video.
+"""
+
+import threading
+import time
+
+
+class ModelHandle:
+    """
+    A loaded model along with how long it took to load and warm
+    """
+    def __init__(self, name, model, load_seconds, warm_seconds, thread_safe):
+        self.name = name
+        self.model = model
+        self.load_seconds = load_seconds
+        self.warm_seconds = warm_seconds
+        self.thread_safe = thread_safe
+        self.lock = threading.Lock()
+
+
+class LockedModel:
+    """
+    Stands in for a model that isn't thread safe, every call holds
+    the model's lock for just that inference
+    """
+    def __init__(self, handle):
+        self._handle = handle
+
+    def __call__(self, *args, **kwargs):
+        with self._handle.lock:
+            return self._handle.model(*args, **kwargs)
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._loaders = {}
+        self._handles = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, warmup=None, thread_safe=False):
+        """
+        loader() builds the model, warmup(model) runs a throwaway inference
+        """
+        with self._lock:
+            self._loaders[name] = (loader, warmup, thread_safe)
+
+    def get(self, name):
+        """
+        Returns the handle for a model, loading it on first use
+        """
+        handle = self._handles.get(name)
+        if handle is not None:
+            return handle
+
+        with self._lock:
+            #another thread may have loaded it while we waited
+            handle = self._handles.get(name)
+            if handle is not None:
+                return handle
+
+            if name not in self._loaders:
+                raise KeyError(f"Model '{name}' is not registered")
+            loader, warmup, thread_safe = self._loaders[name]
+
+            try:
+                start = time.perf_counter()
+                model = loader()
+                load_seconds = time.perf_counter() - start
+
+                warm_seconds = None
+                if warmup is not None:
+                    start = time.perf_counter()
+                    warmup(model)
+                    warm_seconds = time.perf_counter() - start
+            except Exception as e:
+                self._errors[name] = str(e)
+                raise
+
+            handle = ModelHandle(name, model, load_seconds, warm_seconds, thread_safe)
+            self._handles[name] = handle
+            self._errors.pop(name, None)
+            print(f"Loaded {name} model in {load_seconds:.2f}s")
+            return handle
+
+    def model(self, name):
+        """
+        Returns the model to call, wrapped so each call takes its
+        lock if it isn't thread safe
+        """
+        handle = self.get(name)
+        if handle.thread_safe:
+            return handle.model
+        return LockedModel(handle)
+
+    def load_all(self):
+        """
+        Loads every registered model, failures are recorded instead
+        of raised so one bad model doesn't stop the server starting
+        """
+        for name in list(self._loaders):
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Failed to load {name} model: {e}")
+
+    def ready(self):
+        return all(name in self._handles for name in self._loaders)
+
+    def status(self):
+        models = {}
+        for name in self._loaders:
+            handle = self._handles.get(name)
+            if handle is not None:
+                models[name] = {
+                    "loaded": True,
+                    "load_seconds": round(handle.load_seconds, 3),
+                    "warm_seconds": round(handle.warm_seconds, 3) if handle.warm_seconds is not None else None,
+                }
+            else:
+                models[name] = {"loaded": False, "error": self._errors.get(name)}
+        return {"ready": self.ready(), "models": models}
+
+
+#shared by the whole app
+registry = ModelRegistry()
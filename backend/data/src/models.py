@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Boolean, Text, Date, DateTime, ForeignKey, UniqueConstraint, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -19,11 +19,13 @@ class User(Base):
 
 class Session(Base):
     __tablename__ = "sessions"
+    #history is listed newest first per user and paged on (created_at, id)
+    __table_args__ = (Index('idx_sessions_user_created_id', 'user_id', 'created_at', 'id'),)
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=True)
     video_path =Column(String, nullable=False)
-    fps = Column(Integer, default=30)
+    fps = Column(Float, default=30)  # analysed rate, often fractional (29.97)
     total_reps = Column(Integer, nullable=False)
     #metrics
     avg_depth=Column(Float)
@@ -38,10 +40,13 @@ class Session(Base):
 
     user = relationship("User", back_populates="sessions")
     reps = relationship("RepMetric", back_populates="session", cascade="all, delete-orphan")
+    keypoints = relationship("SessionKeypoints", back_populates="session", uselist=False, cascade="all, delete-orphan")
+    series = relationship("SessionSeries", back_populates="session", uselist=False, cascade="all, delete-orphan")
 
 
 class RepMetric(Base):
     __tablename__ = 'rep_metrics'
+    __table_args__ = (Index('idx_rep_metrics_session_id', 'session_id'),)
 
     id = Column(Integer, primary_key=True)
     session_id = Column(Integer, ForeignKey('sessions.id', ondelete='CASCADE'))
@@ -60,4 +65,131 @@ class RepMetric(Base):
     
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    session = relationship("Session", back_populates="reps")
\ No newline at end of file
+    session = relationship("Session", back_populates="reps")
+
+class AnalysisJob(Base):
+    __tablename__ = 'analysis_jobs'
+
+    id = Column(String(32), primary_key=True)  # uuid hex
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=True)
+    status = Column(String, nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    video_path = Column(String, nullable=False)
+    fps = Column(Integer, default=30)
+    video_hash = Column(String(64))  # sha256 of the upload
+    session_id = Column(Integer, ForeignKey('sessions.id', ondelete='SET NULL'), nullable=True)
+    result = Column(Text)  # analysis json once done
+    error = Column(Text)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CachedResult(Base):
+    __tablename__ = 'analysis_cache'
+    #least recently used entries are evicted first
+    __table_args__ = (
+        UniqueConstraint('user_id', 'video_hash', 'fps', 'version'),
+        Index('idx_analysis_cache_last_used_at', 'last_used_at'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    video_hash = Column(String(64), nullable=False)  # sha256 of the upload
+    fps = Column(Float, nullable=False)  # rate the frames were analysed at
+    version = Column(String(16), nullable=False)  # pipeline.analysis_version() that produced the result
+    session_id = Column(Integer, ForeignKey('sessions.id', ondelete='CASCADE'), nullable=True)
+    result = Column(Text, nullable=False)  # analysis json
+    size_bytes = Column(Integer, nullable=False)
+    hits = Column(Integer, default=0)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CachedFeedback(Base):
+    __tablename__ = 'feedback_cache'
+    #least recently used entries are evicted first
+    __table_args__ = (Index('idx_feedback_cache_last_used_at', 'last_used_at'),)
+
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String(64), unique=True, nullable=False)  # sha256 of the quantized summary stats
+    summary = Column(String, nullable=False)  # the quantized stats, readable
+    feedback = Column(Text, nullable=False)
+    hits = Column(Integer, default=0)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SessionKeypoints(Base):
+    __tablename__ = 'session_keypoints'
+
+    session_id = Column(Integer, ForeignKey('sessions.id', ondelete='CASCADE'), primary_key=True)
+    path = Column(String, nullable=False)  # compressed .npz with the raw model outputs
+    frames = Column(Integer, nullable=False)
+    size_bytes = Column(Integer)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    session = relationship("Session", back_populates="keypoints")
+
+
+class SessionSeries(Base):
+    __tablename__ = 'session_series'
+
+    session_id = Column(Integer, ForeignKey('sessions.id', ondelete='CASCADE'), primary_key=True)
+    frames = Column(Integer, nullable=False)
+    codec = Column(String, nullable=False)  # how the blobs are encoded, see series_store
+    depth = Column(LargeBinary, nullable=False)
+    knee_angle = Column(LargeBinary, nullable=False)
+    hip_heel = Column(LargeBinary, nullable=False)  # bitpacked
+    barbell_x = Column(LargeBinary, nullable=False)  # smoothed barbell path
+    barbell_y = Column(LargeBinary, nullable=False)
+    size_bytes = Column(Integer)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    session = relationship("Session", back_populates="series")
+
+
+class ProgressRollup(Base):
+    __tablename__ = 'progress_rollups'
+    #one row per user per day / week, trends read a handful of these instead of every session
+    __table_args__ = (UniqueConstraint('user_id', 'period', 'period_start'),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    period = Column(String, nullable=False)  # 'day' or 'week'
+    period_start = Column(Date, nullable=False)  # utc, weeks start on monday
+
+    sessions = Column(Integer, nullable=False, default=0)
+    reps = Column(Integer, nullable=False, default=0)
+    below = Column(Integer, nullable=False, default=0)
+    parallel = Column(Integer, nullable=False, default=0)
+    partial = Column(Integer, nullable=False, default=0)
+    #sums and counts so averages can be kept up to date with adds only
+    knee_angle_sum = Column(Float, nullable=False, default=0)  # of each session's min_knee_angle
+    knee_angle_count = Column(Integer, nullable=False, default=0)
+    tempo_sum = Column(Float, nullable=False, default=0)  # per rep
+    tempo_count = Column(Integer, nullable=False, default=0)
+    bar_dev_sum = Column(Float, nullable=False, default=0)  # per rep
+    bar_dev_count = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Upload(Base):
+    __tablename__ = 'uploads'
+    #unfinished uploads past UPLOAD_EXPIRE_HOURS are cleaned up by age
+    __table_args__ = (Index('idx_uploads_updated_at', 'updated_at'),)
+
+    id = Column(String(32), primary_key=True)  # uuid hex
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    filename = Column(String, nullable=False)
+    path = Column(String, nullable=False)  # partial file, bytes received so far are its size
+    size = Column(BigInteger, nullable=False)  # total bytes the client said it will send
+    container = Column(String)  # set once the first bytes have been checked
+    job_id = Column(String(32))  # set when the upload is complete and queued
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,108 @@
+"""
+    Password hashing off the request threads. bcrypt is deliberately
+    slow (a few hundred ms of CPU per call), so hashes and checks run
+    in a small process pool of their own instead of the threadpool
+    every sync endpoint shares. Only so many calls can wait for it,
+    past that PasswordPoolBusy is raised and the api answers 429.
+    Logins with a hash made at a different BCRYPT_ROUNDS get a new
+    hash back so it can be swapped in.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+from telemetry import Counter
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(2, os.cpu_count() or 1))))
+#calls running or waiting for a worker before new ones are turned away
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", str(PASSWORD_WORKERS * 8)))
+
+PASSWORD_REJECTED = Counter("squat_password_rejected_total", "Password hashes turned away because the pool was full")
+PASSWORD_REHASHED = Counter("squat_password_rehashed_total", "Password hashes upgraded on login")
+
+# Password hashing context, hashes at other rounds still verify and get flagged for rehashing
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update(plain_password, hashed_password):
+    """
+    (matches, new hash or None), the new hash is only made when the
+    password matched and the stored one is out of date
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+def _ready():
+    #run once per worker at startup so the first logins don't pay for the spawn
+    return os.getpid()
+
+
+class PasswordPoolBusy(Exception):
+    """
+    Too many password hashes already waiting
+    """
+
+
+class PasswordPool:
+    def __init__(self, workers=PASSWORD_WORKERS, max_pending=PASSWORD_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        #spawn, the api process has threads and model state a fork would copy
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        pids = {future.result() for future in [self._executor.submit(_ready) for _ in range(self.workers)]}
+        print(f"Password pool started with {len(pids)} workers")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        if self._executor is None:
+            raise RuntimeError("Password pool is not running")
+        with self._lock:
+            if self._pending >= self.max_pending:
+                PASSWORD_REJECTED.inc()
+                raise PasswordPoolBusy(f"{self._pending} password hashes already pending")
+            self._pending += 1
+        try:
+            return await asyncio.wrap_future(self._executor.submit(fn, *args))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password):
+        return await self._run(hash_password, password)
+
+    async def verify(self, password, hashed):
+        """
+        (matches, new hash or None) like verify_and_update
+        """
+        matches, new_hash = await self._run(verify_and_update, password, hashed)
+        if new_hash is not None:
+            PASSWORD_REHASHED.inc()
+        return matches, new_hash
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "pending": self._pending, "max_pending": self.max_pending}
+
+
+#shared by the whole app
+password_pool = PasswordPool()
@@ -0,0 +1,130 @@
+"""
+    Full analysis of one uploaded video: detection, smoothing and
+    metrics. This is blocking work so it runs in the job workers,
+    never on the event loop. Saving is in session_store.
+"""
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+import numpy as np
+
+import squat_metrics
+import smooth
+import roi
+from squat_metrics import analyze_squat
+from frame_pipeline import run_pipeline, ANALYSIS_FPS
+from smooth import smooth_joints
+from model_registry import registry
+from keypoint_store import load_keypoints
+from detect_pose import DEFAULT_WEIGHTS
+from barbell_detection import JPEG_QUALITY, MAX_SIDE
+from telemetry import stage, FRAMES_PROCESSED, FRAMES_NO_DETECTION
+
+# Takes only the keypoints we need which are the left and right
+# hips, knees, and ankles.
+REQUIRED_KEYPOINTS = [11, 12, 13 ,14 ,15 ,16]
+ANALYSIS_VERSION = 1    #bump with any change to detection, smoothing or scoring code
+
+@lru_cache(maxsize=None)
+def analysis_version():
+    """
+    Short hash of ANALYSIS_VERSION, the models in use and the settings
+    that change a result, stored results from another version are stale
+    """
+    settings = {
+        "version": ANALYSIS_VERSION,
+        "pose_weights": os.getenv("POSE_WEIGHTS", DEFAULT_WEIGHTS),
+        "barbell_model": [os.getenv("ROBOFLOW_PROJECT"), os.getenv("ROBOFLOW_VERSION"), JPEG_QUALITY, MAX_SIDE],
+        "analysis_fps": ANALYSIS_FPS,
+        "roi": [roi.ROI_ENABLED, roi.ROI_PADDING, roi.BARBELL_ROI_PADDING, roi.ROI_WARMUP_FRAMES, roi.ROI_IMGSZ],
+        "smooth": [smooth.WINDOW_SECONDS, smooth.POLY_ORDER],
+        "metrics": [
+            squat_metrics.MIN_DEPTH_THRESHOLD, squat_metrics.MIN_SECONDS_BETWEEN_REPS,
+            squat_metrics.ANGLE_BELOW_PARALLEL, squat_metrics.ANGLE_PARALLEL,
+            squat_metrics.REP_WINDOW_SECONDS, squat_metrics.MIN_SECONDS_BAR_PATH,
+            squat_metrics.HIP_HEEL_ERROR_THRESHOLD,
+        ],
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+def convert_numpy(obj):
+    """Convert numpy types to Python native types for JSON serialization"""
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "f":
+            #null the nans for the whole array at once, not per element
+            out = obj.astype(object)
+            out[~np.isfinite(obj)] = None
+            return out.tolist()
+        if obj.dtype.kind in "biuU":
+            return obj.tolist()
+        return convert_numpy(obj.tolist())
+    elif isinstance(obj, (np.integer,)):
+        return int(obj)
+    elif isinstance(obj, (np.floating, float)):
+        #nan isn't valid json, send null instead
+        return float(obj) if np.isfinite(obj) else None
+    elif isinstance(obj, (np.bool_,)):
+        return bool(obj)
+    elif isinstance(obj, dict):
+        return {k: convert_numpy(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_numpy(i) for i in obj]
+    return obj
+
+def analyze_video(video_path, fps):
+    """
+    Runs the models and metrics over a video, returns the metrics
+    dict and the raw model outputs. ai_feedback is left empty, it's
+    generated in the background once the session is saved.
+    fps is only a fallback for containers that don't report a frame
+    rate, metrics["fps"] is the rate the frames were analysed at.
+    """
+    #getting keypoints, video is decoded once and shared by both models
+    print("Running pose estimation and barbell detection")
+    #the pose lock is taken per batch so other jobs and live frames interleave
+    pose_model, barbell_model = registry.model("pose"), registry.model("barbell")
+    raw_xy, conf, raw_barbell_xy, barbell_conf, fps = run_pipeline(video_path, pose_model, barbell_model, fps=fps)
+    raw = {"raw_xy": raw_xy, "conf": conf, "raw_barbell_xy": raw_barbell_xy, "barbell_conf": barbell_conf}
+    FRAMES_PROCESSED.inc(len(raw_xy))
+    FRAMES_NO_DETECTION.inc(int(np.count_nonzero(conf.max(axis=1) == 0)), model="pose")
+    FRAMES_NO_DETECTION.inc(int(np.count_nonzero(barbell_conf == 0)), model="barbell")
+
+    metrics = compute_metrics(raw, fps)
+    metrics["fps"] = fps
+    metrics["ai_feedback"] = None
+    return metrics, raw
+
+def smooth_barbell(raw, fps):
+    """
+    Smoothed barbell path, (frames, 2) with nan where it wasn't tracked
+    """
+    barbell_conf_valid = raw["barbell_conf"] > 0.5
+    return smooth_joints(raw["raw_barbell_xy"][:, None, :], barbell_conf_valid[:, None], fps)[:, 0, :]
+
+def compute_metrics(raw, fps):
+    """
+    Smoothing and squat metrics from the raw model outputs, this is
+    the cheap part so it can be rerun from stored keypoints
+    """
+    raw_xy, conf = raw["raw_xy"], raw["conf"]
+    xy = raw_xy.copy()
+
+    #Running savgol filter over all the joints at once
+    with stage("smooth"):
+        conf_valid = conf[:, REQUIRED_KEYPOINTS] > 0.5      #smooth_joints() expects boloean array
+        xy[:, REQUIRED_KEYPOINTS, :] = smooth_joints(raw_xy[:, REQUIRED_KEYPOINTS, :], conf_valid, fps)
+
+        barbell_xy = smooth_barbell(raw, fps)
+
+    with stage("analyze"):
+        return analyze_squat(xy, conf, barbell_xy, fps)
+
+def stored_metrics(session):
+    """
+    Metrics rebuilt from a session's stored keypoints, None if it has none
+    """
+    if not session.keypoints or not os.path.exists(session.keypoints.path):
+        return None
+    return compute_metrics(load_keypoints(session.keypoints.path), session.fps)
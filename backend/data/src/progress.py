@@ -0,0 +1,166 @@
+"""
+    Per user progress rollups by day and by week. Every saved session
+    adds its counts and sums to its day and week rows in the same
+    transaction as the session, so trends read one row per period
+    instead of aggregating every session and rep.
+    Periods are utc days / weeks starting on monday, same as created_at.
+
+    usage: python progress.py backfill              (rebuild every user)
+           python progress.py backfill --user-id 3
+    with DATABASE_URL set the same as for the api
+"""
+
+import argparse
+import time
+from datetime import timedelta
+
+from sqlalchemy import func, case
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import SessionLocal
+from models import ProgressRollup, Session, RepMetric
+
+PERIODS = ("day", "week")
+COUNTERS = (
+    "sessions", "reps", "below", "parallel", "partial",
+    "knee_angle_sum", "knee_angle_count", "tempo_sum", "tempo_count", "bar_dev_sum", "bar_dev_count",
+)
+
+
+def period_start(created_at, period):
+    day = created_at.date()
+    return day - timedelta(days=day.weekday()) if period == "week" else day
+
+def _delta(total_reps, min_knee_angle, below, parallel, partial, tempo_sum, tempo_count, bar_dev_sum, bar_dev_count):
+    return {
+        "sessions": 1,
+        "reps": total_reps or 0,
+        "below": below,
+        "parallel": parallel,
+        "partial": partial,
+        "knee_angle_sum": min_knee_angle or 0.0,
+        "knee_angle_count": 0 if min_knee_angle is None else 1,
+        "tempo_sum": tempo_sum or 0.0,
+        "tempo_count": tempo_count,
+        "bar_dev_sum": bar_dev_sum or 0.0,
+        "bar_dev_count": bar_dev_count,
+    }
+
+def session_delta(session, reps):
+    """
+    What one session adds to its periods, from session_store's session and rep rows
+    """
+    depths = [rep["depth_quality"] for rep in reps]
+    tempos = [rep["tempo"] for rep in reps if rep["tempo"] is not None]
+    bar_devs = [rep["bar_path_deviation"] for rep in reps if rep["bar_path_deviation"] is not None]
+    return _delta(
+        session["total_reps"], session["min_knee_angle"],
+        depths.count("below"), depths.count("parallel"), depths.count("partial"),
+        sum(tempos), len(tempos), sum(bar_devs), len(bar_devs),
+    )
+
+def _add(db, rows):
+    """
+    Adds each row's counters onto its period, creating it if needed.
+    A single upsert so concurrent saves can't lose each other's counts.
+    """
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(ProgressRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "period", "period_start"],
+        set_={name: getattr(ProgressRollup, name) + stmt.excluded[name] for name in COUNTERS} | {"updated_at": func.now()},
+    )
+    db.execute(stmt, rows)
+
+def record_session(db, user_id, created_at, delta):
+    """
+    Adds a session to its day and week, runs in the caller's
+    transaction so the session and its rollups commit together
+    """
+    if user_id is None:
+        return
+    _add(db, [{"user_id": user_id, "period": period, "period_start": period_start(created_at, period), **delta}
+              for period in PERIODS])
+
+def get_progress(user_id, period, limit):
+    """
+    The user's last limit periods that have sessions, oldest first
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(ProgressRollup)\
+            .filter(ProgressRollup.user_id == user_id, ProgressRollup.period == period)\
+            .order_by(ProgressRollup.period_start.desc())\
+            .limit(limit)\
+            .all()
+        return rows[::-1]
+    finally:
+        db.close()
+
+def backfill(user_id=None):
+    """
+    Rebuilds the rollups from the sessions and reps already saved,
+    returns the number of sessions counted. Sessions saved while it
+    runs can be left out, run it when the api is idle.
+    """
+    db = SessionLocal()
+    try:
+        #one row per session with its reps already reduced by the database
+        reps = db.query(
+            RepMetric.session_id,
+            func.sum(case((RepMetric.depth_quality == "below", 1), else_=0)).label("below"),
+            func.sum(case((RepMetric.depth_quality == "parallel", 1), else_=0)).label("parallel"),
+            func.sum(case((RepMetric.depth_quality == "partial", 1), else_=0)).label("partial"),
+            func.sum(RepMetric.tempo).label("tempo_sum"),
+            func.count(RepMetric.tempo).label("tempo_count"),
+            func.sum(RepMetric.bar_path_deviation).label("bar_dev_sum"),
+            func.count(RepMetric.bar_path_deviation).label("bar_dev_count"),
+        ).group_by(RepMetric.session_id).subquery()
+        query = db.query(Session.user_id, Session.created_at, Session.total_reps, Session.min_knee_angle, reps)\
+            .outerjoin(reps, reps.c.session_id == Session.id)\
+            .filter(Session.user_id.isnot(None))
+        rollups = db.query(ProgressRollup)
+        if user_id is not None:
+            query = query.filter(Session.user_id == user_id)
+            rollups = rollups.filter(ProgressRollup.user_id == user_id)
+
+        totals = {}
+        count = 0
+        for row in query.yield_per(1000):
+            delta = _delta(
+                row.total_reps, row.min_knee_angle, row.below or 0, row.parallel or 0, row.partial or 0,
+                row.tempo_sum, row.tempo_count or 0, row.bar_dev_sum, row.bar_dev_count or 0,
+            )
+            for period in PERIODS:
+                key = (row.user_id, period, period_start(row.created_at, period))
+                total = totals.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                for name in COUNTERS:
+                    total[name] += delta[name]
+            count += 1
+
+        rollups.delete(synchronize_session=False)
+        if totals:
+            _add(db, [{"user_id": key[0], "period": key[1], "period_start": key[2], **total} for key, total in totals.items()])
+        db.commit()
+        return count
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--user-id", type=int, default=None, help="only rebuild this user, default everyone")
+    args = parser.parse_args()
+
+    from database import init_db
+    init_db()
+    start = time.perf_counter()
+    count = backfill(args.user_id)
+    print(f"Rebuilt progress from {count} sessions in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
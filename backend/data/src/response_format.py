@@ -0,0 +1,84 @@
+"""
+    Shapes analysis results for the client. The view picks how much is
+    sent: full (every per frame series), summary (no series) or
+    downsampled (each series cut to N points, min and max per bucket).
+    Clients that send Accept: application/msgpack get MessagePack back
+    with arrays as raw little endian bytes, e.g.
+    {"dtype": "<f4", "length": n, "data": b"..."}, which the browser can
+    wrap in a Float32Array / Uint8Array without parsing numbers.
+    Compression (brotli or gzip) is done by the middleware in main.
+"""
+
+import json
+import numpy as np
+import msgpack
+from fastapi.responses import JSONResponse, Response
+
+from pipeline import convert_numpy
+from series_store import downsample
+
+SERIES_KEYS = ("depth_over_time", "knee_angle", "hip_heel_alignment")
+BOOL_KEYS = ("hip_heel_alignment",)
+VIEWS = ("full", "summary", "downsampled")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+DEFAULT_POINTS = 1000
+
+
+def wants_msgpack(accept):
+    return any(media_type in (accept or "") for media_type in MSGPACK_TYPES)
+
+def shape_result(result, view="full", points=None):
+    """
+    The result for a view, result can be the metrics dict or its json
+    form. Series come back as numpy arrays either way.
+    """
+    shaped = {key: value for key, value in result.items() if key not in SERIES_KEYS}
+    if view == "summary":
+        return shaped
+    for key in SERIES_KEYS:
+        if key not in result:
+            continue
+        #json nulls turn back into nan here
+        values = np.asarray(result[key], dtype=bool if key in BOOL_KEYS else np.float32)
+        if view == "downsampled":
+            frames, values = downsample(values, points or DEFAULT_POINTS)
+            shaped[key] = {"frames": frames, "values": values}
+        else:
+            shaped[key] = values
+    return shaped
+
+def _pack_default(obj):
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == bool:
+            obj = obj.astype(np.uint8)
+        elif obj.dtype.kind == "f":
+            obj = obj.astype("<f4")
+        elif obj.dtype.kind in "iu":
+            obj = obj.astype("<i4")
+        else:
+            return obj.tolist()
+        return {"dtype": obj.dtype.str, "length": len(obj), "data": obj.tobytes()}
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    raise TypeError(f"Can't pack {type(obj).__name__}")
+
+def encode(payload, accept=None):
+    """
+    Response for a payload holding numpy values, msgpack if the client asked
+    """
+    if wants_msgpack(accept):
+        return Response(msgpack.packb(payload, default=_pack_default), media_type="application/msgpack")
+    return JSONResponse(convert_numpy(payload))
+
+def splice_json(payload, key, raw_json):
+    """
+    Json response for payload with raw_json (already serialized) under
+    key, so a stored result is sent without parsing it again
+    """
+    head = json.dumps({k: v for k, v in payload.items() if k != key})
+    body = f'{head[:-1]}, "{key}": {raw_json}}}' if len(head) > 2 else f'{{"{key}": {raw_json}}}'
+    return Response(body, media_type="application/json")
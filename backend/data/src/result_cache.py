@@ -0,0 +1,143 @@
+"""
+    Cache of finished analyses keyed on the upload's sha256, the fps
+    it was analysed at (not the fps the client asked for, that's only
+    a fallback when the container has no frame rate) and the analysis
+    version, so changing the models or scoring doesn't serve stale
+    metrics.
+    Re-uploading the same clip returns the stored result instead of
+    running the models again. Entries are dropped once they pass the
+    max age, and least recently used entries are dropped when the
+    cache grows past its size budget.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import CachedResult
+from pipeline import analysis_version
+
+CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_MAX_AGE_DAYS = float(os.getenv("RESULT_CACHE_MAX_AGE_DAYS", "30"))
+
+
+class ResultCache:
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, max_age_days=CACHE_MAX_AGE_DAYS):
+        self.max_bytes = max_bytes
+        self.max_age = timedelta(days=max_age_days)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def lookup(self, user_id, video_hash, fps):
+        """
+        Returns (session_id, result json) for a previous analysis of the
+        same video at the same analysed fps by this analysis version, or None
+        """
+        if not video_hash:
+            return None
+        fps = _fps_key(fps)
+        db = SessionLocal()
+        try:
+            entry = db.query(CachedResult).filter(
+                CachedResult.user_id == user_id,
+                CachedResult.video_hash == video_hash,
+                CachedResult.fps == fps,
+                CachedResult.version == analysis_version(),
+                CachedResult.created_at >= datetime.utcnow() - self.max_age,
+            ).first()
+            if entry is None:
+                self._count(False)
+                return None
+
+            entry.hits = (entry.hits or 0) + 1
+            entry.last_used_at = datetime.utcnow()
+            db.commit()
+            self._count(True)
+            return entry.session_id, entry.result
+        finally:
+            db.close()
+
+    def store(self, user_id, video_hash, fps, session_id, result):
+        if not video_hash:
+            return
+        fps = _fps_key(fps)
+        db = SessionLocal()
+        try:
+            entry = db.query(CachedResult).filter(
+                CachedResult.user_id == user_id,
+                CachedResult.video_hash == video_hash,
+                CachedResult.fps == fps,
+                CachedResult.version == analysis_version(),
+            ).first()
+            if entry is None:
+                entry = CachedResult(user_id=user_id, video_hash=video_hash, fps=fps, version=analysis_version())
+                db.add(entry)
+            entry.session_id = session_id
+            entry.result = result
+            entry.size_bytes = len(result)
+            entry.created_at = entry.last_used_at = datetime.utcnow()
+            try:
+                db.commit()
+            except IntegrityError:
+                #same video finished twice at once, the other copy is already cached
+                db.rollback()
+                return
+            self._evict(db)
+        finally:
+            db.close()
+
+    def _evict(self, db):
+        """
+        Drops expired entries then least recently used ones until the
+        cache fits in max_bytes
+        """
+        db.query(CachedResult)\
+            .filter(CachedResult.created_at < datetime.utcnow() - self.max_age)\
+            .delete(synchronize_session=False)
+
+        total = db.query(func.coalesce(func.sum(CachedResult.size_bytes), 0)).scalar()
+        if total > self.max_bytes:
+            oldest = db.query(CachedResult.id, CachedResult.size_bytes)\
+                .order_by(CachedResult.last_used_at)\
+                .all()
+            drop = []
+            for entry_id, size in oldest:
+                if total <= self.max_bytes:
+                    break
+                drop.append(entry_id)
+                total -= size
+            db.query(CachedResult).filter(CachedResult.id.in_(drop)).delete(synchronize_session=False)
+        db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+def _fps_key(fps):
+    """
+    Analysed rates are often fractional (29.97), kept to a few decimals
+    so float noise doesn't split entries but 29.97 and 30 stay apart
+    """
+    return round(float(fps), 3)
+
+
+#shared by the whole app
+result_cache = ResultCache()
@@ -0,0 +1,95 @@
+"""
+    Tracks the lifter's bounding box from the pose results so both
+    detectors can run on a padded crop around them instead of the
+    whole frame. Detections are mapped back to full frame pixels by
+    the callers using the crop offset, and tracking falls back to the
+    full frame whenever the lifter is lost or gets near the crop edge.
+"""
+
+import os
+import threading
+
+ROI_ENABLED = os.getenv("ROI_ENABLED", "1") == "1"
+ROI_PADDING = float(os.getenv("ROI_PADDING", "0.3"))                    #fraction of the box added on each side
+BARBELL_ROI_PADDING = float(os.getenv("BARBELL_ROI_PADDING", "1.0"))    #wider, the plates stick out past the lifter
+ROI_WARMUP_FRAMES = int(os.getenv("ROI_WARMUP_FRAMES", "5"))            #full frame detections before cropping
+ROI_IMGSZ = int(os.getenv("ROI_IMGSZ", "416"))                          #pose input size for crops, lifter fills the crop
+EDGE_MARGIN = 0.05      #box this close to a cropped edge (fraction of crop) counts as lost
+
+
+class RoiTracker:
+    def __init__(self, padding=ROI_PADDING, warmup=ROI_WARMUP_FRAMES):
+        self.padding = padding
+        self.warmup = warmup
+        self._box = None        #last lifter box, full frame (x1, y1, x2, y2)
+        self._hits = 0          #consecutive frames the lifter was found
+        self._lock = threading.Lock()
+
+    def region(self, shape, padding=None):
+        """
+        Crop bounds (x1, y1, x2, y2) for a frame of this shape,
+        None means use the full frame
+        """
+        with self._lock:
+            if self._box is None or self._hits < self.warmup:
+                return None
+            box = self._box
+        padding = self.padding if padding is None else padding
+
+        height, width = shape[:2]
+        x1, y1, x2, y2 = box
+        pad_x = (x2 - x1) * padding
+        pad_y = (y2 - y1) * padding
+        x1 = int(max(0, x1 - pad_x))
+        y1 = int(max(0, y1 - pad_y))
+        x2 = int(min(width, x2 + pad_x))
+        y2 = int(min(height, y2 + pad_y))
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return None
+        return x1, y1, x2, y2
+
+    def crop(self, frame, padding=None, region=None):
+        """
+        Returns (crop, (x_offset, y_offset)), the crop is a view so
+        nothing is copied
+        """
+        if region is None:
+            region = self.region(frame.shape, padding)
+        if region is None:
+            return frame, (0, 0)
+        x1, y1, x2, y2 = region
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def update(self, box, region=None, shape=None):
+        """
+        box is the lifter's full frame box for the latest frame or None if
+        nobody was found. region is the crop it was detected in and shape
+        the full frame's shape.
+        """
+        with self._lock:
+            if box is None or _near_edge(box, region, shape):
+                self._box = None
+                self._hits = 0
+                return
+            self._box = tuple(float(v) for v in box)
+            self._hits += 1
+
+
+def _near_edge(box, region, shape):
+    """
+    True if the box is pressed against a side of the crop that isn't
+    also the side of the frame, the lifter may be partly cut off
+    """
+    if region is None or shape is None:
+        return False
+    height, width = shape[:2]
+    x1, y1, x2, y2 = region
+    margin_x = (x2 - x1) * EDGE_MARGIN
+    margin_y = (y2 - y1) * EDGE_MARGIN
+    bx1, by1, bx2, by2 = box
+    return bool(
+        (x1 > 0 and bx1 - x1 < margin_x) or
+        (y1 > 0 and by1 - y1 < margin_y) or
+        (x2 < width and x2 - bx2 < margin_x) or
+        (y2 < height and y2 - by2 < margin_y)
+    )
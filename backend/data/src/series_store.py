@@ -0,0 +1,174 @@
+"""
+    Keeps the per frame series of each session (depth, knee angle, hip
+    heel alignment and the smoothed barbell path) so past sessions can
+    be charted without re-running the analysis. All series live in one
+    row: floats as float32 with their bytes shuffled into planes before
+    zlib (compresses much better than raw floats), the boolean
+    alignment bitpacked. Reading a session is a single row lookup.
+    Series are written by the analysis job and by re-analysis, sessions
+    saved before series were kept are filled in with the backfill.
+
+    usage: python series_store.py backfill              (every session missing one)
+           python series_store.py backfill --session-id 3
+    with DATABASE_URL set the same as for the api
+"""
+
+import argparse
+import time
+import zlib
+import numpy as np
+from sqlalchemy.orm import joinedload
+
+from database import SessionLocal
+from models import Session, SessionSeries
+
+CODEC = "zlib-shuffle-f32"
+FLOAT_SERIES = ("depth", "knee_angle", "barbell_x", "barbell_y")
+BOOL_SERIES = ("hip_heel",)
+SERIES = FLOAT_SERIES + BOOL_SERIES
+
+
+def encode_floats(values):
+    values = np.ascontiguousarray(values, dtype="<f4")
+    #byte planes: all first bytes, then all second bytes...
+    return zlib.compress(values.view(np.uint8).reshape(-1, 4).T.tobytes())
+
+def decode_floats(blob, frames):
+    planes = np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(4, frames)
+    return np.ascontiguousarray(planes.T).view("<f4").reshape(frames)
+
+def encode_bools(values):
+    return zlib.compress(np.packbits(np.asarray(values, dtype=bool)).tobytes())
+
+def decode_bools(blob, frames):
+    return np.unpackbits(np.frombuffer(zlib.decompress(blob), dtype=np.uint8), count=frames).astype(bool)
+
+def series_from_metrics(metrics, barbell_xy):
+    """
+    The stored series from analyze_squat's metrics and the smoothed barbell path
+    """
+    barbell_xy = np.asarray(barbell_xy, dtype=np.float32)
+    return {
+        "depth": metrics["depth_over_time"],
+        "knee_angle": metrics["knee_angle"],
+        "hip_heel": metrics["hip_heel_alignment"],
+        "barbell_x": barbell_xy[:, 0],
+        "barbell_y": barbell_xy[:, 1],
+    }
+
+def save_series(session_id, metrics, barbell_xy):
+    """
+    Stores a session's series, replacing any already stored
+    """
+    series = series_from_metrics(metrics, barbell_xy)
+    blobs = {name: encode_floats(series[name]) for name in FLOAT_SERIES}
+    blobs.update({name: encode_bools(series[name]) for name in BOOL_SERIES})
+
+    db = SessionLocal()
+    try:
+        db.merge(SessionSeries(
+            session_id=session_id,
+            frames=len(series["depth"]),
+            codec=CODEC,
+            size_bytes=sum(len(blob) for blob in blobs.values()),
+            **blobs,
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def load_series(row, names=SERIES):
+    """
+    Decodes the stored series of a SessionSeries row into arrays
+    """
+    if row.codec != CODEC:
+        raise ValueError(f"Unknown series codec {row.codec}")
+    decoded = {}
+    for name in names:
+        decode = decode_bools if name in BOOL_SERIES else decode_floats
+        decoded[name] = decode(getattr(row, name), row.frames)
+    return decoded
+
+def downsample(values, points):
+    """
+    Returns (frame indices, values) with at most points entries. Each
+    bucket keeps its min and its max in frame order so rep bottoms and
+    spikes survive, booleans become the aligned fraction per bucket.
+    """
+    values = np.asarray(values)
+    frames = len(values)
+    if points is None or frames <= points:
+        return np.arange(frames), values
+
+    if values.dtype == bool:
+        edges = np.linspace(0, frames, points + 1).astype(np.int64)
+        sums = np.add.reduceat(values.astype(np.float64), edges[:-1])
+        return edges[:-1], sums / np.diff(edges)
+
+    buckets = max(points // 2, 1)
+    edges = np.linspace(0, frames, buckets + 1).astype(np.int64)
+    starts = edges[:-1]
+    bucket_of = np.repeat(np.arange(buckets), np.diff(edges))
+    index = np.arange(frames)
+    #nans never win, an all nan bucket reports its first frame (nan)
+    low = np.where(np.isnan(values), np.inf, values)
+    high = np.where(np.isnan(values), -np.inf, values)
+    is_min = low == np.minimum.reduceat(low, starts)[bucket_of]
+    is_max = high == np.maximum.reduceat(high, starts)[bucket_of]
+    min_at = np.minimum.reduceat(np.where(is_min, index, frames), starts)
+    max_at = np.minimum.reduceat(np.where(is_max, index, frames), starts)
+
+    picked = np.sort(np.stack([min_at, max_at], axis=1), axis=1).ravel()
+    #drop the second pick when min and max are the same frame
+    keep = np.ones(len(picked), dtype=bool)
+    keep[1::2] = picked[1::2] != picked[0::2]
+    picked = picked[keep]
+    return picked, values[picked]
+
+def backfill(session_id=None):
+    """
+    Builds the series of saved sessions that have stored keypoints but
+    no series yet, returns how many were written
+    """
+    #the models are only needed here, not by the api's readers
+    from pipeline import stored_metrics, smooth_barbell
+    from keypoint_store import load_keypoints
+
+    db = SessionLocal()
+    try:
+        query = db.query(Session)\
+            .outerjoin(SessionSeries, SessionSeries.session_id == Session.id)\
+            .filter(SessionSeries.session_id.is_(None))\
+            .options(joinedload(Session.keypoints))
+        if session_id is not None:
+            query = query.filter(Session.id == session_id)
+        sessions = query.all()
+    finally:
+        db.close()
+
+    count = 0
+    for session in sessions:
+        metrics = stored_metrics(session)
+        if metrics is None:
+            continue
+        save_series(session.id, metrics, smooth_barbell(load_keypoints(session.keypoints.path), session.fps))
+        count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--session-id", type=int, default=None, help="only this session, default every one missing series")
+    args = parser.parse_args()
+
+    from database import init_db
+    init_db()
+    start = time.perf_counter()
+    count = backfill(args.session_id)
+    print(f"Stored series for {count} sessions in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+    Saves an analysed set: the session row, all of its reps and its
+    progress rollups in one transaction, reps going in as a single bulk
+    insert instead of one ORM object each. Only columns in the db/*.sql
+    schema are written so the same code runs on the SQLite default and
+    Postgres.
+    Called from the job workers, never on the event loop.
+"""
+
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import insert
+
+from database import SessionLocal
+from models import Session, RepMetric
+from progress import session_delta, record_session
+from telemetry import STAGE_SECONDS, DB_ERRORS
+
+
+class SaveError(Exception):
+    """
+    The session couldn't be saved, nothing was written
+    """
+
+
+def _number(value):
+    #nan / inf / None all become NULL
+    if value is None:
+        return None
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+def session_row(user_id, video_path, fps, metrics):
+    """
+    Column values for the sessions table from the analysis metrics
+    """
+    angles = np.array([rep["bottom_angle"] for rep in metrics["reps"]], dtype=np.float64)
+    tempos = np.asarray(metrics["tempo_per_rep"], dtype=np.float64)
+    bar_devs = np.asarray(metrics["bar_path_dev"], dtype=np.float64)
+    alignment = np.asarray(metrics["hip_heel_alignment"], dtype=np.float64)
+    return {
+        "user_id": user_id,
+        "video_path": video_path,
+        "fps": float(fps),  #exact analysed rate, re-analysis smooths and times reps with it
+        "total_reps": int(metrics["total_reps"]),
+        "avg_depth": _number(angles.mean()) if len(angles) else None,
+        "min_knee_angle": _number(angles.min()) if len(angles) else None,
+        "tempo": _number(tempos.mean()) if len(tempos) else None,
+        "alignment": _number(alignment.mean()) if len(alignment) else None,
+        "bar_dev": _number(np.nanmean(bar_devs)) if np.isfinite(bar_devs).any() else None,
+        "ai_feedback": metrics.get("ai_feedback"),
+        #set here rather than by the default so the rollups use the same time
+        "created_at": datetime.utcnow(),
+    }
+
+def rep_rows(session_id, metrics):
+    """
+    Column values for every rep
+    """
+    reps = metrics["reps"]
+    if not reps:
+        return []
+
+    tempos = metrics["tempo_per_rep"]
+    bar_devs = metrics["bar_path_dev"]
+    return [{
+        "session_id": session_id,
+        "rep_number": int(rep["rep_count"]),
+        "bottom_frame": int(rep["bottom_frame"]),
+        "start_frame": int(rep["start"]),
+        "end_frame": int(rep["end"]),
+        "knee_angle": _number(rep["bottom_angle"]),
+        "depth_value": None,  #can be calculated if needed
+        "depth_quality": rep["depth"],
+        "bar_path_deviation": _number(bar_devs[i]) if i < len(bar_devs) else None,
+        "tempo": _number(tempos[i]) if i < len(tempos) else None,
+        "hip_heel_aligned": bool(rep["hip_heel_aligned"] > 0.5),   #fraction of the rep window aligned
+    } for i, rep in enumerate(reps)]
+
+def save_session(user_id, video_path, fps, metrics):
+    """
+    Saves the session and its reps, returns the new session id.
+    Raises SaveError if anything failed, the transaction is rolled
+    back so there's never a session without its reps.
+    """
+    start = time.perf_counter()
+    session = session_row(user_id, video_path, fps, metrics)
+    db = SessionLocal()
+    try:
+        session_id = db.execute(insert(Session).values(**session).returning(Session.id)).scalar_one()
+        reps = rep_rows(session_id, metrics)
+        if reps:
+            #executemany, batched into multi row inserts by sqlalchemy
+            db.execute(insert(RepMetric), reps)
+        record_session(db, user_id, session["created_at"], session_delta(session, reps))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        DB_ERRORS.inc(operation="save_session")
+        raise SaveError(f"Could not save session: {e}") from e
+    finally:
+        db.close()
+
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="db_commit")
+    print(f"Session {session_id} saved to database with {len(reps)} reps")
+    return session_id
@@ -1,14 +1,27 @@
 from scipy.signal import savgol_filter
 import numpy as np
 
-WINDOW_LENGTH = 9       #Fine for 30fps increase if fps increases
+WINDOW_SECONDS = 0.3    #savgol window, 9 frames at 30fps
+POLY_ORDER = 2          #Defaulting to 2 for polynomial possibly change later
 
-def smooth(xy, conf_valid):
+def window_length(fps=30):
+    """
+    Savgol window in frames for the given frame rate, kept odd and
+    long enough for the polynomial
+    """
+    length = int(round(WINDOW_SECONDS * fps))
+    if length % 2 == 0:
+        length += 1
+    #smallest odd window savgol accepts for this polynomial
+    return max(length, POLY_ORDER + 1 + POLY_ORDER % 2)
+
+def smooth(xy, conf_valid, fps=30):
     time = np.arange(len(xy))
     length = xy.shape[0]
     output = np.asarray(xy.copy(), dtype=np.float32)
+    window = window_length(fps)
 
-    if length < WINDOW_LENGTH:     #Video too short to smooth out 
+    if length < window:     #Video too short to smooth out 
         return xy
     
     for direction in [0,1]:
@@ -20,6 +33,66 @@ def smooth(xy, conf_valid):
         if np.sum(good) < 2:
             return xy
         values[bad] = np.interp(time[bad], time[good], values[good]) 
-        output[:, direction] = savgol_filter(values, WINDOW_LENGTH, 2)     #Defaulting to 2 for polynomial possibly change later
+        output[:, direction] = savgol_filter(values, window, POLY_ORDER)
+
+    return output
+
+def fill_gaps(values, good):
+    """
+    Linear interpolation over the bad entries of every row of a
+    (rows, frames) block at once, same result as np.interp per row
+    including holding the end values past the first/last good frame
+    """
+    bad_rows, bad_frames = np.nonzero(~good)
+    if len(bad_rows) == 0:
+        return values
+    frames = values.shape[1]
+    time = np.arange(frames)
+
+    #index of the nearest good frame at or before / at or after each frame
+    prev = np.maximum.accumulate(np.where(good, time, -1), axis=1)[bad_rows, bad_frames]
+    after = np.minimum.accumulate(np.where(good, time, frames)[:, ::-1], axis=1)[:, ::-1][bad_rows, bad_frames]
+    prev = np.where(prev >= 0, prev, after)
+    after = np.where(after < frames, after, prev)
+
+    y0 = values[bad_rows, prev].astype(np.float64)
+    y1 = values[bad_rows, after].astype(np.float64)
+    span = after - prev
+    slope = np.divide(y1 - y0, span, out=np.zeros_like(y0), where=span > 0)
+
+    filled = values.copy()
+    filled[bad_rows, bad_frames] = slope * (bad_frames - prev) + y0
+    return filled
+
+def smooth_joints(xy, conf_valid, fps=30):
+    """
+    Batched smooth() for a (frames, joints, 2) block with a (frames, joints)
+    validity mask. Every joint and axis is gap filled and filtered in one
+    pass. Joints smooth() would leave raw (fewer than 2 good frames on an
+    axis) are left raw here too.
+    """
+    xy = np.asarray(xy)
+    frames, joints = xy.shape[:2]
+    if frames < window_length(fps):     #Video too short to smooth out
+        return xy
+
+    #one row per joint axis so the filter runs over contiguous memory
+    values = np.ascontiguousarray(xy.reshape(frames, joints * 2).T, dtype=np.float32)
+    good = np.repeat(conf_valid.T, 2, axis=0) & np.isfinite(values)
+    enough = good.sum(axis=1) >= 2
+    #smooth() bails out on the whole joint if either axis can't be filled
+    enough = np.repeat(enough.reshape(joints, 2).all(axis=1), 2)
+
+    output = values
+    if enough.all():
+        output = savgol_filter(fill_gaps(values, good), window_length(fps), POLY_ORDER, axis=1)
+    elif enough.any():
+        output = values.copy()
+        filled = fill_gaps(values[enough], good[enough])
+        output[enough] = savgol_filter(filled, window_length(fps), POLY_ORDER, axis=1)
+    output = output.T.reshape(frames, joints, 2)
 
-    return output
\ No newline at end of file
+    raw_joints = ~enough[::2]
+    if raw_joints.any():
+        output[:, raw_joints] = xy[:, raw_joints]
+    return output
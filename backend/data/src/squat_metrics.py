@@ -6,13 +6,19 @@ COCO = dict(L_hip=11, R_hip=12, L_knee=13, R_knee=14,L_ank=15, R_ank=16)
 
 EPSILON = 1e-6  #small value to prevent division by zero
 MIN_DEPTH_THRESHOLD = 0  #min depth threshold for rep detection
-MIN_DISTANCE_BETWEEN_REPS = 30  #min frames between rep peaks
+MIN_SECONDS_BETWEEN_REPS = 1.0  #min time between rep peaks
 ANGLE_BELOW_PARALLEL = 90  #knee angle threshold for "below parallel" (degrees)
 ANGLE_PARALLEL = 100  #knee angle threshold for "parallel" (degrees)
-DEFAULT_REP_WINDOW = 15  #default frame window around rep peak
-MIN_FRAMES_BAR_PATH = 15  # minimum frames needed for bar path analysis
+REP_WINDOW_SECONDS = 0.5  #default window either side of the rep peak
+MIN_SECONDS_BAR_PATH = 0.5  # minimum tracked time needed for bar path analysis
 HIP_HEEL_ERROR_THRESHOLD = 50  #pixel threshold for hip-heel alignment
 
+def seconds_to_frames(seconds, fps=30):
+    """
+    Converts a duration to a frame count at the given frame rate
+    """
+    return max(1, int(round(seconds * fps)))
+
 def sideSelector(xy, con):
     """
     Selects side to look at by evaluating higher average confidence
@@ -69,16 +75,6 @@ def hip_heel(hip, ank, error):
     result = np.where(np.abs(lineup) <= error, True, False)        
     return result
 
-def rep_count(hip, knee): 
-    """
-    Returns numpy array of bottom frames
-    Length of array gives you # of reps
-    """
-    depth_over_time = squat_depths(hip, knee)
-    peaks, _ = find_peaks(depth_over_time, height=MIN_DEPTH_THRESHOLD, distance=MIN_DISTANCE_BETWEEN_REPS)
-    return peaks
-    #depth_over_time[peaks] >= error
-
 def rep_tempo(rep_bottom_frames, fps = 30):
     """
     Returns an array of how long each rep took
@@ -86,87 +82,126 @@ def rep_tempo(rep_bottom_frames, fps = 30):
     rep_times = np.diff(rep_bottom_frames) / fps
     return rep_times
 
-def depth_quality(hip, knee, ank, peaks):
-    """
-    Analyzes angles of the bottoms of each rep 
-    Returning an array where each index correlates to a rep
-    containing whether or not the lifter completed the rep 
-    below, parallel, or paritally.
-    """
-    bottom_angles = knee_angle(hip, knee, ank)[peaks]
-    quality = []
-    for angle in bottom_angles:
-        if angle < ANGLE_BELOW_PARALLEL:
-            quality.append("below")
-        elif angle < ANGLE_PARALLEL:
-            quality.append("parallel")
-        else:
-            quality.append("partial")
-    return quality
-
-def segment_reps(hip, knee, ank, peaks, window=DEFAULT_REP_WINDOW):
-    """
-    Returns a dictionary containing information per rep, 
-    information contains windows, rep count, bottom frame
-    depth, and the angle at the bottom
-    """
-    reps = []
-    depth = depth_quality(hip, knee, ank, peaks)
-    for i, peak in enumerate(peaks):
-        start = max(0, peak - window)
-        end = min(len(hip), peak + window)
-
-        rep_stats = {
-            "rep_count": i + 1,
-            "bottom_frame": peak, 
-            "start": start,
-            "end" : end, 
-            "depth" : depth[i],
-            "bottom_angle" : angle(hip[peak:peak+1], knee[peak: peak +1 ], ank[peak: peak + 1])[0]
-        }
-        reps.append(rep_stats)
+# Per frame series, one row per frame
+FRAME_DTYPE = np.dtype([
+    ("depth", np.float32),          #knee - hip y coords
+    ("knee_angle", np.float32),
+    ("hip_heel", np.bool_),         #hip lined up over the ankle
+])
+
+# Per rep aggregates, one row per rep
+REP_DTYPE = np.dtype([
+    ("rep_count", np.int32),
+    ("bottom_frame", np.int64),
+    ("start", np.int64),
+    ("end", np.int64),
+    ("depth", "U8"),                #below / parallel / partial
+    ("bottom_angle", np.float32),
+    ("bar_path_dev", np.float64),   #nan when too few tracked frames
+    ("tempo", np.float64),          #seconds to the next rep, nan for the last
+    ("hip_heel_aligned", np.float64),   #fraction of the rep window aligned
+])
+
+def window_sums(values, starts, ends):
+    """
+    Sum of values[start:end] for every window at once using a prefix
+    sum, windows can overlap
+    """
+    prefix = np.concatenate([[0.0], np.cumsum(values, dtype=np.float64)])
+    return prefix[ends] - prefix[starts]
+
+def frame_series(hip, knee, ank):
+    """
+    Every per frame series computed once into a FRAME_DTYPE array
+    """
+    frames = np.empty(len(hip), dtype=FRAME_DTYPE)
+    frames["depth"] = squat_depths(hip, knee)
+    frames["knee_angle"] = knee_angle(hip, knee, ank)
+    frames["hip_heel"] = hip_heel(hip, ank, error=HIP_HEEL_ERROR_THRESHOLD)
+    return frames
+
+def rep_table(frames, barbell_xy, fps=30):
+    """
+    Per rep aggregates from the frame series as a REP_DTYPE array,
+    every rep's window is reduced at once instead of looping
+    """
+    distance = seconds_to_frames(MIN_SECONDS_BETWEEN_REPS, fps)
+    peaks, _ = find_peaks(frames["depth"], height=MIN_DEPTH_THRESHOLD, distance=distance)
+    window = seconds_to_frames(REP_WINDOW_SECONDS, fps)
+
+    reps = np.empty(len(peaks), dtype=REP_DTYPE)
+    if len(peaks) == 0:
+        return reps
+    starts = np.maximum(0, peaks - window)
+    ends = np.minimum(len(frames), peaks + window)
+
+    reps["rep_count"] = np.arange(1, len(peaks) + 1)
+    reps["bottom_frame"] = peaks
+    reps["start"] = starts
+    reps["end"] = ends
+    bottom_angles = frames["knee_angle"][peaks]
+    reps["bottom_angle"] = bottom_angles
+    reps["depth"] = np.select(
+        [bottom_angles < ANGLE_BELOW_PARALLEL, bottom_angles < ANGLE_PARALLEL],
+        ["below", "parallel"],
+        "partial",
+    )
+    reps["tempo"] = np.nan
+    reps["tempo"][:-1] = rep_tempo(peaks, fps)
+
+    lengths = ends - starts
+    reps["hip_heel_aligned"] = window_sums(frames["hip_heel"], starts, ends) / np.maximum(lengths, 1)
+
+    #bar path std per window from sums of x and x^2, centred first to keep precision
+    bar_x = barbell_xy[:, 0].astype(np.float64)
+    tracked = np.isfinite(bar_x)
+    centre = bar_x[tracked].mean() if tracked.any() else 0.0
+    bar_x = np.where(tracked, bar_x - centre, 0.0)
+    count = window_sums(tracked, starts, ends)
+    total = window_sums(bar_x, starts, ends)
+    total_sq = window_sums(bar_x * bar_x, starts, ends)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        variance = np.maximum(total_sq / count - mean * mean, 0.0)
+    reps["bar_path_dev"] = np.where(count >= seconds_to_frames(MIN_SECONDS_BAR_PATH, fps), np.sqrt(variance), np.nan)
     return reps
 
-def bar_path_analysis(barbell_xy, start, end):
+def analyze_squat_columnar(xy, conf, barbell_xy, fps=30):
     """
-    Analyzes barpath returning the deviation of the barbells
-    horizontal movement during reps excluding the top of the 
-    rep where the lifter might reset and adjust the bar
+    Returns (frames, reps), the FRAME_DTYPE series and REP_DTYPE
+    aggregates for the whole video
     """
-    window = barbell_xy[start:end]
-    bar_x = window[:, 0]
-    bar_x = bar_x[~np.isnan(bar_x)]
-
-    if len(bar_x) < MIN_FRAMES_BAR_PATH:
-        return np.nan
+    hip, knee, ank = sideSelector(xy, conf)
+    frames = frame_series(hip, knee, ank)
+    return frames, rep_table(frames, barbell_xy, fps)
 
-    horizontal_dev = np.std(bar_x)
-    return horizontal_dev
+def metrics_dict(frames, reps, fps=30):
+    """
+    Adapter from the columnar results to the dict analyze_squat has
+    always returned
+    """
+    return {
+        "total_reps": len(reps),
+        "reps": [{
+            "rep_count": int(rep["rep_count"]),
+            "bottom_frame": rep["bottom_frame"],
+            "start": rep["start"],
+            "end": rep["end"],
+            "depth": str(rep["depth"]),
+            "bottom_angle": rep["bottom_angle"],
+            "hip_heel_aligned": rep["hip_heel_aligned"],
+        } for rep in reps],
+        "depth_over_time": frames["depth"],
+        "knee_angle": frames["knee_angle"],
+        "tempo_per_rep": rep_tempo(reps["bottom_frame"], fps),
+        "hip_heel_alignment": frames["hip_heel"],
+        "bar_path_dev": reps["bar_path_dev"].tolist(),
+    }
 
 def analyze_squat(xy, conf, barbell_xy, fps=30):
     """
     Returns a dictionary with the results of complete analysis 
     on the squat video
     """
-    hip, knee, ank = sideSelector(xy, conf)
-    peaks = rep_count(hip, knee)
-    reps = segment_reps(hip, knee, ank, peaks)
-    knee_ang = knee_angle(hip, knee, ank)
-    depth = squat_depths(hip,knee)
-    hip_heel_alignment = hip_heel(hip, ank, error=HIP_HEEL_ERROR_THRESHOLD)
-    tempo = rep_tempo(peaks, fps)
-    bar_dev = []
-
-    for rep in reps:
-        bar_dev.append(bar_path_analysis(barbell_xy, rep["start"], rep["end"]))
-    return {
-        "total_reps": len(peaks),   # Returns # of total reps
-        "reps": reps,               #Segmented reps dict
-        "depth_over_time": depth,   #Returns array of ank - hip y coords (lower on screen higher value)
-        "knee_angle": knee_ang,     #Returns knee angle over entire time series
-        "tempo_per_rep": tempo,     #Returns array of tempo of that rep
-        "hip_heel_alignment": hip_heel_alignment,   #Returns time series of hip_heel alignment
-        "bar_path_dev": bar_dev     #Returns time series of deviations of the bar path per rep (float)
-    }
-
-    
+    frames, reps = analyze_squat_columnar(xy, conf, barbell_xy, fps)
+    return metrics_dict(frames, reps, fps)
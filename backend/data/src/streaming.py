@@ -0,0 +1,316 @@
+"""
+    Live analysis for keypoints (or frames) arriving one at a time.
+    Frames are smoothed with the same Savitzky-Golay window as smooth()
+    but emitted half a window late instead of waiting for the whole
+    video, and reps are reported as soon as the peak is confirmed.
+    Everything is kept in fixed size buffers so memory doesn't grow
+    with the length of the set.
+"""
+
+from collections import deque
+import cv2
+import numpy as np
+from scipy.signal import savgol_coeffs
+
+from smooth import window_length, POLY_ORDER
+from squat_metrics import (
+    COCO, MIN_DEPTH_THRESHOLD, MIN_SECONDS_BETWEEN_REPS, REP_WINDOW_SECONDS,
+    MIN_SECONDS_BAR_PATH, HIP_HEEL_ERROR_THRESHOLD, ANGLE_BELOW_PARALLEL,
+    ANGLE_PARALLEL, seconds_to_frames, angle,
+)
+from barbell_detection import detect_frame
+from detect_pose import KeypointBuffer, NUM_KEYPOINTS
+from model_registry import registry
+
+CONF_THRESHOLD = 0.5    #same cutoff the offline pipeline smooths with
+JOINTS = [COCO["L_hip"], COCO["R_hip"], COCO["L_knee"], COCO["R_knee"], COCO["L_ank"], COCO["R_ank"]]
+
+
+class IncrementalSmoother:
+    """
+    Savitzky-Golay smoothing of one 2d point, emitting each frame once
+    lookahead later frames have arrived. Gaps are filled by linear
+    interpolation inside the window like smooth() does over the video.
+    """
+    def __init__(self, fps=30):
+        self.window = window_length(fps)
+        self.lookahead = self.window // 2
+        self.coeffs = savgol_coeffs(self.window, POLY_ORDER, use="dot")
+        self._values = deque(maxlen=self.window)
+        self._valid = deque(maxlen=self.window)
+        self._count = 0         #frames received
+        self._emitted = 0       #frames emitted
+
+    def _filled(self):
+        values = np.array(self._values, dtype=np.float32)
+        valid = np.array(self._valid) & np.all(np.isfinite(values), axis=1)
+        if valid.sum() < 2:
+            return None
+        time = np.arange(len(values))
+        for direction in [0, 1]:
+            values[~valid, direction] = np.interp(time[~valid], time[valid], values[valid, direction])
+        return values
+
+    def _edge(self, positions):
+        """
+        Frames at the start or end of the video that don't have a full
+        window around them, fitted with one polynomial like savgol's
+        interp mode
+        """
+        values = self._filled()
+        if values is None:
+            return [np.array(self._values, dtype=np.float32)[p] for p in positions]
+        time = np.arange(len(values))
+        fits = [np.polyfit(time, values[:, d], POLY_ORDER) for d in [0, 1]]
+        return [np.array([np.polyval(fits[0], p), np.polyval(fits[1], p)], dtype=np.float32) for p in positions]
+
+    def push(self, xy, valid):
+        """
+        Adds one frame, returns the list of smoothed frames now ready
+        """
+        self._values.append(np.asarray(xy, dtype=np.float32))
+        self._valid.append(bool(valid))
+        self._count += 1
+        if self._count < self.window:
+            return []
+
+        if self._emitted == 0:
+            #first full window, the leading frames come from the edge fit
+            out = self._edge(range(self.lookahead))
+            self._emitted = self.lookahead
+        else:
+            out = []
+
+        values = self._filled()
+        if values is None:
+            out.append(self._values[self.lookahead])
+        else:
+            out.append((self.coeffs @ values).astype(np.float32))
+        self._emitted += 1
+        return out
+
+    def finish(self):
+        """
+        Flushes the frames still waiting on lookahead
+        """
+        if self._count < self.window:
+            #too short to smooth, same as smooth()
+            out = list(self._values)[self._emitted:]
+        else:
+            out = self._edge(range(self.lookahead + 1, self.window))
+        self._emitted = self._count
+        return out
+
+
+class IncrementalRepDetector:
+    """
+    Online version of rep_table's peak finding. A peak in squat depth
+    is confirmed once the minimum rep distance has passed without a
+    higher one, then the rep's stats are worked out from the frames
+    around it. Those are kept from when the peak became the candidate,
+    so a long pause at the bottom can't push them out of the history.
+    """
+    def __init__(self, fps=30):
+        self.fps = fps
+        self.distance = seconds_to_frames(MIN_SECONDS_BETWEEN_REPS, fps)
+        self.rep_window = seconds_to_frames(REP_WINDOW_SECONDS, fps)
+        self.min_bar_frames = seconds_to_frames(MIN_SECONDS_BAR_PATH, fps)
+        #enough history for the frames before a new candidate peak
+        self._history = deque(maxlen=self.rep_window + 1)
+        self._candidate = None
+        self._window = []           #candidate's rep window so far
+        self._fell = False          #signal dropped after the candidate
+        self._last_peak = None
+        self._prev_depth = None
+        self._frame = 0
+        self.reps = 0
+
+    def push(self, depth, knee_ang, bar_x, aligned):
+        """
+        Adds one smoothed frame, returns a rep event or None
+        """
+        t = self._frame
+        self._frame += 1
+        frame = (t, depth, knee_ang, bar_x, aligned)
+        self._history.append(frame)
+
+        event = None
+        if self._candidate is not None:
+            if t < self._candidate[0] + self.rep_window:
+                self._window.append(frame)
+            if depth < self._candidate[1]:
+                self._fell = True
+            if t - self._candidate[0] >= self.distance and self._fell:
+                event = self._confirm()
+
+        rising = self._prev_depth is not None and depth > self._prev_depth
+        far_enough = self._last_peak is None or t - self._last_peak >= self.distance
+        if rising and depth > MIN_DEPTH_THRESHOLD and far_enough:
+            if self._candidate is None or depth > self._candidate[1]:
+                self._candidate = (t, depth, knee_ang)
+                self._window = list(self._history)
+                self._fell = False
+        self._prev_depth = depth
+        return event
+
+    def finish(self):
+        if self._candidate is not None and self._fell:
+            return self._confirm()
+        return None
+
+    def _confirm(self):
+        peak, _, bottom_angle = self._candidate
+        self._candidate = None
+        self.reps += 1
+
+        start = max(0, peak - self.rep_window)
+        end = min(self._frame, peak + self.rep_window)
+        window = [h for h in self._window if start <= h[0] < end]
+        self._window = []
+        bar_x = np.array([h[3] for h in window], dtype=np.float32)
+        bar_x = bar_x[np.isfinite(bar_x)]
+        aligned = np.mean([h[4] for h in window]) if window else 0.0
+
+        if bottom_angle < ANGLE_BELOW_PARALLEL:
+            depth = "below"
+        elif bottom_angle < ANGLE_PARALLEL:
+            depth = "parallel"
+        else:
+            depth = "partial"
+
+        tempo = (peak - self._last_peak) / self.fps if self._last_peak is not None else None
+        self._last_peak = peak
+        return {
+            "type": "rep",
+            "rep_count": self.reps,
+            "bottom_frame": peak,
+            "start": start,
+            "end": end,
+            "depth": depth,
+            "bottom_angle": float(bottom_angle),
+            "tempo": tempo,
+            "bar_path_dev": float(np.std(bar_x)) if len(bar_x) >= self.min_bar_frames else None,
+            "hip_heel_aligned": float(aligned),   #fraction of the rep window aligned, same as metrics_dict
+        }
+
+
+class StreamingAnalyzer:
+    """
+    Takes one frame of keypoints at a time and returns rep events as
+    each rep completes
+    """
+    def __init__(self, fps=30):
+        self.fps = fps
+        self.joints = {joint: IncrementalSmoother(fps) for joint in JOINTS}
+        self.barbell = IncrementalSmoother(fps)
+        self.reps = IncrementalRepDetector(fps)
+        self._side_conf = np.zeros(2)   #running confidence sums, left and right
+        self._tempos = []
+        self.frames = 0
+
+    @property
+    def lag_frames(self):
+        return self.barbell.lookahead + self.reps.distance
+
+    def push(self, xy, conf, barbell=None):
+        """
+        xy is (17, 2), conf (17,), barbell (x, y, confidence) or None.
+        Returns a list of rep events.
+        """
+        xy = np.asarray(xy, dtype=np.float32)
+        conf = np.asarray(conf, dtype=np.float32)
+        self.frames += 1
+        self._side_conf += [
+            conf[[COCO["L_hip"], COCO["L_knee"], COCO["L_ank"]]].mean(),
+            conf[[COCO["R_hip"], COCO["R_knee"], COCO["R_ank"]]].mean(),
+        ]
+
+        smoothed = {joint: s.push(xy[joint], conf[joint] > CONF_THRESHOLD) for joint, s in self.joints.items()}
+        if barbell is None:
+            barbell = (np.nan, np.nan, 0.0)
+        bar = self.barbell.push(barbell[:2], barbell[2] > CONF_THRESHOLD)
+        return self._metrics(smoothed, bar)
+
+    def finish(self):
+        """
+        Flushes the buffered frames, returns the last rep events and a summary
+        """
+        smoothed = {joint: s.finish() for joint, s in self.joints.items()}
+        events = self._metrics(smoothed, self.barbell.finish())
+        last = self.reps.finish()
+        if last is not None:
+            events.append(self._record(last))
+        events.append({
+            "type": "summary",
+            "total_reps": self.reps.reps,
+            "frames": self.frames,
+            "avg_tempo": float(np.mean(self._tempos)) if self._tempos else None,
+        })
+        return events
+
+    def _record(self, event):
+        if event["tempo"] is not None:
+            self._tempos.append(event["tempo"])
+        return event
+
+    def _metrics(self, smoothed, bar):
+        side = "L" if self._side_conf[0] > self._side_conf[1] else "R"
+        hips = smoothed[COCO[f"{side}_hip"]]
+        knees = smoothed[COCO[f"{side}_knee"]]
+        ankles = smoothed[COCO[f"{side}_ank"]]
+
+        events = []
+        for hip, knee, ank, bar_xy in zip(hips, knees, ankles, bar):
+            depth = knee[1] - hip[1]
+            knee_ang = angle(hip[None], knee[None], ank[None])[0]
+            aligned = abs(hip[0] - ank[0]) <= HIP_HEEL_ERROR_THRESHOLD
+            event = self.reps.push(depth, knee_ang, bar_xy[0], aligned)
+            if event is not None:
+                events.append(self._record(event))
+        return events
+
+
+def _numbers(value, shape, name):
+    """
+    value as a float32 array of exactly this shape, ValueError otherwise
+    """
+    try:
+        array = np.asarray(value, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must only contain numbers")
+    if array.shape != shape:
+        raise ValueError(f"{name} must have shape {list(shape)}, got {list(array.shape)}")
+    return array
+
+def parse_keypoints(data):
+    """
+    Checks a client's keypoints message, returns (xy, conf, barbell)
+    ready for StreamingAnalyzer.push() or raises ValueError
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Message must be a json object")
+    if "xy" not in data or "conf" not in data:
+        raise ValueError("Message needs xy and conf")
+    xy = _numbers(data["xy"], (NUM_KEYPOINTS, 2), "xy")
+    conf = _numbers(data["conf"], (NUM_KEYPOINTS,), "conf")
+    barbell = data.get("barbell")
+    if barbell is not None:
+        barbell = tuple(_numbers(barbell, (3,), "barbell"))
+    return xy, conf, barbell
+
+def keypoints_from_frame(jpeg):
+    """
+    Runs both models on one JPEG encoded frame, returns (xy, conf, barbell)
+    """
+    frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Frame could not be decoded")
+
+    #the pose lock is only held for this one inference, so live frames
+    #slot in between the batches of any upload being analysed
+    buffer = KeypointBuffer(1)
+    buffer.write(registry.model("pose")(frame, verbose=False)[0])
+    barbell = detect_frame(registry.model("barbell"), frame)
+
+    xy, conf = buffer.arrays()
+    return xy[0], conf[0], barbell
@@ -0,0 +1,182 @@
+"""
+    Stage timings and counters for the analysis pipeline and api,
+    rendered in Prometheus text format for /metrics.
+    Everything is kept in process, job workers are threads so they
+    share the same counters as the api.
+    Also holds the opt in cProfile hook for profiling a single request
+    or analysis job.
+"""
+
+import cProfile
+import contextvars
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+#seconds, covers quick api calls up to long videos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_registry = []
+_profile_requested = contextvars.ContextVar("profile_requested", default=False)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   #label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket in zip(self.buckets, counts):
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {bucket}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Stopwatch:
+    """
+    Adds up the time spent waiting on an iterator, used to split a
+    stage's busy time from time spent blocked on the stage before it
+    """
+    def __init__(self):
+        self.total = 0.0
+
+    def wrap(self, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.total += time.perf_counter() - start
+                return
+            self.total += time.perf_counter() - start
+            yield item
+
+
+STAGE_SECONDS = Histogram("squat_stage_seconds", "Time spent in each analysis stage per video", ["stage"])
+REQUEST_SECONDS = Histogram("squat_http_request_seconds", "HTTP request latency", ["method", "endpoint", "status"])
+FRAMES_PROCESSED = Counter("squat_frames_processed_total", "Video frames run through the models")
+FRAMES_NO_DETECTION = Counter("squat_frames_no_detection_total", "Frames where a model found nothing", ["model"])
+FEEDBACK_FAILURES = Counter("squat_feedback_failures_total", "OpenAI feedback requests that failed", ["reason"])
+DB_ERRORS = Counter("squat_db_errors_total", "Database writes that failed", ["operation"])
+
+
+def stage(name):
+    """
+    with stage("smooth"): ... records the block's time under that stage
+    """
+    return STAGE_SECONDS.time(stage=name)
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def request_profile(enabled=True):
+    """
+    Marks the current request as profiled, work it starts (like its
+    analysis job) checks profile_requested()
+    """
+    return _profile_requested.set(bool(enabled and PROFILING_ENABLED))
+
+def profile_requested():
+    return _profile_requested.get()
+
+@contextmanager
+def _profile(label):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", label).strip("_")
+    path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{safe}.prof")
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield path
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"Profile written to {path}")
+
+def profiled(label, enabled=True):
+    """
+    cProfile the block if profiling is switched on, the stats are
+    dumped to PROFILE_DIR for snakeviz / pstats. cProfile only sees
+    the thread it was started in.
+    """
+    if not (enabled and PROFILING_ENABLED):
+        return nullcontext()
+    return _profile(label)
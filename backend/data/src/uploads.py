@@ -0,0 +1,330 @@
+"""
+    Getting videos onto disk. Two ways in:
+    - save_upload for the single multipart POST to /analyze-video
+    - resumable uploads: the client creates an upload with the total
+      size, PUTs the bytes in as many parts as it likes (each at the
+      offset the server has so far) and completes it to queue the job.
+      A dropped connection only loses the part in flight, GET the
+      upload for the offset to carry on from.
+    Both stop at MAX_UPLOAD_BYTES and check the container from the
+    first bytes so a renamed or corrupt file is turned away before the
+    rest of it is written. The video is decoded once before it's queued
+    so codecs opencv can't read fail here instead of in a job.
+"""
+
+import hashlib
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from fastapi.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from models import Upload
+from jobs import job_queue, get_job
+from video_io import probe_video
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+UPLOAD_EXPIRE_HOURS = float(os.getenv("UPLOAD_EXPIRE_HOURS", "24"))
+CHUNK_SIZE = 1024 * 1024    #bytes read per chunk when saving uploads, and written per disk write
+PART_SIZE = 8 * 1024 * 1024     #suggested size of each resumable part
+HEAD_BYTES = 12     #enough to tell the containers apart
+
+#extension -> container it should hold, mov and mp4 are both iso base media files
+CONTAINERS = {".mp4": "isobmff", ".mov": "isobmff", ".mkv": "matroska", ".avi": "avi"}
+ALLOWED_EXTENSIONS = set(CONTAINERS)
+#top level boxes an iso media file can start with
+ISOBMFF_BOXES = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot"}
+
+
+class UploadError(Exception):
+    """
+    The upload was refused, status_code is the http status to answer
+    with and offset the bytes received so far when the client needs it
+    """
+    def __init__(self, status_code, message, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+def new_upload_path(ext):
+    """
+    Where an upload is kept until its job finishes
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    return os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{ext}")
+
+def sniff_container(head):
+    if len(head) >= 8 and head[4:8] in ISOBMFF_BOXES:
+        return "isobmff"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "matroska"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "avi"
+    return None
+
+def check_head(head, filename):
+    """
+    Returns the container of a file from its first bytes, raises
+    UploadError if it isn't a video or doesn't match the extension
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    container = sniff_container(bytes(head[:HEAD_BYTES]))
+    if container is None:
+        raise UploadError(415, "File doesn't look like a video")
+    if container != CONTAINERS.get(ext):
+        raise UploadError(415, f"File contents don't match its {ext} extension")
+    return container
+
+def check_filename(filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise UploadError(400, f"Invalid file format. Allowed formats: {', '.join(sorted(ALLOWED_EXTENSIONS))}")
+    return ext
+
+def check_decodes(video_path):
+    """
+    Decodes the first frame, removes the file and raises UploadError if it can't
+    """
+    try:
+        probe_video(video_path)
+    except ValueError as e:
+        os.remove(video_path)
+        raise UploadError(415, f"Video can't be decoded: {e}")
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_upload(src, video_path, filename, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Streams the upload to disk, hashing it on the way through.
+    Returns the sha256 hex digest of the file. Raises UploadError
+    (and removes what was written) if the first bytes aren't the
+    video the extension says or it goes over max_bytes.
+    """
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(video_path, "wb") as out:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if written == 0:
+                    check_head(chunk, filename)
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadError(413, f"Video is larger than {max_bytes // (1024 * 1024)}MB")
+                digest.update(chunk)
+                out.write(chunk)
+        if written == 0:
+            raise UploadError(400, "Uploaded file is empty")
+    except UploadError:
+        os.remove(video_path)
+        raise
+    return digest.hexdigest()
+
+def _received(path):
+    #bytes arrive in order so whatever is on disk is a valid prefix
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def _read_head(path):
+    with open(path, "rb") as f:
+        return f.read(HEAD_BYTES)
+
+
+class UploadStore:
+    def __init__(self, max_bytes=MAX_UPLOAD_BYTES, expire_hours=UPLOAD_EXPIRE_HOURS):
+        self.max_bytes = max_bytes
+        self.expire = timedelta(hours=expire_hours)
+        #uploads with a part being written or being completed, only touched on the event loop
+        self._busy = set()
+
+    @contextmanager
+    def _claim(self, upload_id):
+        if upload_id in self._busy:
+            raise UploadError(409, "Another request is already writing this upload")
+        self._busy.add(upload_id)
+        try:
+            yield
+        finally:
+            self._busy.discard(upload_id)
+
+    def create(self, user_id, filename, size):
+        """
+        Starts a resumable upload, returns its Upload row
+        """
+        ext = check_filename(filename)
+        if size < 1:
+            raise UploadError(400, "size must be at least 1 byte")
+        if size > self.max_bytes:
+            raise UploadError(413, f"Video is larger than {self.max_bytes // (1024 * 1024)}MB")
+        self.remove_expired()
+
+        upload = Upload(id=uuid.uuid4().hex, user_id=user_id, filename=filename, path=new_upload_path(ext), size=size)
+        open(upload.path, "wb").close()
+        db = SessionLocal()
+        try:
+            db.add(upload)
+            db.commit()
+            db.refresh(upload)
+            return upload
+        except Exception:
+            db.rollback()
+            os.remove(upload.path)
+            raise
+        finally:
+            db.close()
+
+    def get(self, upload_id, user_id):
+        db = SessionLocal()
+        try:
+            upload = db.query(Upload).filter(Upload.id == upload_id).first()
+        finally:
+            db.close()
+        if upload is None:
+            raise UploadError(404, f"Upload {upload_id} not found")
+        if upload.user_id != user_id:
+            raise UploadError(403, "Access denied")
+        return upload
+
+    def status(self, upload_id, user_id):
+        upload = self.get(upload_id, user_id)
+        job = get_job(upload.job_id) if upload.job_id else None
+        return {
+            "upload_id": upload.id,
+            "offset": upload.size if upload.job_id else _received(upload.path),
+            "size": upload.size,
+            "part_size": PART_SIZE,
+            "job_id": upload.job_id,
+            "status": job.status if job else "receiving",
+        }
+
+    def _update(self, upload_id, **fields):
+        fields["updated_at"] = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            db.query(Upload).filter(Upload.id == upload_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+    def _discard(self, upload):
+        if os.path.exists(upload.path):
+            os.remove(upload.path)
+        db = SessionLocal()
+        try:
+            db.query(Upload).filter(Upload.id == upload.id).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    async def write(self, upload_id, user_id, offset, chunks):
+        """
+        Appends a part read from the async iterable chunks at offset,
+        returns (new offset, total size). offset has to be what the server already
+        has, anything else is a 409 with the right offset. A part cut off
+        by the client is kept up to the last byte that arrived.
+        """
+        upload = await run_in_threadpool(self.get, upload_id, user_id)
+        if upload.job_id:
+            raise UploadError(409, "Upload is already complete", offset=upload.size)
+
+        with self._claim(upload_id):
+            received = await run_in_threadpool(_received, upload.path)
+            if offset != received:
+                raise UploadError(409, f"Upload is at byte {received}", offset=received)
+
+            container = upload.container
+            head = b"" if container or received == 0 else await run_in_threadpool(_read_head, upload.path)
+            out = await run_in_threadpool(open, upload.path, "ab")
+            buffer = bytearray()
+            rejected = False
+            try:
+                async for chunk in chunks:
+                    if received + len(buffer) + len(chunk) > upload.size:
+                        raise UploadError(413, f"More than the {upload.size} bytes declared for this upload",
+                                          offset=received + len(buffer))
+                    buffer += chunk
+                    if container is None and len(head) + len(buffer) >= min(HEAD_BYTES, upload.size):
+                        try:
+                            container = check_head(head + buffer[:HEAD_BYTES], upload.filename)
+                        except UploadError:
+                            rejected = True
+                            raise
+                    if len(buffer) >= CHUNK_SIZE:
+                        await run_in_threadpool(out.write, buffer)
+                        received += len(buffer)
+                        buffer = bytearray()
+            finally:
+                if buffer and not rejected:
+                    await run_in_threadpool(out.write, buffer)
+                    received += len(buffer)
+                await run_in_threadpool(out.close)
+                if rejected:
+                    await run_in_threadpool(self._discard, upload)
+                else:
+                    await run_in_threadpool(self._update, upload_id, container=container)
+        return received, upload.size
+
+    async def complete(self, upload_id, user_id, fps, profile=False):
+        """
+        Checks every byte arrived and the video decodes then queues
+        it, returns (job id, status). Completing again returns the
+        same job.
+        """
+        upload = await run_in_threadpool(self.get, upload_id, user_id)
+        if upload.job_id:
+            job = await run_in_threadpool(get_job, upload.job_id)
+            return upload.job_id, job.status if job else None
+
+        with self._claim(upload_id):
+            received = await run_in_threadpool(_received, upload.path)
+            if received != upload.size:
+                raise UploadError(409, f"Only {received} of {upload.size} bytes received", offset=received)
+            try:
+                await run_in_threadpool(check_decodes, upload.path)
+            except UploadError:
+                await run_in_threadpool(self._discard, upload)
+                raise
+            video_hash = await run_in_threadpool(file_sha256, upload.path)
+            job_id, status = await run_in_threadpool(job_queue.submit, user_id, upload.path, fps, video_hash, profile)
+            await run_in_threadpool(self._update, upload_id, job_id=job_id)
+        return job_id, status
+
+    def cancel(self, upload_id, user_id):
+        upload = self.get(upload_id, user_id)
+        if upload.job_id:
+            raise UploadError(409, "Upload is already complete")
+        if upload_id in self._busy:
+            raise UploadError(409, "Another request is already writing this upload")
+        self._discard(upload)
+
+    def remove_expired(self):
+        """
+        Drops uploads nobody has written to in UPLOAD_EXPIRE_HOURS, the
+        files of completed ones belong to their job so are left alone
+        """
+        db = SessionLocal()
+        try:
+            expired = db.query(Upload).filter(Upload.updated_at < datetime.utcnow() - self.expire).all()
+            for upload in expired:
+                if upload.job_id is None and os.path.exists(upload.path):
+                    os.remove(upload.path)
+                db.delete(upload)
+            db.commit()
+        finally:
+            db.close()
+        if expired:
+            print(f"Removed {len(expired)} expired uploads")
+
+
+#shared by the whole app
+upload_store = UploadStore()
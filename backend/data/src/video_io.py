@@ -0,0 +1,82 @@
+"""
+    Video decoding helpers shared by the pose and barbell stages
+"""
+
+import cv2
+import math
+
+
+def open_video(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError("Video could not be opened")
+    return cap
+
+def frame_count(path):
+    """
+    Frame count from the container header, this is an estimate
+    and some encoders report it wrong so don't rely on it exactly
+    """
+    cap = open_video(path)
+    try:
+        return max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+    finally:
+        cap.release()
+
+def video_fps(path):
+    """
+    Frame rate from the container, None if it doesn't report one
+    """
+    cap = open_video(path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+    finally:
+        cap.release()
+    if not fps or not math.isfinite(fps) or fps <= 0:
+        return None
+    return fps
+
+def probe_video(path):
+    """
+    Checks the video decodes by reading its first frame, raises
+    ValueError if it doesn't (unsupported codec, truncated file...)
+    """
+    cap = open_video(path)
+    try:
+        ok, frame = cap.read()
+    finally:
+        cap.release()
+    if not ok or frame is None:
+        raise ValueError("Video has no frames that could be decoded")
+
+def sample_step(source_fps, target_fps):
+    """
+    How many source frames each analysed frame stands for,
+    1 keeps every frame
+    """
+    if not source_fps or not target_fps or source_fps <= target_fps:
+        return 1.0
+    return source_fps / target_fps
+
+def read_frames(path, step=1.0):
+    """
+    Decodes the video yielding one BGR frame at a time. With step > 1
+    only every step-th frame (on average, step can be fractional) is
+    decoded, skipped frames are grabbed without being converted.
+    """
+    cap = open_video(path)
+    try:
+        index = 0
+        next_keep = 0.0
+        while True:
+            if index + 1e-6 >= next_keep:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield frame
+                next_keep += step
+            elif not cap.grab():
+                break
+            index += 1
+    finally:
+        cap.release()
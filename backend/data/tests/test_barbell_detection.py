@@ -0,0 +1,76 @@
+"""
+    HostedModel retries and detect_frames ordering against the local
+    fake roboflow server
+"""
+
+import pytest
+
+from barbell_detection import HostedModel, TransientError, detect_frames
+from fake_roboflow import start_server, id_frame
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**kwargs):
+        server = start_server(**kwargs)
+        servers.append(server)
+        host, port = server.server_address
+        return f"http://{host}:{port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def count_posts(monkeypatch):
+    calls = []
+    post = HostedModel._post
+
+    def counted(self, jpeg, confidence):
+        calls.append(jpeg)
+        return post(self, jpeg, confidence)
+
+    monkeypatch.setattr(HostedModel, "_post", counted)
+    return calls
+
+
+def test_detect_frames_keeps_frame_order(serve):
+    #random latency and failures so requests finish out of order
+    url = serve(latency=0.01, fail_rate=0.2, echo=True)
+    model = HostedModel("test", "barbell", 1, api_url=url, max_retries=10, backoff=0.001)
+    frames = [id_frame(i) for i in range(64)]
+
+    results = list(detect_frames(model, frames, in_flight=8))
+
+    assert [round(x) for x, _, _ in results] == list(range(len(frames)))
+    assert [round(y) for _, y, _ in results] == list(range(len(frames)))
+
+def test_predict_retries_until_success(serve, monkeypatch):
+    calls = count_posts(monkeypatch)
+    url = serve(latency=0, fail_first=2, echo=True)
+    model = HostedModel("test", "barbell", 1, api_url=url, max_retries=3, backoff=0.001)
+
+    x, _, c = next(detect_frames(model, [id_frame(7)]))
+
+    assert round(x) == 7 and c > 0
+    assert len(calls) == 3
+
+def test_predict_gives_up_after_max_retries(serve, monkeypatch):
+    calls = count_posts(monkeypatch)
+    url = serve(latency=0, fail_rate=1.0)
+    model = HostedModel("test", "barbell", 1, api_url=url, max_retries=2, backoff=0.001)
+
+    with pytest.raises(TransientError):
+        list(detect_frames(model, [id_frame(0)]))
+    assert len(calls) == 3
+
+def test_connection_errors_are_retried(monkeypatch):
+    calls = count_posts(monkeypatch)
+    #nothing listens on port 9 locally
+    model = HostedModel("test", "barbell", 1, api_url="http://127.0.0.1:9", max_retries=1, backoff=0.001)
+
+    with pytest.raises(TransientError):
+        list(detect_frames(model, [id_frame(0)]))
+    assert len(calls) == 2
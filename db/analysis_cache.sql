@@ -0,0 +1,16 @@
+CREATE TABLE analysis_cache (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    video_hash VARCHAR(64) NOT NULL,
+    fps FLOAT NOT NULL,
+    version VARCHAR(16) NOT NULL,
+    session_id INTEGER REFERENCES sessions(id) ON DELETE CASCADE,
+    result TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    hits INTEGER DEFAULT 0,
+
+    created_at TIMESTAMP DEFAULT now(),
+    last_used_at TIMESTAMP DEFAULT now(),
+    UNIQUE (user_id, video_hash, fps, version)
+);
+CREATE INDEX idx_analysis_cache_last_used_at ON analysis_cache(last_used_at);
@@ -0,0 +1,16 @@
+CREATE TABLE analysis_jobs (
+    id VARCHAR(32) PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    video_path TEXT NOT NULL,
+    fps INTEGER DEFAULT 30,
+    video_hash VARCHAR(64),
+    session_id INTEGER REFERENCES sessions(id) ON DELETE SET NULL,
+    result TEXT,
+    error TEXT,
+
+    created_at TIMESTAMP DEFAULT now(),
+    updated_at TIMESTAMP DEFAULT now()
+);
+CREATE INDEX idx_analysis_jobs_user_id ON analysis_jobs(user_id);
+CREATE INDEX idx_analysis_jobs_status ON analysis_jobs(status);
@@ -0,0 +1,11 @@
+CREATE TABLE feedback_cache (
+    id SERIAL PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL UNIQUE,
+    summary VARCHAR NOT NULL,
+    feedback TEXT NOT NULL,
+    hits INTEGER DEFAULT 0,
+
+    created_at TIMESTAMP DEFAULT now(),
+    last_used_at TIMESTAMP DEFAULT now()
+);
+CREATE INDEX idx_feedback_cache_last_used_at ON feedback_cache(last_used_at);
@@ -0,0 +1,21 @@
+CREATE TABLE progress_rollups (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    period TEXT NOT NULL,
+    period_start DATE NOT NULL,
+
+    sessions INTEGER NOT NULL DEFAULT 0,
+    reps INTEGER NOT NULL DEFAULT 0,
+    below INTEGER NOT NULL DEFAULT 0,
+    parallel INTEGER NOT NULL DEFAULT 0,
+    partial INTEGER NOT NULL DEFAULT 0,
+    knee_angle_sum FLOAT NOT NULL DEFAULT 0,
+    knee_angle_count INTEGER NOT NULL DEFAULT 0,
+    tempo_sum FLOAT NOT NULL DEFAULT 0,
+    tempo_count INTEGER NOT NULL DEFAULT 0,
+    bar_dev_sum FLOAT NOT NULL DEFAULT 0,
+    bar_dev_count INTEGER NOT NULL DEFAULT 0,
+
+    updated_at TIMESTAMP DEFAULT now(),
+    UNIQUE (user_id, period, period_start)
+);
@@ -0,0 +1,8 @@
+CREATE TABLE session_keypoints (
+    session_id INTEGER PRIMARY KEY REFERENCES sessions(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    frames INTEGER NOT NULL,
+    size_bytes INTEGER,
+
+    created_at TIMESTAMP DEFAULT now()
+);
@@ -0,0 +1,13 @@
+CREATE TABLE session_series (
+    session_id INTEGER PRIMARY KEY REFERENCES sessions(id) ON DELETE CASCADE,
+    frames INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    depth BYTEA NOT NULL,
+    knee_angle BYTEA NOT NULL,
+    hip_heel BYTEA NOT NULL,
+    barbell_x BYTEA NOT NULL,
+    barbell_y BYTEA NOT NULL,
+    size_bytes INTEGER,
+
+    created_at TIMESTAMP DEFAULT now()
+);
@@ -2,7 +2,7 @@ CREATE TABLE sessions(
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
     video_path TEXT NOT NULL,
-    fps INTEGER DEFAULT 30,
+    fps FLOAT DEFAULT 30,
     total_reps INTEGER NOT NULL,
 
     avg_depth FLOAT,
@@ -10,9 +10,12 @@ CREATE TABLE sessions(
     tempo FLOAT,
     alignment FLOAT,
     bar_dev FLOAT,
+    ai_feedback TEXT,
 
-    created_at TIMESTAMP DEFAULT now()
+    created_at TIMESTAMP DEFAULT now(),
+    updated_at TIMESTAMP DEFAULT now()
 );
 
 CREATE INDEX idx_sessions_user_id ON sessions(user_id);
-CREATE INDEX idx_sessions_created_at ON sessions(created_at);
\ No newline at end of file
+CREATE INDEX idx_sessions_created_at ON sessions(created_at);
+CREATE INDEX idx_sessions_user_created_id ON sessions(user_id, created_at, id);
\ No newline at end of file
@@ -21,6 +21,12 @@ const resultsSection = document.getElementById('results-section');
 const sessionsList = document.getElementById('sessions-list');
 
 let selectedFile = null;
+const JOB_POLL_MS = 2000;
+const FEEDBACK_WAIT_S = 25;
+const FEEDBACK_MAX_ATTEMPTS = 5;
+const SESSIONS_PAGE_SIZE = 10;
+const UPLOAD_MAX_RETRIES = 5;
+const UPLOAD_RETRY_MS = 1000;
 
 //logout
 document.getElementById('logout-btn').addEventListener('click', function() {
@@ -75,11 +81,6 @@ analyzeBtn.addEventListener('click', async function() {
         showError('FPS must be between 1 and 240');
         return;
     }
-    //prep form data
-    const formData = new FormData();
-    formData.append('file', selectedFile);
-    formData.append('fps', fps);
-
     //loading
     analysisLoading.style.display = 'block';
     analyzeBtn.disabled = true;
@@ -87,21 +88,26 @@ analyzeBtn.addEventListener('click', async function() {
     hideError();
 
     try {
-        const response = await fetch(`${API_URL}/analyze-video?fps=${fps}`, {
-            method: 'POST',
-            headers: {
-                'Authorization': `Bearer ${token}`
-            },
-            body: formData
-        });
-
-        const data = await response.json();
+        const data = await uploadVideo(selectedFile, fps);
+        if (data.error) {
+            showError(data.error);
+            return;
+        }
 
-        if (response.ok) {
-            displayResults(data);
+        //analysis runs in the background, wait for the job to finish
+        const job = await waitForJob(data.job_id);
+        if (job.status === 'done') {
+            displayResults(job.result);
             loadSessions(); // Refresh session history
+            if (job.error) {
+                //analysis finished but the session wasn't saved
+                showError(job.error);
+            }
+            if (!job.result.ai_feedback && job.session_id) {
+                waitForFeedback(job.session_id);
+            }
         } else {
-            showError(data.detail || 'Analysis failed. Please try again.');
+            showError(job.error || job.detail || 'Analysis failed. Please try again.');
         }
 
     } catch (error) {
@@ -113,6 +119,112 @@ analyzeBtn.addEventListener('click', async function() {
     }
 });
 
+//uploads in parts so a dropped connection only resends the part in flight,
+//after a failure the server's offset says where to carry on from
+async function uploadVideo(file, fps) {
+    const headers = {'Authorization': `Bearer ${token}`};
+    let response = await fetch(`${API_URL}/uploads`, {
+        method: 'POST',
+        headers: {...headers, 'Content-Type': 'application/json'},
+        body: JSON.stringify({filename: file.name, size: file.size})
+    });
+    let upload = await response.json();
+    if (!response.ok) {
+        return {error: upload.detail || 'Upload failed. Please try again.'};
+    }
+
+    let offset = 0;
+    let failures = 0;
+    while (offset < file.size) {
+        try {
+            response = await fetch(`${API_URL}/uploads/${upload.upload_id}?offset=${offset}`, {
+                method: 'PUT',
+                headers: {...headers, 'Content-Type': 'application/octet-stream'},
+                body: file.slice(offset, offset + upload.part_size)
+            });
+            const part = await response.json();
+            if (response.ok) {
+                offset = part.offset;
+                failures = 0;
+                continue;
+            }
+            if (response.status !== 409) {
+                //not a video, too big... retrying won't help
+                return {error: part.detail || 'Upload failed. Please try again.'};
+            }
+        } catch (error) {
+            console.error('Upload part failed:', error);
+        }
+        if (++failures > UPLOAD_MAX_RETRIES) {
+            return {error: 'Upload kept failing, check your connection and try again.'};
+        }
+        await new Promise(resolve => setTimeout(resolve, UPLOAD_RETRY_MS * failures));
+        try {
+            //resync with what the server actually has
+            response = await fetch(`${API_URL}/uploads/${upload.upload_id}`, {headers});
+            if (response.ok) {
+                offset = (await response.json()).offset;
+            }
+        } catch (error) {
+            console.error('Upload status failed:', error);
+        }
+    }
+
+    response = await fetch(`${API_URL}/uploads/${upload.upload_id}/complete?fps=${fps}`, {
+        method: 'POST',
+        headers
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        return {error: data.detail || 'Analysis failed. Please try again.'};
+    }
+    return data;
+}
+
+async function waitForJob(jobId) {
+    while (true) {
+        //the per frame series aren't shown, summary keeps the response small
+        const response = await fetch(`${API_URL}/jobs/${jobId}?view=summary`, {
+            headers: {
+                'Authorization': `Bearer ${token}`
+            }
+        });
+        const job = await response.json();
+
+        if (!response.ok || job.status === 'done' || job.status === 'failed') {
+            return job;
+        }
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS));
+    }
+}
+
+//feedback is generated after the analysis, the server holds each request
+//open for up to FEEDBACK_WAIT_S seconds until it's ready
+async function waitForFeedback(sessionId) {
+    const feedbackEl = document.getElementById('ai-feedback');
+    feedbackEl.textContent = 'Generating feedback...';
+    for (let attempt = 0; attempt < FEEDBACK_MAX_ATTEMPTS; attempt++) {
+        try {
+            const response = await fetch(`${API_URL}/sessions/${sessionId}/feedback?wait=${FEEDBACK_WAIT_S}`, {
+                headers: {
+                    'Authorization': `Bearer ${token}`
+                }
+            });
+            if (!response.ok) break;
+            const data = await response.json();
+            if (data.status === 'ready') {
+                feedbackEl.textContent = data.ai_feedback;
+                loadSessions();
+                return;
+            }
+        } catch (error) {
+            console.error('Error:', error);
+            break;
+        }
+    }
+    feedbackEl.textContent = 'No feedback available.';
+}
+
 function displayResults(data) {
     resultsSection.style.display = 'block';
 
@@ -170,10 +282,17 @@ function hideError() {
     errorMessage.style.display = 'none';
 }
 
-//load history
-async function loadSessions() {
+//load history, summary mode skips the per rep data the list doesn't show
+//and X-Next-Cursor is passed back to fetch the next page
+let sessionsCursor = null;
+
+async function loadSessions(more = false) {
     try {
-        const response = await fetch(`${API_URL}/users/${userId}/sessions?limit=10`, {
+        let url = `${API_URL}/users/${userId}/sessions?limit=${SESSIONS_PAGE_SIZE}&summary=true`;
+        if (more && sessionsCursor) {
+            url += `&cursor=${encodeURIComponent(sessionsCursor)}`;
+        }
+        const response = await fetch(url, {
             headers: {
                 'Authorization': `Bearer ${token}`
             }
@@ -187,13 +306,21 @@ async function loadSessions() {
         }
 
         const sessions = await response.json();
+        sessionsCursor = response.headers.get('X-Next-Cursor');
 
-        if (sessions.length === 0) {
+        if (!more) {
+            sessionsList.innerHTML = '';
+        }
+        const oldButton = document.getElementById('load-more-sessions');
+        if (oldButton) {
+            oldButton.remove();
+        }
+
+        if (!more && sessions.length === 0) {
             sessionsList.innerHTML = '<p class="no-sessions">No workout sessions yet. Upload a video to get started!</p>';
             return;
         }
 
-        sessionsList.innerHTML = '';
         sessions.forEach(session => {
             const date = new Date(session.created_at).toLocaleDateString();
             const sessionCard = document.createElement('div');
@@ -214,9 +341,20 @@ async function loadSessions() {
             sessionsList.appendChild(sessionCard);
         });
 
+        if (sessionsCursor) {
+            const loadMore = document.createElement('button');
+            loadMore.id = 'load-more-sessions';
+            loadMore.className = 'btn btn-secondary';
+            loadMore.textContent = 'Load more';
+            loadMore.addEventListener('click', () => loadSessions(true));
+            sessionsList.appendChild(loadMore);
+        }
+
     } catch (error) {
         console.error('Error loading sessions:', error);
-        sessionsList.innerHTML = '<p class="error-text">Failed to load sessions.</p>';
+        if (!more) {
+            sessionsList.innerHTML = '<p class="error-text">Failed to load sessions.</p>';
+        }
     }
 }
 